@@ -2,6 +2,7 @@
 import ctypes
 from ctypes import wintypes
 
+import threading
 import time
 
 N_DISCRETE_ACTIONS = 4
@@ -13,6 +14,15 @@ ACTION_RIGHT = 3
 
 PRESS_KEEP_TIME = 0.075  # 0.1  #
 
+# 扩展动作空间（macro actions）：停止 + 8 个方向 x 按住时长，按键在后台线程中释放，step 等待按住时长结束后再获取画面
+MACRO_DIRECTIONS = [
+    ('w',), ('s',), ('a',), ('d',),             # 上、下、左、右，顺序与 ACTION_* 一致
+    ('w', 'a'), ('w', 'd'), ('s', 'a'), ('s', 'd'),     # 左上、右上、左下、右下
+]
+MACRO_HOLD_TIMES = [0.075, 0.15, 0.3]   # 最短时长与 PRESS_KEEP_TIME 相同
+MACRO_IDLE = 0
+N_MACRO_ACTIONS = 1 + len(MACRO_DIRECTIONS) * len(MACRO_HOLD_TIMES)
+
 
 # ref pydirectinput
 SendInput = ctypes.windll.user32.SendInput
@@ -32,8 +42,17 @@ KEYBOARD_MAPPING = {
 
     'esc': 0x01,
     'enter': 0x1C,
+    'space': 0x39,
+
+    'up': 0x48,
+    'down': 0x50,
+    'left': 0x4B,
+    'right': 0x4D,
 }
 
+# 方向键需要扩展键标志
+EXTENDED_KEYS = {'up', 'down', 'left', 'right'}
+
 # C struct redefinitions
 
 PUL = ctypes.POINTER(ctypes.c_ulong)
@@ -75,6 +94,8 @@ def key_down(key):
     # pydirectinput.keyDown(key)
 
     keybdFlags = KEYEVENTF_SCANCODE
+    if key in EXTENDED_KEYS:
+        keybdFlags |= KEYEVENTF_EXTENDEDKEY
 
     hexKeyCode = KEYBOARD_MAPPING[key]
     extra = ctypes.c_ulong(0)
@@ -87,6 +108,8 @@ def key_up(key):
     # pydirectinput.keyUp(key)
 
     keybdFlags = KEYEVENTF_SCANCODE | KEYEVENTF_KEYUP
+    if key in EXTENDED_KEYS:
+        keybdFlags |= KEYEVENTF_EXTENDEDKEY
 
     hexKeyCode = KEYBOARD_MAPPING[key]
     extra = ctypes.c_ulong(0)
@@ -105,6 +128,82 @@ def press_key(key, keep_time=PRESS_KEEP_TIME):
     time.sleep(keep_time)
     key_up(key)
 
+# 菜单操作，依次按下多个按键，interval 为按键之间的间隔
+def press_keys(keys, interval=0.1):
+    for key in keys:
+        press_key(key)
+        time.sleep(interval)
+
+# macro action 编号：0 为停止（持续最短时长），其余按方向优先排列，返回 (keys, hold_time)
+def macro_action(action):
+    if action == MACRO_IDLE:
+        return (), MACRO_HOLD_TIMES[0]
+    direction, hold_index = divmod(int(action) - 1, len(MACRO_HOLD_TIMES))
+    return MACRO_DIRECTIONS[direction], MACRO_HOLD_TIMES[hold_index]
+
+class KeyHolder:
+    """Holds a set of keys down and releases them on a background thread.
+
+    ``hold()`` returns immediately and ``wait()`` blocks until the hold time
+    has passed. A new hold replaces the previous one: keys still wanted stay
+    pressed and their release time is extended, the others are released at
+    once.
+    """
+
+    def __init__(self):
+        self.pressed = set()
+        self.release_time = 0.0
+        self.running = True
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def hold(self, keys, hold_time):
+        with self.condition:
+            keys = set(keys)
+            for key in self.pressed - keys:
+                key_up(key)
+            for key in keys - self.pressed:
+                key_down(key)
+            self.pressed = keys
+            self.release_time = time.time() + hold_time
+            self.condition.notify_all()
+
+    # 阻塞到当前动作的按住时长结束（release_all、close 时立即返回）
+    def wait(self):
+        with self.condition:
+            while self.running:
+                timeout = self.release_time - time.time()
+                if timeout <= 0:
+                    break
+                self.condition.wait(timeout)
+
+    def release_all(self):
+        self.hold((), 0.0)
+
+    def close(self):
+        self.release_all()
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join()
+
+    def __run(self):
+        with self.condition:
+            while self.running:
+                if not self.pressed:
+                    self.condition.wait()
+                    continue
+
+                timeout = self.release_time - time.time()
+                if timeout > 0:
+                    self.condition.wait(timeout)
+                    continue
+
+                for key in self.pressed:
+                    key_up(key)
+                self.pressed = set()
+
 def move_up():
     press_key('w')
 
@@ -4,11 +4,19 @@ import numpy as np
 import brotato
 import brotato_action
 from capture import Capture
+from step_scheduler import StepScheduler
+from scene_watcher import SceneWatcher
+from object_features import ObjectFeatureExtractor, N_FEATURES
+from obs_profiles import ObservationPreprocessor, DEFAULT_PROFILE
+from state_source import OcrStateSource
+from ocr_telemetry import OcrTelemetry, ROI_HP, ROI_MATERIAL, ROI_WAVE, ROI_TIMER, ROI_WAVE_RESULT, ROI_SCENE
+import hud_layout
+from hud_layout import HudLayout
 import cv2
 
-from ultralytics import YOLO
-from ocr import OCR
+from perception import LocalPerception
 
+from concurrent.futures import ThreadPoolExecutor
 import re
 import math
 
@@ -16,17 +24,13 @@ from datetime import datetime
 import time
 import os
 
-GAME_WIDTH = brotato.WIDTH
-GAME_HEIGHT = brotato.HEIGHT
-GAME_MAP_LEFT = brotato.MAP_AREA_XYWH[0]
-GAME_MAP_TOP = brotato.MAP_AREA_XYWH[1]
-GAME_MAP_RIGHT = brotato.MAP_AREA_XYWH[0] + brotato.MAP_AREA_XYWH[2]
-GAME_MAP_BOTTOM = brotato.MAP_AREA_XYWH[1] + brotato.MAP_AREA_XYWH[3]
-
-OBSERVATION_SCALE = (1 / 4)
-OBSERVATION_WIDTH = int(brotato.MAP_AREA_XYWH[2] * OBSERVATION_SCALE)
-OBSERVATION_HEIGHT = int(brotato.MAP_AREA_XYWH[3] * OBSERVATION_SCALE)
-OBSERVATION_CHANNELS = brotato.N_CHANNELS   # 1
+# 观测模式：地图图像、物体特征向量，或特征向量加缩小的地图图像（Dict）
+OBS_MODE_IMAGE = "image"
+OBS_MODE_FEATURES = "features"
+OBS_MODE_FEATURES_IMAGE = "features+image"
+FEATURES_IMAGE_SCALE = (1 / 8)
+FEATURES_IMAGE_WIDTH = int(brotato.MAP_AREA_XYWH[2] * FEATURES_IMAGE_SCALE)
+FEATURES_IMAGE_HEIGHT = int(brotato.MAP_AREA_XYWH[3] * FEATURES_IMAGE_SCALE)
 
 LAST_WAVE = 20
 WAVE_TIMER_DEFAULT = 20
@@ -37,7 +41,11 @@ TIMER_CHANGE_RANGE = 3
 
 CONF_THRESHOLD = 0.2   # OCR 部分数字识别确信度较低
 
-YOLO_MODEL_PATH = "models/brotato-cls.onnx"
+MAX_FRAME_AGE = 1.0    # 捕获进程的帧超过该时间未更新时认为窗口不可用
+
+SPECULATIVE_OCR_WORKERS = 1    # 推测执行 HUD OCR 的线程数，HP、倒计时、材料区域合并为一次批量识别
+
+HP_BAR_TOLERANCE = 1    # 血条填充长度与上一次 HP 相差不超过该像素数时认为 HP 未变化（抗锯齿、边缘误差）
 
 # # for debug
 # OBS_DIR = "obs"
@@ -48,22 +56,75 @@ def normalize(value, max, min=0):
 class BrotatoEnv(gym.Env):
     """Custom Environment that follows gym interface."""
 
-    def __init__(self):
+    def __init__(self, tick_rate=None, perception=None, frame_ring=None, scene_watcher=False, navigator=None, native_hud=False,
+                 obs_mode=OBS_MODE_IMAGE, obs_profile=DEFAULT_PROFILE, speculative_ocr=False, state_source=None,
+                 macro_actions=False, thread_budget=None, episode_store=None, hp_bar=False, region_capture=False):
         super().__init__()
+        # observation init, obs_profile 为 obs_profiles.PROFILES 中的名称，决定地图图像观测的颜色模式和缩放比例
+        self.preprocessor = ObservationPreprocessor(obs_profile)
+
         # Define action and observation space
         # They must be gym.spaces objects
-        self.action_space = gym.spaces.Discrete(brotato_action.N_DISCRETE_ACTIONS)
-        self.observation_space = gym.spaces.Box(low=0,
-                                                high=255,
-                                                shape=(OBSERVATION_HEIGHT, OBSERVATION_WIDTH, OBSERVATION_CHANNELS),
-                                                dtype=np.uint8)
-
-        # capture init
+        # macro_actions=True 时使用 8 个方向加停止、多种按住时长的扩展动作空间，step 在按住时长结束后获取画面并决策
+        self.macro_actions = macro_actions
+        self.key_holder = brotato_action.KeyHolder() if macro_actions else None
+        n_actions = brotato_action.N_MACRO_ACTIONS if macro_actions else brotato_action.N_DISCRETE_ACTIONS
+        self.action_space = gym.spaces.Discrete(n_actions)
+        self.observation_space = self.__make_observation_space(obs_mode)
+
+        # object features init, obs_mode 不为 image 时从地图区域中检测玩家、敌人、投射物和材料
+        self.obs_mode = obs_mode
+        self.feature_extractor = ObjectFeatureExtractor() if obs_mode != OBS_MODE_IMAGE else None
+
+        # capture init, frame_ring 为 FrameRing 时从捕获进程读取最新帧
         self.cap = Capture()
+        self.frame_ring = frame_ring
+        self.frame_age = 0.0
+        self.ring_observation = None    # 最近一次零拷贝读取的共享内存视图及其序号
+        self.ring_seq = -1
+
+        # HUD layout init, native_hud=True 时不缩放捕获画面，按分辨率校准的布局直接从原生画面中截取 ROI
+        self.native_hud = native_hud and frame_ring is None
+        self.layout = HudLayout.default()
+
+        # region capture init, region_capture=True 时用 Capture.capture_regions 在抓取时缩放到参考分辨率（需要缩放画面，native_hud 时不使用）
+        self.region_capture = region_capture and not self.native_hud and frame_ring is None
+
+        # models init, perception 为 PerceptionClient 时使用共享的感知服务进程
+        # thread_budget 为 runtime_config.ThreadBudget 时按预算设置本进程内分类和 OCR 模型的线程数
+        self.perception = perception or LocalPerception(budget=thread_budget)
+
+        # HP bar init, hp_bar=True 时由血条填充比例和已知的 total_hp 计算 HP，只在填充变化与 total_hp 不一致时 OCR
+        self.hp_bar = hp_bar
+
+        # state source init, 为 SocketStateSource 时从游戏 mod 接收 HP、材料、波次、倒计时等数值，通道不可用时回退到 OCR
+        self.state_source = state_source or OcrStateSource()
+        self.game_state = None
+
+        # OCR telemetry init, 统计各 HUD 区域的识别次数、确信度分布和修正次数
+        self.ocr_telemetry = OcrTelemetry()
+
+        # speculative OCR init, 场景分类的同时在线程池中识别 HUD 区域，不是波次场景时丢弃结果
+        # 共享感知服务的客户端一次只处理一个请求，只在本进程内推理时启用
+        self.ocr_pool = None
+        self.prefetched_ocr = {}
+        if speculative_ocr and isinstance(self.perception, LocalPerception):
+            self.ocr_pool = ThreadPoolExecutor(max_workers=SPECULATIVE_OCR_WORKERS)
+
+        # scene watcher init, 后台线程监测画面变化，用于 reset 和暂停时等待场景切换
+        self.watcher = None
+        if scene_watcher:
+            self.watcher = SceneWatcher(self.__watcher_grab(), self.__identify_scene, window_name=self.cap.get_window_name())
+            self.watcher.start()
+
+        # menu navigator init, 为 MenuNavigator 时 reset 自动处理商店/升级/新的一局等界面
+        self.navigator = navigator
 
-        # models init
-        self.model_cls = YOLO(YOLO_MODEL_PATH)
-        self.ocr = OCR()
+        # episode store init, 为 EpisodeStore 时每个回合结束后记录波次、结果、奖励分量等
+        self.episode_store = episode_store
+
+        # step scheduler init, tick_rate=None 时不限制决策频率
+        self.scheduler = StepScheduler(tick_rate) if tick_rate else None
 
         # data init
         self.global_step_count = 0
@@ -99,6 +160,7 @@ class BrotatoEnv(gym.Env):
         self.reward_sum = 0.0
 
         self.end_text = ""
+        self.wave_result = brotato.WaveResult.UNKNOWN
 
     def step(self, action):
         reward = 0.0
@@ -117,43 +179,85 @@ class BrotatoEnv(gym.Env):
 
         action_time = time.time()
 
-        # get observation
-        observation = self.__get_observation()
-
-        obs_time = time.time()
+        # tick 预算只用于获取画面与识别，按住时长属于动作本身
+        if self.scheduler:
+            self.scheduler.begin()
 
-        # identify scene
-        scene = self.__identify_scene(observation)
-        while scene == brotato.Scene.PAUSE_MENU:
-            print("pause menu")
-            time.sleep(3)
+        # 共享内存中的帧零拷贝读取，HUD 识别完成后确认未被捕获进程覆盖，被覆盖时重新读取并识别
+        while True:
+            # get observation
             observation = self.__get_observation()
-            scene = self.__identify_scene(observation)
 
-        scene_time = time.time()
+            obs_time = time.time()
 
-        if scene == brotato.Scene.WAVE or scene == brotato.Scene.WAVE_END:
-            hp, total_hp = self.__get_hp(observation)
-            countdown = self.__get_timer(observation)
+            # 通道可用时本步的 HUD 数值直接取自游戏状态，不进行 OCR
+            self.game_state = self.state_source.read()
+
+            # speculative OCR, 大部分 step 都是波次场景，HUD 识别与场景分类并行
+            ocr_future = None
+            if self.ocr_pool and self.game_state is None:
+                ocr_future = self.__start_speculative_ocr(observation)
+
+            # identify scene
+            scene = self.__identify_scene(observation)
+            if ocr_future:
+                self.__finish_speculative_ocr(ocr_future, scene)
+            while scene == brotato.Scene.PAUSE_MENU:
+                print("pause menu")
+                if self.watcher:
+                    scene, observation = self.watcher.wait_for(lambda current: current != brotato.Scene.PAUSE_MENU)
+                    if self.native_hud:
+                        # 监测线程的画面已缩放，HUD 和地图区域使用原生分辨率的画面
+                        observation = self.__get_observation()
+                else:
+                    time.sleep(3)
+                    observation = self.__get_observation()
+                    scene = self.__identify_scene(observation)
+                if self.scheduler and scene != brotato.Scene.PAUSE_MENU:
+                    self.scheduler.reset()
+                    self.scheduler.begin()
+                self.prefetched_ocr.clear()     # 推测识别的结果属于暂停前的画面
+
+            scene_time = time.time()
+
+            if scene == brotato.Scene.WAVE or scene == brotato.Scene.WAVE_END:
+                hp, total_hp = self.__get_hp(observation)
+                # 波次结束时需要倒计时判断是否误判场景，不能跳过
+                countdown = self.__run_stage("timer", lambda: self.__get_timer(observation), self.prev_countdown,
+                                             required=scene == brotato.Scene.WAVE_END)
+
+                # 场景误判处理，倒计时 0 有时会识别失败，因此判断大于 1
+                if scene == brotato.Scene.WAVE_END and hp > 0 and countdown > 1:
+                    print("set to wave")
+                    self.ocr_telemetry.record_correction(ROI_SCENE, "set_to_wave")
+                    scene = brotato.Scene.WAVE
+                # elif scene == brotato.Scene.WAVE and countdown <= 0:
+                #     print(f"countdown: {countdown}, wait wave end")
+                #     return self.__resize_observation(observation), reward, terminated, truncated, info
+
+                if scene == brotato.Scene.WAVE:
+                    material = self.__run_stage("material", lambda: self.__get_material(observation), self.prev_material)
+                elif scene == brotato.Scene.WAVE_END:
+                    wave_result = self.__get_wave_result(observation)
+
+            stable_observation = self.__stable_observation(observation)
+            if stable_observation is not None:
+                observation = stable_observation
+                break
+            print("frame overwritten, read again")
+            self.prefetched_ocr.clear()
 
+        if scene == brotato.Scene.WAVE or scene == brotato.Scene.WAVE_END:
             info = {
+                "frame_age": self.frame_age,
+                "state": "ocr" if self.game_state is None else "ipc",
                 "timer": countdown,
                 "hp": hp,
                 "total_hp": total_hp,
                 # "material": material,
             }
 
-            # 场景误判处理，倒计时 0 有时会识别失败，因此判断大于 1
-            if scene == brotato.Scene.WAVE_END and hp > 0 and countdown > 1:
-                print("set to wave")
-                scene = brotato.Scene.WAVE
-            # elif scene == brotato.Scene.WAVE and countdown <= 0:
-            #     print(f"countdown: {countdown}, wait wave end")
-            #     return self.__resize_observation(observation), reward, terminated, truncated, info
-
             if scene == brotato.Scene.WAVE:
-                material = self.__get_material(observation)
-
                 # calc reward
                 reward = self.__calc_reward(hp, material)
 
@@ -166,9 +270,9 @@ class BrotatoEnv(gym.Env):
 
                 info["material"] = material
             elif scene == brotato.Scene.WAVE_END:
-                wave_result = self.__get_wave_result(observation)
                 if wave_result != brotato.WaveResult.UNKNOWN:
                     terminated = True
+                    self.wave_result = wave_result
                     reward = self.__calc_reward(hp, self.prev_material, wave_result)
 
                 self.prev_countdown = countdown
@@ -189,6 +293,7 @@ class BrotatoEnv(gym.Env):
 
         self.prev_observation = observation
         self.prev_scene = scene
+        self.prefetched_ocr.clear()     # 未使用的推测结果（如调度跳过的阶段）只对当前帧有效
 
         end_time = time.time()
 
@@ -201,6 +306,20 @@ class BrotatoEnv(gym.Env):
         self.step_elapsed_sum += time_elapsed
         self.step_average_elapsed = self.step_elapsed_sum / self.step_count
 
+        if self.scheduler:
+            self.scheduler.end()
+            info.update(self.scheduler.info())
+
+        if terminated:
+            info["ocr"] = self.ocr_telemetry.summary(episode=True)
+            if self.episode_store:
+                self.__record_episode(end_time)
+            if self.key_holder:
+                self.key_holder.release_all()
+
+        # 有效决策频率：本回合每秒游戏时间的决策次数
+        info["decision_rate"] = self.step_count / max(end_time - self.reset_time, 1e-6)
+
         # local_time = time.localtime(end_time)
         # ms = int((end_time - int(end_time)) * 1000)
         # time_info = f"{local_time.tm_hour:02d}:{local_time.tm_min:02d}:{local_time.tm_sec:02d}.{ms}"
@@ -210,36 +329,57 @@ class BrotatoEnv(gym.Env):
         debug_info += f", action: {action_elapsed:.4f}, obs: {obs_elapsed:.4f}, sce: {scene_elapsed:.4f}, hdl: {handle_elapsed:.4f}"
         print(f"{time_info}-{self.global_step_count:06d}: {step_info}")
         # print(f"                {debug_info}")
-        return self.__resize_observation(observation), reward, terminated, truncated, info
+        return self.__make_observation(observation), reward, terminated, truncated, info
 
     def reset(self, seed=None, options=None):
         print("wait for reset ...")
 
-        observation = self.__get_observation()
-        scene = self.__identify_scene(observation)
-        while scene != brotato.Scene.WAVE:
-            if scene == brotato.Scene.CONFIRM_MENU or scene == brotato.Scene.WAVE_END:
-                brotato_action.press_key('enter')   # retry failed waves
-            time.sleep(0.5)
+        if self.watcher:
+            scene, observation = self.watcher.wait_for_scene(brotato.Scene.WAVE, on_scene=self.__handle_reset_scene)
+        else:
             observation = self.__get_observation()
             scene = self.__identify_scene(observation)
+            while scene != brotato.Scene.WAVE:
+                self.__handle_reset_scene(scene)
+                time.sleep(0.5)
+                observation = self.__get_observation()
+                scene = self.__identify_scene(observation)
 
         self.__reset_data()
+        self.ocr_telemetry.reset_episode()
+        if self.scheduler:
+            self.scheduler.reset()
+        self.preprocessor.reset()
+        if self.feature_extractor:
+            self.feature_extractor.reset()
+        if self.native_hud:
+            # 监测线程的画面已缩放，校准使用原生分辨率的画面
+            observation = self.__get_observation()
+            self.layout = hud_layout.get_layout(observation)
+        self.game_state = self.state_source.read()
+
+        # 与 step 相同，HUD 识别完成后确认零拷贝读取的帧未被覆盖
+        while True:
+            self.current_wave = self.__get_wave(observation)
+            # if self.current_wave >= 10:
+            #     self.material_reward_coefficient = 1.0
+            # else:
+            #     self.material_reward_coefficient = (10 - self.current_wave) + 1
+
+            self.current_wave_timer = self.__get_timer(observation, WAVE_TIMER_DEFAULT)
+            self.prev_countdown = self.current_wave_timer
+
+            self.prev_hp, self.prev_total_hp = self.__get_hp(observation, True)
+            self.init_material = self.__get_material(observation, True)
+
+            stable_observation = self.__stable_observation(observation)
+            if stable_observation is not None:
+                break
+            print("frame overwritten, read again")
+            observation = self.__get_observation()
 
-        self.current_wave = self.__get_wave(observation)
-        # if self.current_wave >= 10:
-        #     self.material_reward_coefficient = 1.0
-        # else:
-        #     self.material_reward_coefficient = (10 - self.current_wave) + 1
-
-        self.current_wave_timer = self.__get_timer(observation, WAVE_TIMER_DEFAULT)
-        self.prev_countdown = self.current_wave_timer
-
-        self.prev_observation = observation
+        self.prev_observation = stable_observation
         self.prev_scene = scene
-
-        self.prev_hp, self.prev_total_hp = self.__get_hp(observation, True)
-        self.init_material = self.__get_material(observation, True)
         self.prev_material = self.init_material
 
         info = {
@@ -251,6 +391,8 @@ class BrotatoEnv(gym.Env):
             "material": self.prev_material,
             # "material_reward_coefficient": self.material_reward_coefficient,
         }
+        if self.navigator:
+            info["menu_time"] = self.navigator.finish()
 
         self.reset_count += 1
         self.reset_time = time.time()
@@ -261,37 +403,97 @@ class BrotatoEnv(gym.Env):
         # time_info = f"{local_time.tm_hour:02d}:{local_time.tm_min:02d}:{local_time.tm_sec:02d}.{ms}"
         time_info = f"{datetime.now().strftime('%H:%M:%S.%f')[:-3]}"
         print(f"{time_info}: reset count: {self.reset_count}, info: {info}")
-        return self.__resize_observation(observation), info
+        return self.__make_observation(observation), info
+
+    # 启动时预热分类和 OCR 模型，避免首次推理的开销计入第一次 reset
+    def warmup(self):
+        self.perception.warmup()
 
     def render(self):
         obs = self.prev_observation
         if obs is not None:
             self.cap.show(obs)
 
-    # def close(self):
-    #     pass
+    def close(self):
+        self.state_source.close()
+        if self.episode_store:
+            self.episode_store.close()
+        if self.key_holder:
+            self.key_holder.close()
+            self.key_holder = None
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+        if self.ocr_pool:
+            self.ocr_pool.shutdown()
+            self.ocr_pool = None
 
     def pause(self):
-        observation = self.__get_observation()
-        scene = self.__identify_scene(observation)
+        if self.key_holder:
+            self.key_holder.release_all()
+        scene = self.__current_scene()
         if scene != brotato.Scene.PAUSE_MENU:
             brotato_action.pause()
 
     def resume(self):
-        observation = self.__get_observation()
-        scene = self.__identify_scene(observation)
+        scene = self.__current_scene()
         if scene == brotato.Scene.PAUSE_MENU:
             brotato_action.resume()
 
+    def __current_scene(self):
+        if self.watcher:
+            scene, _ = self.watcher.current_scene()
+            return scene
+
+        observation = self.__get_observation()
+        return self.__identify_scene(observation)
+
+    def __handle_reset_scene(self, scene):
+        if self.navigator:
+            self.navigator.handle(scene)
+        elif scene == brotato.Scene.CONFIRM_MENU or scene == brotato.Scene.WAVE_END:
+            brotato_action.press_key('enter')   # retry failed waves
+
+    def __make_observation_space(self, obs_mode):
+        image_space = gym.spaces.Box(low=0,
+                                     high=255,
+                                     shape=self.preprocessor.profile.shape(),
+                                     dtype=np.uint8)
+        if obs_mode == OBS_MODE_IMAGE:
+            return image_space
+
+        features_space = gym.spaces.Box(low=-1.0, high=1.0, shape=(N_FEATURES,), dtype=np.float32)
+        if obs_mode == OBS_MODE_FEATURES:
+            return features_space
+        if obs_mode == OBS_MODE_FEATURES_IMAGE:
+            small_image_space = gym.spaces.Box(low=0,
+                                               high=255,
+                                               shape=(FEATURES_IMAGE_HEIGHT, FEATURES_IMAGE_WIDTH, brotato.N_CHANNELS),
+                                               dtype=np.uint8)
+            return gym.spaces.Dict({"features": features_space, "image": small_image_space})
+        raise ValueError(f"unknown obs mode: {obs_mode}")
+
+    def __make_observation(self, observation):
+        if self.obs_mode == OBS_MODE_IMAGE:
+            return self.__resize_observation(observation)
+
+        x, y, w, h = self.layout.map_area
+        map_image = observation[y:y + h, x:x + w]
+        features = self.feature_extractor.extract(map_image).copy()
+        if self.obs_mode == OBS_MODE_FEATURES:
+            return features
+        return {"features": features, "image": cv2.resize(map_image, (FEATURES_IMAGE_WIDTH, FEATURES_IMAGE_HEIGHT))}
+
     def __resize_observation(self, observation):
-        image = cv2.resize(observation, (GAME_WIDTH, GAME_HEIGHT))
         # # for debug
-        # cv2.imshow("image", image)
+        # cv2.imshow("image", observation)
         # cv2.waitKey(1)
         # image_path = os.path.join(OBS_DIR, f'{self.global_step_count:06d}_image.jpg')
-        # cv2.imwrite(image_path, image)
+        # cv2.imwrite(image_path, observation)
 
-        image = image[GAME_MAP_TOP:GAME_MAP_BOTTOM, GAME_MAP_LEFT:GAME_MAP_RIGHT]
+        # 直接从捕获画面中截取地图区域，不先缩放整个画面
+        x, y, w, h = self.layout.map_area
+        image = observation[y:y + h, x:x + w]
 
         # x, y, w, h = 0, 0, 50, 50
         # region = image[y:y+h, x:x+w]
@@ -301,27 +503,41 @@ class BrotatoEnv(gym.Env):
         # # 将模糊后的区域放回原图
         # image[y:y+h, x:x+w] = blurred_region
 
-        image = cv2.resize(image, (OBSERVATION_WIDTH, OBSERVATION_HEIGHT))
+        # 缩放及灰度、边缘、差分等处理见 obs_profiles.py
+        image = self.preprocessor.process(image)
 
         # for debug
         # cv2.imshow("obs", image)
         # cv2.waitKey(1)
         # image_path = os.path.join(OBS_DIR, f'{self.global_step_count:06d}_obs.jpg')
         # cv2.imwrite(image_path, image)
-
-        # # gray_image = cv2.resize(observation, (int(brotato.WIDTH * 0.5), int(brotato.HEIGHT * 0.5)))
-        # gray_image = image
-        # gray_image = cv2.cvtColor(gray_image, cv2.COLOR_BGR2GRAY)
-        # gray_image_path = os.path.join(OBS_DIR, f'gray_{self.global_step_count:06d}.jpg')
-        # cv2.imwrite(gray_image_path, gray_image)
-
-        # gray_image_3d = np.expand_dims(gray_image, axis=-1)
-
-        # return gray_image_3d
         return image
 
+    def __record_episode(self, end_time):
+        self.episode_store.append({
+            "time": end_time,
+            "wave": self.current_wave,
+            "wave_result": self.wave_result.value,
+            "steps": self.step_count,
+            "duration": end_time - self.reset_time,
+            "reward": self.reward_sum,
+            "time_reward": self.time_reward_sum,
+            "hp_reward": self.hp_reward_sum,
+            "hp_step_reward": self.hp_step_reward_sum,
+            "material_reward": self.material_reward_sum,
+            "total_material": self.prev_material - self.init_material,
+            "hp": self.prev_hp,
+            "total_hp": self.prev_total_hp,
+        })
+
     # Action
     def __do_action(self, action):
+        if self.key_holder:
+            # 等待按住时长结束再获取画面，否则下一个决策在约一个 step 的延迟后就替换当前动作，不同按住时长没有区别
+            self.key_holder.hold(*brotato_action.macro_action(action))
+            self.key_holder.wait()
+            return
+
         if action == brotato_action.ACTION_UP:
             brotato_action.move_up()
         elif action == brotato_action.ACTION_DOWN:
@@ -331,15 +547,76 @@ class BrotatoEnv(gym.Env):
         elif action == brotato_action.ACTION_RIGHT:
             brotato_action.move_right()
 
+    # Scheduler
+    # 超出 tick 预算时跳过可选阶段，沿用上一次的值
+    def __run_stage(self, stage, func, default, required=False):
+        if self.scheduler is None:
+            return func()
+
+        if not self.scheduler.should_run(stage, required):
+            return default
+
+        stage_start = time.time()
+        value = func()
+        self.scheduler.record(stage, time.time() - stage_start)
+        return value
+
     # Capture Window
     def __get_observation(self):
-        observation = self.cap.capture()
+        if self.frame_ring is not None:
+            return self.__get_ring_observation()
+
+        observation = self.__capture()
         while observation is None:
             print(f"no window: '{self.cap.get_window_name()}'")
             time.sleep(1)
-            observation = self.cap.capture()
+            observation = self.__capture()
+
+        # 窗口尺寸变化时更新布局（校准需要波次画面，reset 时进行）
+        if observation.shape[:2] != (self.layout.height, self.layout.width):
+            self.layout = HudLayout.scaled(observation.shape[1], observation.shape[0])
         return observation
 
+    def __capture(self):
+        if not self.region_capture:
+            return self.cap.capture(resize=not self.native_hud)
+
+        regions = self.cap.capture_regions()
+        if regions is None:
+            return None
+        # 缓冲在下一次抓取时被覆盖，画面会保存为 prev_observation，需要复制
+        return regions["frame"].copy()
+
+    # 共享内存视图复制后确认在使用期间未被捕获进程覆盖（约 RING_SLOTS / CAPTURE_FPS 秒后覆盖），
+    # 返回可以保存为 prev_observation 的画面，被覆盖时返回 None；其他来源的画面原样返回
+    def __stable_observation(self, observation):
+        if observation is not self.ring_observation:
+            return observation
+        stable_observation = observation.copy()
+        if not self.frame_ring.is_valid(self.ring_seq):
+            return None
+        return stable_observation
+
+    # 监测线程使用独立的捕获来源，不与 step 共用 Capture
+    def __watcher_grab(self):
+        if self.frame_ring is not None:
+            return lambda: self.frame_ring.read_latest(copy=True)[0]
+        return Capture().capture
+
+    # 返回共享内存视图，使用完后由 __stable_observation 确认未被覆盖
+    def __get_ring_observation(self):
+        while True:
+            observation, seq, timestamp = self.frame_ring.read_latest()
+            if observation is not None:
+                self.frame_age = time.time() - timestamp
+                if self.frame_age <= MAX_FRAME_AGE:
+                    self.ring_observation = observation
+                    self.ring_seq = seq
+                    return observation
+
+            print(f"no frame: '{self.cap.get_window_name()}'")
+            time.sleep(1)
+
     # Reward
     def __calc_reward(self, hp, material, wave_result: brotato.WaveResult = None):
         TIME_REWARD_COEFFICIENT = 0.1
@@ -430,12 +707,72 @@ class BrotatoEnv(gym.Env):
         return reward
 
     # OCR
-    def __recognize_text(self, roi) -> tuple[str, float]:
+    # 按当前状态选择识别区域，同步识别和推测执行使用相同的区域
+    def __hp_xyxy(self, reset=False):
+        # TODO: optimize
+        if (not reset) and self.prev_total_hp > 0 and self.prev_total_hp < 100:
+            return self.layout.hp[1]
+        return self.layout.hp[0]
+
+    def __timer_xyxy(self, timer):
+        if timer < 10:
+            return self.layout.timer[1]
+        return self.layout.timer[0]
+
+    def __material_box_index(self, reset=False):
+        if reset:
+            return 3
+        # TODO: optimize
+        if self.prev_material >= 1000:
+            return 3    # '9999'
+        elif self.prev_material >= 100:
+            return 2    # '999'
+        elif self.prev_material >= 10:
+            return 1    # '99'
+        return 0        # '9'
+
+    def __start_speculative_ocr(self, observation):
+        regions = [self.__timer_xyxy(self.prev_countdown)]
+        if not self.hp_bar:
+            regions.insert(0, self.__hp_xyxy())
+        box_index = self.__material_box_index()
+        if box_index < len(self.layout.material):
+            regions.append(self.layout.material[box_index])
+
+        rois = [observation[y:y1, x:x1] for x, y, x1, y1 in regions]
+        return self.ocr_pool.submit(lambda: list(zip(regions, self.perception.recognize_batch(rois))))
+
+    # 等待推测识别完成（避免与后续识别并发使用 OCR 引擎），只保留波次场景的结果
+    def __finish_speculative_ocr(self, future, scene):
+        try:
+            results = future.result()
+        except Exception as e:
+            print(f"speculative ocr error: {e}")
+            return
+
+        if scene == brotato.Scene.WAVE or scene == brotato.Scene.WAVE_END:
+            self.prefetched_ocr = {tuple(xyxy): result for xyxy, result in results}
+        else:
+            self.ocr_telemetry.record_correction(ROI_SCENE, "speculative_discarded")
+
+    # roi_name 用于 OCR 统计，reread=True 表示同一帧中对该区域的再次识别
+    def __recognize_text(self, observation, roi_xyxy, roi_name, reread=False) -> tuple[str, float]:
         text = ""
         conf = 0.0
 
-        # 尝试多次识别， conf 均相同，没必要 retry
-        results, elapse = self.ocr.recognize(roi)
+        x, y, x1, y1 = roi_xyxy
+
+        # # for debug
+        # cv2.rectangle(observation, (x, y), (x1, y1), (0, 0, 255), 1)
+
+        # 推测执行已识别过的区域直接使用结果
+        prefetched = self.prefetched_ocr.pop(tuple(roi_xyxy), None)
+        if prefetched is not None:
+            results, elapse = prefetched
+            self.ocr_telemetry.count(roi_name, "prefetched")
+        else:
+            # 尝试多次识别， conf 均相同，没必要 retry
+            results, elapse = self.perception.recognize(observation[y:y1, x:x1])
         # print(f'ocr results: {results}, elapse: {elapse}')
         if results and results[0]:
             result = results[0]
@@ -443,25 +780,29 @@ class BrotatoEnv(gym.Env):
             if conf >= CONF_THRESHOLD:
                 text = result[0]
 
-        return text, conf
-
-    def __match_text(self, observation, roi_xyxy, pattern): # -> (Match[str] | None)
-        x, y, x1, y1 = roi_xyxy
+        self.ocr_telemetry.record_read(roi_name, conf, reread)
+        if not text:
+            self.ocr_telemetry.record_correction(roi_name, "rejected")
 
-        # # for debug
-        # cv2.rectangle(observation, (x, y), (x1, y1), (0, 0, 255), 1)
+        return text, conf
 
-        roi = observation[y:y1, x:x1]
-        text, conf = self.__recognize_text(roi)
+    def __match_text(self, observation, roi_xyxy, pattern, roi_name): # -> (Match[str] | None)
+        text, conf = self.__recognize_text(observation, roi_xyxy, roi_name)
         if text:
-            return re.match(pattern, text)
+            result = re.match(pattern, text)
+            if not result:
+                self.ocr_telemetry.record_correction(roi_name, "unmatched")
+            return result
 
         return None
 
     def __get_wave_result(self, observation) -> brotato.WaveResult:
+        if self.game_state:
+            return self.game_state.wave_result
+
         wave_result = brotato.WaveResult.UNKNOWN
 
-        match_result = self.__match_text(observation, brotato.BOX_WAVE_RESULT_XYXY[0], r'(\S*)')
+        match_result = self.__match_text(observation, self.layout.wave_result[0], r'(\S*)', ROI_WAVE_RESULT)
         end_text = (match_result and match_result.group(1)) or ""
         if end_text and len(end_text) >= brotato.WAVE_TEXT_MATCH_LEN:
             self.end_text = end_text
@@ -476,19 +817,13 @@ class BrotatoEnv(gym.Env):
 
         return wave_result
 
-    def __match_material_num(self, observation, box_index) -> int:
+    def __match_material_num(self, observation, box_index, reread=False) -> int:
         material = self.prev_material
 
-        if box_index > len(brotato.BOX_MATERIAL_XYXY):
+        if box_index >= len(self.layout.material):
             return material
 
-        x, y, x1, y1 = brotato.BOX_MATERIAL_XYXY[box_index]
-
-        # # for debug
-        # cv2.rectangle(observation, (x, y), (x1, y1), (0, 0, 255), 1)
-
-        roi = observation[y:y1, x:x1]
-        text, conf = self.__recognize_text(roi)
+        text, conf = self.__recognize_text(observation, self.layout.material[box_index], ROI_MATERIAL, reread)
         if text:
             pattern = r'^\D*(\d+)'
             result = re.match(pattern, text)
@@ -496,51 +831,48 @@ class BrotatoEnv(gym.Env):
                 # 处理 reset 时 0 后面出现误判数字的情况，如'02'直接返回 0
                 material_text = result.group(1)
                 if material_text and material_text[0] == '0':
+                    if len(material_text) > 1:
+                        self.ocr_telemetry.record_correction(ROI_MATERIAL, "leading_zero")
                     material = 0
                 else:
                     next_material = int(material_text)
                     # 处理 2/3 误判为 5
                     if next_material == 5 and material <= 3 and conf < 0.6:
-                        pass
+                        self.ocr_telemetry.record_correction(ROI_MATERIAL, "low_conf_5")
                     # 处理 0 误判为 6
                     elif next_material == 6 and material == 0 and conf < 0.6:
-                        pass
+                        self.ocr_telemetry.record_correction(ROI_MATERIAL, "low_conf_6")
                     else:
                         material = next_material
+            else:
+                self.ocr_telemetry.record_correction(ROI_MATERIAL, "unmatched")
 
         return material
 
     # Note: OCR 存在0、3误判为6，10误判为16，3误判为5、13，2、3、1之间误判，4、5误判为1，11连续多次误判为1等情况
     def __get_material(self, observation, reset=False):
-        if reset:
-            box_index = 3
-        else:
-            # TODO: optimize
-            if self.prev_material >= 1000:
-                box_index = 3   # '9999'
-            elif self.prev_material >= 100:
-                box_index = 2   # '999'
-            elif self.prev_material >= 10:
-                box_index = 1   # '99'
-            else:
-                box_index = 0   # '9'
+        if self.game_state:
+            return self.game_state.material
 
+        box_index = self.__material_box_index(reset)
         material = self.__match_material_num(observation, box_index)
 
         # 波次中材料数不会变少，始终大于等于前一次的检测值
         if material < self.prev_material:
             print(f"less material: {material}, prev_material: {self.prev_material}")
+            self.ocr_telemetry.record_correction(ROI_MATERIAL, "less_material")
             # 日志记录到 4 开始就变为一直识别 1 的情况；86 开始 一直识别为 10 或 11 等
             if (box_index == 0 and self.prev_material >= 4 and material <= 2) or \
                (box_index == 1 and self.prev_material >= 85 and material <= 12) or \
                (box_index == 2 and self.prev_material >= 980 and material <= 102):
                 box_index += 1
-                material = self.__match_material_num(observation, box_index)
+                material = self.__match_material_num(observation, box_index, reread=True)
                 print(f"re match index: {box_index}, material: {material}")
         elif material >= (self.prev_material * 10):
             # 非初始状态下，识别到的 material 为 prev_material 的 10 倍，认为是识别错误
             if self.prev_material > 0:
                 print(f"error material: {material}, prev_material: {self.prev_material}")
+                self.ocr_telemetry.record_correction(ROI_MATERIAL, "error_material")
                 # if material >= (self.prev_material * 100):
                 #     material = int(material / 100)
                 # else:
@@ -552,18 +884,40 @@ class BrotatoEnv(gym.Env):
 
         return material
 
+    # 由血条填充比例计算 HP，填充增加（回血或 total_hp 变化）、血条为空等无法确定时返回 None
+    def __get_bar_hp(self, observation):
+        if self.prev_total_hp <= 0:
+            return None
+
+        fill = hud_layout.bar_fill(observation, self.layout.hp_bar)
+        bar_width = self.layout.hp_bar[2] - self.layout.hp_bar[0]
+        prev_fill = self.prev_hp / self.prev_total_hp
+        if fill <= 0 or fill > prev_fill + HP_BAR_TOLERANCE / bar_width:
+            return None
+
+        self.ocr_telemetry.count(ROI_HP, "bar")
+        if fill >= prev_fill - HP_BAR_TOLERANCE / bar_width:
+            return self.prev_hp
+        return round(fill * self.prev_total_hp)
+
     # Note: 扣血过程中（血条背景色变为白色）会出现识别错误的情况
     def __get_hp(self, observation, reset=False):
+        if self.game_state:
+            return self.game_state.hp, self.game_state.total_hp
+
+        # 扣血闪烁时血条的红色部分不变，波次中 total_hp 基本不变，大部分 step 不需要 OCR
+        if self.hp_bar and not reset:
+            hp = self.__get_bar_hp(observation)
+            if hp is not None:
+                return hp, self.prev_total_hp
+            self.ocr_telemetry.count(ROI_HP, "bar_inconsistent")
+
         hp = self.prev_hp
         total_hp = self.prev_total_hp
 
-        # TODO: optimize
-        xyxy = brotato.BOX_HP_XYXY[0]
-        if (not reset) and self.prev_total_hp > 0 and self.prev_total_hp < 100:
-            xyxy = brotato.BOX_HP_XYXY[1]
-
+        xyxy = self.__hp_xyxy(reset)
         pattern = r'^\s*(\d+)\s*/\s*(\d+)\s*'
-        result = self.__match_text(observation, xyxy, pattern)
+        result = self.__match_text(observation, xyxy, pattern, ROI_HP)
         if result:
             hp = int(result.group(1))
             total_hp = int(result.group(2))
@@ -571,26 +925,32 @@ class BrotatoEnv(gym.Env):
         # 识别到的 total_hp 变化一定值（升级/特定道具/特定会使 total_hp 增加或减少），认为是识别错误
         if total_hp < self.prev_total_hp - TOTAL_HP_CHANGE_RANGE:
             print(f"error total_hp: {total_hp}, prev_total_hp: {self.prev_total_hp}")
+            self.ocr_telemetry.record_correction(ROI_HP, "error_total_hp")
             hp = self.prev_hp   # total_hp 识别错误时，hp 可能也识别错误    # TODO: optimize
             total_hp = self.prev_total_hp
         elif total_hp > self.prev_total_hp + TOTAL_HP_CHANGE_RANGE:
             # 非初始状态下
             if self.prev_total_hp > 0:
                 print(f"error total_hp: {total_hp}, prev_total_hp: {self.prev_total_hp}")
+                self.ocr_telemetry.record_correction(ROI_HP, "error_total_hp")
                 hp = self.prev_hp
                 # total_hp = (int(self.prev_total_hp / 10) * 10) + (total_hp % 10)  # 89->90 的情况未处理到
                 total_hp = self.prev_total_hp
 
         if hp > total_hp:
+            self.ocr_telemetry.record_correction(ROI_HP, "hp_over_total")
             hp = self.prev_hp
 
         return hp, total_hp
 
     def __get_wave(self, observation):
+        if self.game_state:
+            return self.game_state.wave or 1
+
         wave = 1
 
         pattern = r'^第\s*(\d+)\s*波'
-        result = self.__match_text(observation, brotato.BOX_WAVE_XYXY[0], pattern)
+        result = self.__match_text(observation, self.layout.wave[0], pattern, ROI_WAVE)
         if result:
             wave = int(result.group(1)) or 1
 
@@ -598,18 +958,20 @@ class BrotatoEnv(gym.Env):
 
     # 识别 0 和 3 出现确信度较低的情况，且会在数字前面识别出其他符号
     def __get_timer(self, observation, reset_timer=None):
-        timer = reset_timer or self.prev_countdown
+        if self.game_state:
+            return self.game_state.timer
 
-        roi_xyxy = brotato.BOX_TIMER_XYXY[0]
-        if timer < 10:
-            roi_xyxy = brotato.BOX_TIMER_XYXY[1]
+        timer = reset_timer or self.prev_countdown
 
+        roi_xyxy = self.__timer_xyxy(timer)
         pattern = r'^\D*(\d+)'
-        result = self.__match_text(observation, roi_xyxy, pattern)
+        result = self.__match_text(observation, roi_xyxy, pattern, ROI_TIMER)
         if result:
             # 处理倒计时从 10 到 9 时，出现 9 后面多误判数字的情况，如 9 识别为 94/95
             timer_text = result.group(1)
             if timer_text and timer_text[0] == '9' and self.prev_countdown == 10:
+                if timer_text != '9':
+                    self.ocr_telemetry.record_correction(ROI_TIMER, "nine_after_ten")
                 timer = 9
             else:
                 timer = int(timer_text)
@@ -624,6 +986,7 @@ class BrotatoEnv(gym.Env):
                         pass
                 elif self.current_wave == LAST_WAVE and timer == 1:
                         print(f"won timer: {timer}, prev_countdown: {self.prev_countdown}")
+                        self.ocr_telemetry.record_correction(ROI_TIMER, "won_timer")
                         timer = self.prev_countdown
                         time.sleep(0.2) # wait timer to 0
                 else:
@@ -631,15 +994,19 @@ class BrotatoEnv(gym.Env):
                     timer_elapsed = self.current_wave_timer - timer
                     if timer_elapsed <= (real_elapsed + 1) and timer_elapsed >= (real_elapsed - 1):
                         print(f"calibrate timer: {timer}, prev_countdown: {self.prev_countdown}, real_elapsed: {real_elapsed}, timer_elapsed: {timer_elapsed}")
+                        self.ocr_telemetry.record_correction(ROI_TIMER, "calibrate_timer")
                     else:
                         print(f"error timer: {timer}, prev_countdown: {self.prev_countdown}, real_elapsed: {real_elapsed}, timer_elapsed: {timer_elapsed}")
+                        self.ocr_telemetry.record_correction(ROI_TIMER, "error_timer")
                         timer = self.prev_countdown
             elif timer > self.prev_countdown:
                     print(f"error timer: {timer}, prev_countdown: {self.prev_countdown}")
+                    self.ocr_telemetry.record_correction(ROI_TIMER, "error_timer")
                     timer = self.prev_countdown
         else:
             if timer <= 0:
                 print(f"error timer: {timer}, reset: {reset_timer}")
+                self.ocr_telemetry.record_correction(ROI_TIMER, "error_timer")
                 timer = reset_timer
 
         return timer
@@ -648,16 +1015,17 @@ class BrotatoEnv(gym.Env):
     def __identify_scene(self, observation):
         scene = brotato.Scene.UNKNOWN
 
-        results = self.model_cls(observation, verbose=False)
-        if results and results[0]:
-            probs = results[0].probs
-            try:
-                # print(f"top 1: {probs.top1}, {probs.top1conf.item():.4f}, top 5: {probs.top5}, {probs.top5conf.tolist()}")
-                top1_confidence = probs.top1conf    # get confidence of top 1 class
-                if top1_confidence.item() > CONF_THRESHOLD:
-                    scene = brotato.Scene(probs.top1)
-
-            except ValueError:
-                print(f"invalid probs: {probs}")
+        # 分类模型按 960x540 画面训练，原生分辨率的画面先缩放（同时不超过感知服务的共享内存大小）
+        if observation.shape[:2] != (brotato.HEIGHT, brotato.WIDTH):
+            observation = cv2.resize(observation, (brotato.WIDTH, brotato.HEIGHT), interpolation=cv2.INTER_AREA)
+
+        top1, top1_confidence = self.perception.classify(observation)
+        try:
+            # print(f"top 1: {top1}, {top1_confidence:.4f}")
+            if top1_confidence > CONF_THRESHOLD:
+                scene = brotato.Scene(top1)
+
+        except ValueError:
+            print(f"invalid probs: {top1}, {top1_confidence}")
 
         return scene
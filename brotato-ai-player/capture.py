@@ -1,32 +1,138 @@
 import brotato as game
-from window import Window
 from decimal import Decimal, ROUND_HALF_UP
+import numpy as np
 import cv2
 
-import keyboard
 import time
 import os
 
 CAPTURE_DIR = "captured"
 
+
+class CaptureRegion:
+    """Named region of the game image, resized to a fixed target size.
+
+    ``xywh`` is given in reference (960x540) coordinates and scaled to the
+    window size at capture time. ``size`` is the (width, height) of the
+    output array and defaults to the region size at reference resolution.
+    """
+
+    def __init__(self, name, xywh, size=None, gray=False):
+        self.name = name
+        self.xywh = tuple(xywh)
+        self.size = tuple(size) if size is not None else (self.xywh[2], self.xywh[3])
+        self.gray = gray
+
+    @classmethod
+    def from_xyxy(cls, name, xyxy, size=None, gray=False):
+        x, y, x1, y1 = xyxy
+        return cls(name, (x, y, x1 - x, y1 - y), size, gray)
+
+    def shape(self):
+        width, height = self.size
+        return (height, width) if self.gray else (height, width, game.N_CHANNELS)
+
+
+# 环境每步使用的区域：场景分类、HUD 各识别框（按窗口缩放的布局）和占画面大部分的地图区域都在参考分辨率的画面中截取，
+# 因此为整个画面在抓取时缩放到参考分辨率，代替抓取原生分辨率的画面后再用 cv2.resize 缩放
+STEP_REGIONS = [
+    CaptureRegion("frame", (0, 0, game.WIDTH, game.HEIGHT)),
+]
+
+
+class FakeWindow:
+    """Capture backend returning a fixed image, for testing without the game."""
+
+    def __init__(self, image):
+        if isinstance(image, str):
+            image = cv2.imread(image)
+        if image.shape[2] == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+        self.image = np.ascontiguousarray(image)
+
+    def set_image(self, image):
+        self.__init__(image)
+
+    def get_image_size(self):
+        return self.image.shape[1], self.image.shape[0]
+
+    def grab(self, rect=None, size=None):
+        image = self.image
+        if rect is not None:
+            x, y, w, h = rect
+            image = image[y:y + h, x:x + w]
+        if size is not None:
+            return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        return image.copy()
+
+
 class Capture:
-    def __init__(self):
+    # window 为 None 时捕获游戏窗口，可传入 FakeWindow 等相同接口的对象
+    def __init__(self, window=None):
         self.window_name = game.WINDOW_NAME
-        self.game_window = Window(self.window_name, game.ASPECT_RATIO)
+        if window is None:
+            from window import Window
+            window = Window(self.window_name, game.ASPECT_RATIO)
+        self.game_window = window
 
         self.prev_image = None
         self.image_count = 0
 
+        # 按区域列表和窗口尺寸预分配的输出缓冲
+        self.region_key = None
+        self.region_plan = []
+        self.region_buffers = {}
+
         os.makedirs(CAPTURE_DIR, exist_ok=True)
 
     def get_window_name(self):
         return self.window_name
 
-    def capture(self, save=False):
+    # 每个区域单独抓取，需要缩放的区域在抓取时缩放（Window 为 StretchBlt），颜色转换直接写入各区域的预分配缓冲
+    # 返回 {name: array}，返回的数组在下一次调用时会被覆盖，需要保留时自行复制；窗口不可用时返回 None
+    def capture_regions(self, regions=STEP_REGIONS):
+        image_size = self.game_window.get_image_size()
+        if image_size is None:
+            return None
+
+        # 按区域的值而不是对象 id 缓存，相同定义的新区域列表可以复用缓冲
+        key = (tuple((region.name, region.xywh, region.size, region.gray) for region in regions), image_size)
+        if key != self.region_key:
+            self.__plan_regions(regions, image_size)
+            self.region_key = key
+
+        for region, rect in self.region_plan:
+            surface = self.game_window.grab(rect, None if rect[2:] == region.size else region.size)
+            if surface is None or surface.shape[:2] != (region.size[1], region.size[0]):
+                # 窗口尺寸在两次调用之间变化
+                self.region_key = None
+                return None
+
+            code = cv2.COLOR_BGRA2GRAY if region.gray else cv2.COLOR_BGRA2BGR
+            cv2.cvtColor(surface, code, dst=self.region_buffers[region.name])
+        return self.region_buffers
+
+    def __plan_regions(self, regions, image_size):
+        width, height = image_size
+        sx = width / game.WIDTH
+        sy = height / game.HEIGHT
+
+        self.region_plan = []
+        self.region_buffers = {}
+        for region in regions:
+            x, y, w, h = region.xywh
+            left, top = round(x * sx), round(y * sy)
+            right, bottom = min(round((x + w) * sx), width), min(round((y + h) * sy), height)
+            self.region_plan.append((region, (left, top, max(right - left, 1), max(bottom - top, 1))))
+            self.region_buffers[region.name] = np.empty(region.shape(), dtype=np.uint8)
+
+    # resize=False 时返回原生分辨率的画面
+    def capture(self, save=False, resize=True):
         observation = self.game_window.grab()
         if observation is not None:
             observation = cv2.cvtColor(observation, cv2.COLOR_BGRA2BGR)
-            observation = cv2.resize(observation, (game.WIDTH, game.HEIGHT))
+            if resize:
+                observation = cv2.resize(observation, (game.WIDTH, game.HEIGHT))
             if save:
                 self.__save_diff_image(observation)
         return observation
@@ -65,6 +171,8 @@ class Capture:
         cv2.waitKey(1)
 
 if __name__ == "__main__":
+    import keyboard
+
     cap = Capture()
 
     while not keyboard.is_pressed('q'):
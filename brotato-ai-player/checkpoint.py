@@ -0,0 +1,189 @@
+import copy
+import json
+import os
+import queue
+import re
+import threading
+import zipfile
+
+import stable_baselines3 as sb3
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.save_util import data_to_json, recursive_getattr
+from stable_baselines3.common.utils import get_system_info, safe_mean
+import torch
+
+KEEP_LAST = 5           # 保留最近的 checkpoint 数量
+KEEP_BEST = 1           # 另外保留平均回报最高的 checkpoint 数量
+MAX_PENDING = 2         # 等待写入的快照数量，超过时 submit 阻塞，避免快照占用过多内存
+
+CHECKPOINT_INDEX = "checkpoints.json"   # 各 checkpoint 的写入序号、步数和平均回报，用于跨训练保留最近和最好的模型
+
+
+class Snapshot:
+    """In-memory copy of everything ``BaseAlgorithm.save()`` writes."""
+
+    def __init__(self, model, path, score=None):
+        self.path = path
+        self.score = score
+        self.num_timesteps = model.num_timesteps
+
+        # 与 BaseAlgorithm.save() 相同的排除规则，数据在训练线程中序列化，避免写入时被修改
+        data = model.__dict__.copy()
+        exclude = set(model._excluded_save_params())
+        state_dicts_names, torch_variable_names = model._get_torch_save_params()
+        for torch_var in state_dicts_names + torch_variable_names:
+            exclude.add(torch_var.split(".")[0])
+        for param_name in exclude:
+            data.pop(param_name, None)
+        self.serialized_data = data_to_json(data)
+
+        # 复制策略和优化器的状态，训练继续更新参数时不影响快照
+        self.params = copy.deepcopy(model.get_parameters())
+        self.pytorch_variables = {name: copy.deepcopy(recursive_getattr(model, name)) for name in torch_variable_names}
+
+    # 格式与 stable_baselines3.common.save_util.save_to_zip_file 一致，可以直接用 PPO.load 加载
+    def write(self, file):
+        with zipfile.ZipFile(file, mode="w") as archive:
+            archive.writestr("data", self.serialized_data)
+            if self.pytorch_variables:
+                with archive.open("pytorch_variables.pth", mode="w", force_zip64=True) as pytorch_variables_file:
+                    torch.save(self.pytorch_variables, pytorch_variables_file)
+            for file_name, dict_ in self.params.items():
+                with archive.open(file_name + ".pth", mode="w", force_zip64=True) as param_file:
+                    torch.save(dict_, param_file)
+            archive.writestr("_stable_baselines3_version", sb3.__version__)
+            archive.writestr("system_info.txt", get_system_info(print_info=False)[1])
+
+
+class CheckpointWriter:
+    """Writes model snapshots on a background thread.
+
+    Each file is written to a temporary name and renamed into place, so a
+    crash never leaves a truncated zip. After every periodic checkpoint the
+    retention policy keeps the last ``keep_last`` (by write order, recorded
+    in the index, so a run restarting its step count does not rank below an
+    older one) and the best ``keep_best`` (by mean episode reward)
+    checkpoints with the given prefix.
+    """
+
+    def __init__(self, save_dir, name_prefix, keep_last=KEEP_LAST, keep_best=KEEP_BEST):
+        self.save_dir = save_dir
+        self.name_prefix = name_prefix
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.pattern = re.compile(rf"^{re.escape(name_prefix)}_(\d+)_steps\.zip$")
+        self.index_path = os.path.join(save_dir, CHECKPOINT_INDEX)
+
+        self.queue = queue.Queue(maxsize=MAX_PENDING)
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def checkpoint_path(self, num_timesteps):
+        return os.path.join(self.save_dir, f"{self.name_prefix}_{num_timesteps}_steps.zip")
+
+    # 周期保存，参与保留策略
+    def submit_checkpoint(self, model, score=None):
+        self.queue.put((Snapshot(model, self.checkpoint_path(model.num_timesteps), score), True))
+
+    # 保存到指定路径（如最终模型），不参与保留策略
+    def submit(self, model, path):
+        self.queue.put((Snapshot(model, path), False))
+
+    # 等待所有快照写入完成
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def __run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            snapshot, periodic = item
+            try:
+                self.__write(snapshot)
+                if periodic:
+                    self.__record(snapshot)
+                    self.__prune()
+            except Exception as e:
+                print(f"checkpoint error: {snapshot.path}, {e}")
+
+    def __write(self, snapshot):
+        path = snapshot.path if snapshot.path.endswith(".zip") else snapshot.path + ".zip"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            snapshot.write(f)
+        os.replace(temp_path, path)
+        print(f"checkpoint saved: {path}")
+
+    def __load_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def __save_index(self, index):
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+        os.replace(temp_path, self.index_path)
+
+    def __record(self, snapshot):
+        index = self.__load_index()
+        seq = max((entry.get("seq", 0) for entry in index.values()), default=0) + 1
+        index[os.path.basename(snapshot.path)] = {"seq": seq, "steps": snapshot.num_timesteps, "score": snapshot.score}
+        self.__save_index(index)
+
+    def __prune(self):
+        index = self.__load_index()
+
+        # 按写入顺序排序，不在索引中（旧版本写入）的按修改时间排在前面
+        checkpoints = []
+        for name in os.listdir(self.save_dir):
+            if self.pattern.match(name):
+                mtime = os.path.getmtime(os.path.join(self.save_dir, name))
+                checkpoints.append((index.get(name, {}).get("seq", 0), mtime, name))
+        checkpoints.sort()
+        checkpoints = [(seq, name) for seq, _, name in checkpoints]
+
+        keep = {name for _, name in checkpoints[-self.keep_last:]} if self.keep_last > 0 else set()
+
+        scored = [(index[name]["score"], name) for _, name in checkpoints
+                  if name in index and index[name]["score"] is not None]
+        scored.sort(reverse=True)
+        keep.update(name for _, name in scored[:self.keep_best])
+
+        for _, name in checkpoints:
+            if name not in keep:
+                os.remove(os.path.join(self.save_dir, name))
+                index.pop(name, None)
+                print(f"checkpoint removed: {name}")
+        self.__save_index(index)
+
+
+class AsyncCheckpointCallback(BaseCallback):
+    """Drop-in replacement for ``CheckpointCallback`` using a ``CheckpointWriter``.
+
+    Only the in-memory snapshot is taken on the training thread; compressing
+    and writing the zip happen in the background.
+    """
+
+    def __init__(self, save_freq, writer, verbose=0):
+        super().__init__(verbose)
+        self.save_freq = save_freq
+        self.writer = writer
+
+    def _on_step(self) -> bool:
+        if self.n_calls % self.save_freq == 0:
+            self.writer.submit_checkpoint(self.model, episode_score(self.model))
+        return True
+
+
+# 最近的平均回报，没有完成的回合时返回 None
+def episode_score(model):
+    if not model.ep_info_buffer:
+        return None
+    return float(safe_mean([ep_info["r"] for ep_info in model.ep_info_buffer]))
@@ -0,0 +1,184 @@
+import json
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+import cv2
+
+from model_paths import DATASET_DIR
+from finetune_cls import IMAGE_EXTENSIONS, build_dataset
+
+INDEX_FILE = "phash_index.json"         # 保存在数据集目录下，{相对路径: [文件大小, 修改时间, 哈希]}
+MANIFEST_FILE = "manifest_{split}.txt"  # 去重并按类别平衡后的图片列表，每行 "相对路径\t类别序号"
+
+HASH_SIZE = 8               # pHash 取 DCT 左上角 8x8 低频系数，64 位
+DCT_SIZE = 32
+DUPLICATE_DISTANCE = 6      # 汉明距离不超过该值认为是近似重复
+MAX_PER_CLASS = 500         # 每个类别保留的最大图片数（去重后），None 时不限制
+
+N_WORKERS = None            # 计算哈希的进程数，None 时使用全部核心
+CHUNK_SIZE = 64
+
+
+# 先按 1/4 解码灰度图，再缩放到 32x32 做 DCT，低频系数与中值比较得到 64 位哈希
+def phash(path):
+    image = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if image is None:
+        return None
+
+    image = cv2.resize(image, (DCT_SIZE, DCT_SIZE), interpolation=cv2.INTER_AREA)
+    dct = cv2.dct(image.astype(np.float32))[:HASH_SIZE, :HASH_SIZE].flatten()
+    bits = dct > np.median(dct[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hash_file(args):
+    rel_path, path = args
+    return rel_path, phash(path)
+
+
+def list_images(root):
+    images = []
+    for dir_path, _, names in os.walk(root):
+        for name in names:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(dir_path, name)
+                images.append((os.path.relpath(path, root).replace(os.sep, "/"), path))
+    images.sort()
+    return images
+
+
+class HashIndex:
+    """Perceptual hashes of every image under a dataset directory.
+
+    The index is a JSON file next to the images, keyed by relative path and
+    stamped with file size and mtime; ``update()`` only hashes new or changed
+    files (in a process pool) and drops entries of deleted files.
+    """
+
+    def __init__(self, root=DATASET_DIR):
+        self.root = root
+        self.path = os.path.join(root, INDEX_FILE)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def update(self, n_workers=N_WORKERS):
+        images = list_images(self.root)
+        current = {}
+        pending = []
+        for rel_path, path in images:
+            stat = os.stat(path)
+            stamp = [stat.st_size, int(stat.st_mtime)]
+            entry = self.entries.get(rel_path)
+            if entry and entry[:2] == stamp:
+                current[rel_path] = entry
+            else:
+                current[rel_path] = stamp + [None]
+                pending.append((rel_path, path))
+
+        start_time = time.time()
+        if pending:
+            # 文件较少时不启动进程池
+            if len(pending) < CHUNK_SIZE:
+                results = map(hash_file, pending)
+            else:
+                pool = mp.get_context("spawn").Pool(n_workers)
+                results = pool.imap_unordered(hash_file, pending, chunksize=CHUNK_SIZE)
+            for rel_path, value in results:
+                current[rel_path][2] = None if value is None else f"{value:016x}"
+            if len(pending) >= CHUNK_SIZE:
+                pool.close()
+                pool.join()
+
+        removed = len(set(self.entries) - set(current))
+        self.entries = current
+        self.save()
+        print(f"index: {len(current)} images, hashed: {len(pending)}, removed: {removed}, elapsed: {time.time() - start_time:.2f}s")
+
+    def save(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(temp_path, self.path)
+
+    # 返回 {类别文件夹: [(相对路径, 哈希)]}，按文件名（捕获顺序）排序
+    def folders(self, split):
+        folders = {}
+        prefix = f"{split}/"
+        for rel_path in sorted(self.entries):
+            value = self.entries[rel_path][2]
+            if rel_path.startswith(prefix) and value is not None:
+                class_name = rel_path[len(prefix):].split("/")[0]
+                folders.setdefault(class_name, []).append((rel_path, int(value, 16)))
+        return folders
+
+
+# 近似重复聚类：按顺序依次与已有的代表图片比较，距离不超过 max_distance 时归入该类，否则作为新的代表
+# 哈希分为 max_distance + 1 段，距离不超过 max_distance 的两个哈希至少有一段相同，只与同段相同的代表比较
+def cluster(hashes, max_distance=DUPLICATE_DISTANCE):
+    n_bands = max_distance + 1
+    bounds = np.linspace(0, HASH_SIZE * HASH_SIZE, n_bands + 1).astype(int)
+    bands = [(int(start), (1 << int(end - start)) - 1) for start, end in zip(bounds[:-1], bounds[1:])]
+
+    leaders = []            # 代表图片的序号
+    buckets = {}            # (段序号, 段值) -> [代表序号]
+    labels = []             # 每张图片所属的代表序号
+    for index, value in enumerate(hashes):
+        keys = [(band, (value >> shift) & mask) for band, (shift, mask) in enumerate(bands)]
+
+        leader = None
+        for key in keys:
+            for candidate in buckets.get(key, ()):
+                if (hashes[candidate] ^ value).bit_count() <= max_distance:
+                    leader = candidate
+                    break
+            if leader is not None:
+                break
+
+        if leader is None:
+            leader = index
+            leaders.append(index)
+            for key in keys:
+                buckets.setdefault(key, []).append(index)
+        labels.append(leader)
+
+    return leaders, labels
+
+
+# 每个类别保留聚类代表，超过 max_per_class 时按捕获顺序均匀抽取，返回 {类别文件夹: [相对路径]}
+def build_manifest(index, split="train", max_distance=DUPLICATE_DISTANCE, max_per_class=MAX_PER_CLASS):
+    manifest = {}
+    for class_name, items in sorted(index.folders(split).items()):
+        leaders, _ = cluster([value for _, value in items], max_distance)
+        if max_per_class is not None and len(leaders) > max_per_class:
+            leaders = [leaders[i] for i in np.linspace(0, len(leaders) - 1, max_per_class).astype(int)]
+        manifest[class_name] = [items[i][0] for i in leaders]
+        print(f"{class_name}: images: {len(items)}, clusters: {len(leaders)}, kept: {len(manifest[class_name])}")
+    return manifest
+
+
+def save_manifest(manifest, root=DATASET_DIR, split="train"):
+    path = os.path.join(root, MANIFEST_FILE.format(split=split))
+    with open(path, "w", encoding="utf-8") as f:
+        for class_name, rel_paths in manifest.items():
+            label = int(class_name.split("_")[0])
+            for rel_path in rel_paths:
+                f.write(f"{rel_path}\t{label}\n")
+    print(f"manifest saved: {path}")
+    return path
+
+
+# 按清单创建硬链接的训练数据集（ultralytics 目录结构），可直接作为 train_img_cls.py 的 DATA_PATH
+def materialize_manifest(manifest, dataset_dir, root=DATASET_DIR):
+    samples = [(os.path.join(root, rel_path), int(class_name.split("_")[0]))
+               for class_name, rel_paths in manifest.items() for rel_path in rel_paths]
+    build_dataset(samples, sorted(manifest), os.path.join(root, "test"), dataset_dir)
+
+
+if __name__ == "__main__":
+    hash_index = HashIndex()
+    hash_index.update()
+    save_manifest(build_manifest(hash_index))
@@ -0,0 +1,178 @@
+import glob
+import os
+import time
+
+import numpy as np
+
+import brotato
+from model_paths import EPISODE_DIR
+
+FLUSH_EPISODES = 64     # 缓存的回合数，达到后写入一个分段文件
+FLUSH_INTERVAL = 300    # 距上次写入超过该秒数时也写入，进程被强制结束时最多丢失这段时间内的回合
+COMPACT_EPISODES = 100000   # 合并小分段时每个分段的最大回合数
+SEGMENT_PATTERN = "episodes_{:06d}.npz"
+
+# 列名和类型，每个分段文件中每列保存为一个数组，查询时只读取需要的列
+COLUMNS = {
+    "time": np.float64,             # 回合结束时间
+    "wave": np.int16,
+    "wave_result": np.int8,         # brotato.WaveResult 的值，商店等场景结束的回合为 UNKNOWN
+    "steps": np.int32,
+    "duration": np.float32,         # reset 到回合结束的秒数
+    "reward": np.float32,
+    "time_reward": np.float32,
+    "hp_reward": np.float32,
+    "hp_step_reward": np.float32,
+    "material_reward": np.float32,
+    "total_material": np.int32,
+    "hp": np.int16,
+    "total_hp": np.int16,
+}
+
+
+class EpisodeStore:
+    """Append-only columnar store of per-episode records.
+
+    Records are buffered and written ``FLUSH_EPISODES`` at a time, or at the
+    first append ``FLUSH_INTERVAL`` seconds after the last write, as a new
+    ``.npz`` segment (one array per column), written to a temporary name and
+    renamed into place; existing segments are only rewritten by
+    ``compact()``, which keeps the order of the records.
+    """
+
+    def __init__(self, store_dir=EPISODE_DIR, flush_episodes=FLUSH_EPISODES, flush_interval=FLUSH_INTERVAL):
+        self.store_dir = store_dir
+        self.flush_episodes = flush_episodes
+        self.flush_interval = flush_interval
+        self.last_flush = time.time()
+        self.pending = {name: [] for name in COLUMNS}
+        os.makedirs(store_dir, exist_ok=True)
+        self.next_segment = next_segment_index(store_dir)
+
+    # record 为 {列名: 值}，缺少的列记为 0
+    def append(self, record):
+        for name, values in self.pending.items():
+            values.append(record.get(name, 0))
+        if len(self.pending["time"]) >= self.flush_episodes or time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.time()
+        if not self.pending["time"]:
+            return
+
+        # 多个进程写入同一目录时跳过已存在的序号
+        path = os.path.join(self.store_dir, SEGMENT_PATTERN.format(self.next_segment))
+        while os.path.exists(path):
+            self.next_segment += 1
+            path = os.path.join(self.store_dir, SEGMENT_PATTERN.format(self.next_segment))
+
+        write_segment(path, {name: np.asarray(values, dtype=COLUMNS[name]) for name, values in self.pending.items()})
+        self.next_segment += 1
+        for values in self.pending.values():
+            values.clear()
+
+    def close(self):
+        self.flush()
+
+
+def segment_paths(store_dir=EPISODE_DIR):
+    return sorted(glob.glob(os.path.join(store_dir, SEGMENT_PATTERN.replace("{:06d}", "*"))))
+
+
+def segment_index(path):
+    return int(os.path.basename(path).split("_")[1].split(".")[0])
+
+
+# 新分段的序号大于所有已有分段，保持按序号排序即为写入顺序
+def next_segment_index(store_dir=EPISODE_DIR):
+    paths = segment_paths(store_dir)
+    return segment_index(paths[-1]) + 1 if paths else 0
+
+
+def write_segment(path, columns):
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        np.savez(f, **columns)
+    os.replace(temp_path, path)
+
+
+# 将连续的小分段合并为不超过 max_episodes 回合的分段，使用组内第一个分段的序号，减少查询时打开的文件数
+def compact(store_dir=EPISODE_DIR, max_episodes=COMPACT_EPISODES):
+    groups = [[]]
+    count = 0
+    for path in segment_paths(store_dir):
+        with np.load(path) as segment:
+            n = len(segment["time"])
+        if count + n > max_episodes and groups[-1]:
+            groups.append([])
+            count = 0
+        groups[-1].append(path)
+        count += n
+
+    for paths in groups:
+        if len(paths) < 2:
+            continue
+        parts = {name: [] for name in COLUMNS}
+        for path in paths:
+            with np.load(path) as segment:
+                for name in COLUMNS:
+                    parts[name].append(segment[name])
+        write_segment(paths[0], {name: np.concatenate(values) for name, values in parts.items()})
+        for path in paths[1:]:
+            os.remove(path)
+
+
+# 返回 {列名: 数组}，按写入顺序拼接所有分段，columns 为 None 时读取全部列
+def load(columns=None, store_dir=EPISODE_DIR):
+    columns = list(columns or COLUMNS)
+    parts = {name: [] for name in columns}
+    for path in segment_paths(store_dir):
+        with np.load(path) as segment:
+            for name in columns:
+                parts[name].append(segment[name])
+    return {name: np.concatenate(values) if values else np.zeros(0, dtype=COLUMNS[name]) for name, values in parts.items()}
+
+
+# 返回 {波次: (回合数, 通过率)}，只统计以波次结果结束的回合
+def win_rate_by_wave(store_dir=EPISODE_DIR):
+    data = load(["wave", "wave_result"], store_dir)
+    finished = data["wave_result"] != brotato.WaveResult.UNKNOWN.value
+    waves = data["wave"][finished]
+    wins = np.isin(data["wave_result"][finished], [brotato.WaveResult.COMPLETED.value, brotato.WaveResult.WON.value])
+
+    counts = np.bincount(waves)
+    win_counts = np.bincount(waves, weights=wins, minlength=len(counts))
+    return {int(wave): (int(counts[wave]), win_counts[wave] / counts[wave]) for wave in np.nonzero(counts)[0]}
+
+
+# 各奖励分量每 window 个回合的平均值，返回 {列名: 数组}
+def reward_trends(window=1000, store_dir=EPISODE_DIR):
+    names = ["reward", "time_reward", "hp_reward", "hp_step_reward", "material_reward"]
+    data = load(names, store_dir)
+    n = len(data["reward"]) // window * window
+    return {name: data[name][:n].reshape(-1, window).mean(axis=1) for name in names}
+
+
+# 每 window 个回合的决策频率（steps/s），以及全部回合的平均值
+def steps_per_sec(window=1000, store_dir=EPISODE_DIR):
+    data = load(["steps", "duration"], store_dir)
+    steps = data["steps"].astype(np.float64)
+    duration = data["duration"].astype(np.float64)
+    n = len(steps) // window * window
+    trend = steps[:n].reshape(-1, window).sum(axis=1) / np.maximum(duration[:n].reshape(-1, window).sum(axis=1), 1e-6)
+    return trend, steps.sum() / max(duration.sum(), 1e-6)
+
+
+if __name__ == "__main__":
+    compact()
+
+    start = time.perf_counter()
+    print(f"episodes: {len(load(['time'])['time'])}")
+    for wave, (count, rate) in win_rate_by_wave().items():
+        print(f"wave {wave:2d}: episodes: {count}, win rate: {rate:.3f}")
+    for name, trend in reward_trends().items():
+        print(f"{name}: {np.round(trend, 3)}")
+    trend, overall = steps_per_sec()
+    print(f"steps/s: {overall:.2f}, trend: {np.round(trend, 2)}")
+    print(f"query elapsed: {time.perf_counter() - start:.3f}s")
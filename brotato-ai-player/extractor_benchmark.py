@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+
+from brotato_action import N_DISCRETE_ACTIONS
+from obs_profiles import PROFILES, DEFAULT_PROFILE
+
+BATCH_SIZE = 256        # 与 train_ppo.py 相同
+N_STEPS = 2048
+N_EPOCHS = 10
+
+BENCHMARK_BATCHES = 20
+WARMUP_BATCHES = 3
+
+
+# 各特征提取网络的策略参数，nature 为 SB3 CnnPolicy 默认的 NatureCNN
+def extractor_configs():
+    from light_cnn import LightCnn
+    return {
+        "nature": {},
+        "light": dict(features_extractor_class=LightCnn),
+        "light-ssm": dict(features_extractor_class=LightCnn, features_extractor_kwargs=dict(spatial_softmax=True)),
+    }
+
+
+# 模拟 PPO 的一次 minibatch 更新，返回 (前向耗时 ms, 反向及优化器耗时 ms, 参数数量)
+def measure(policy_kwargs, profile=DEFAULT_PROFILE, batch_size=BATCH_SIZE, batches=BENCHMARK_BATCHES, device="cpu"):
+    import torch
+    import gymnasium as gym
+    from stable_baselines3.common.policies import ActorCriticCnnPolicy
+
+    height, width, channels = PROFILES[profile].shape()
+    observation_space = gym.spaces.Box(0, 255, (channels, height, width), dtype=np.uint8)
+    policy = ActorCriticCnnPolicy(observation_space, gym.spaces.Discrete(N_DISCRETE_ACTIONS), lambda _: 3e-4,
+                                  **policy_kwargs).to(device)
+    policy.set_training_mode(True)
+
+    # 与 Uint8RolloutBuffer 相同，minibatch 以 uint8 传入，由策略内部归一化
+    obs = torch.randint(0, 256, (batch_size, channels, height, width), dtype=torch.uint8, device=device)
+    actions = torch.randint(0, N_DISCRETE_ACTIONS, (batch_size,), device=device)
+
+    forward_elapsed = []
+    backward_elapsed = []
+    for i in range(WARMUP_BATCHES + batches):
+        start = time.perf_counter()
+        values, log_prob, entropy = policy.evaluate_actions(obs, actions)
+        loss = -log_prob.mean() + 0.5 * values.pow(2).mean() - 0.01 * entropy.mean()
+        forward_time = time.perf_counter()
+
+        policy.optimizer.zero_grad()
+        loss.backward()
+        policy.optimizer.step()
+        end = time.perf_counter()
+
+        if i >= WARMUP_BATCHES:
+            forward_elapsed.append(forward_time - start)
+            backward_elapsed.append(end - forward_time)
+
+    n_params = sum(param.numel() for param in policy.parameters())
+    return np.mean(forward_elapsed) * 1000, np.mean(backward_elapsed) * 1000, n_params
+
+
+def benchmark(profile=DEFAULT_PROFILE):
+    import torch
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    updates = N_STEPS // BATCH_SIZE * N_EPOCHS
+    print(f"profile: {profile}, shape: {PROFILES[profile].shape()}, batch: {BATCH_SIZE}, device: {device}, threads: {torch.get_num_threads()}")
+
+    for name, policy_kwargs in extractor_configs().items():
+        forward, backward, n_params = measure(policy_kwargs, profile, device=device)
+        # 每次 PPO 更新（训练期间游戏暂停）包括 N_STEPS / BATCH_SIZE * N_EPOCHS 次 minibatch
+        print(f"{name:>10}: params: {n_params:9d}, forward: {forward:8.2f} ms, backward: {backward:8.2f} ms, "
+              f"update: {(forward + backward) * updates / 1000:6.2f} s")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,185 @@
+import os
+import random
+import shutil
+
+import cv2
+
+from model_paths import CLS_MODEL_PATH, CLS_WEIGHTS_PATH, DATASET_DIR
+from perception import SceneClassifier
+
+NEW_FRAMES_DIR = os.path.join("datasets", "brotato-cls-new")    # 新采集的图片，按类别文件夹整理，目录结构与 train 相同
+FINETUNE_DIR = os.path.join("runs", "classify", "finetune")     # 增量训练的数据集链接和训练输出
+
+REPLAY_PER_CLASS = 20       # 每个类别从已有训练图片中随机抽取的回放数量，防止遗忘
+FINETUNE_EPOCHS = 5
+FINETUNE_LR = 1e-4          # 从已训练的权重开始，学习率比从头训练小
+FINETUNE_IMGSZ = 640        # 与 train_img_cls.py 一致，导出模型的输入尺寸不变
+
+MAX_ACCURACY_DROP = 0.0     # 回归检查：测试集准确率不能低于原模型
+MAX_CLASS_DROP = 0.05       # 回归检查：单个类别的召回率下降不能超过该值
+
+EVAL_BATCH_SIZE = 16
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+# 返回 [(path, class_index)]，类别序号取自文件夹名称前缀（如 04_WAVE，与 brotato.Scene 一致）
+def list_samples(root):
+    if not os.path.isdir(root):
+        return []
+
+    samples = []
+    for class_name in sorted(os.listdir(root)):
+        class_dir = os.path.join(root, class_name)
+        if not os.path.isdir(class_dir):
+            continue
+        label = int(class_name.split("_")[0])
+        for name in sorted(os.listdir(class_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                samples.append((os.path.join(class_dir, name), label))
+    return samples
+
+
+# 新图片与已有图片同名时加前缀
+def unique_path(target_dir, name):
+    target = os.path.join(target_dir, name)
+    while os.path.exists(target):
+        name = f"new_{name}"
+        target = os.path.join(target_dir, name)
+    return target
+
+
+def predict(classifier, samples):
+    predictions = []
+    for start in range(0, len(samples), EVAL_BATCH_SIZE):
+        images = [cv2.imread(path) for path, _ in samples[start:start + EVAL_BATCH_SIZE]]
+        predictions.extend(top1 for top1, _ in classifier.classify_batch(images))
+    return predictions
+
+
+# 返回 (准确率, {类别: 召回率})
+def evaluate(classifier, samples):
+    predictions = predict(classifier, samples)
+
+    totals = {}
+    corrects = {}
+    for (_, label), top1 in zip(samples, predictions):
+        totals[label] = totals.get(label, 0) + 1
+        corrects[label] = corrects.get(label, 0) + int(top1 == label)
+
+    accuracy = sum(corrects.values()) / max(len(samples), 1)
+    return accuracy, {label: corrects[label] / totals[label] for label in totals}
+
+
+def select_training_samples(classifier, new_samples, old_samples, replay_per_class=REPLAY_PER_CLASS, seed=0):
+    # 已有训练图片中当前模型分类错误的全部加入，其余按类别随机回放
+    predictions = predict(classifier, old_samples)
+    misclassified = [sample for sample, top1 in zip(old_samples, predictions) if top1 != sample[1]]
+
+    remaining = {}
+    for sample, top1 in zip(old_samples, predictions):
+        if top1 == sample[1]:
+            remaining.setdefault(sample[1], []).append(sample)
+
+    rng = random.Random(seed)
+    replay = []
+    for label in sorted(remaining):
+        samples = remaining[label]
+        replay.extend(rng.sample(samples, min(replay_per_class, len(samples))))
+
+    print(f"new: {len(new_samples)}, misclassified: {len(misclassified)}, replay: {len(replay)}")
+    return new_samples + misclassified + replay
+
+
+# 按 ultralytics 分类数据集的目录结构创建硬链接（不支持时复制），class_names 为全部类别文件夹
+def build_dataset(samples, class_names, test_dir, dataset_dir):
+    if os.path.exists(dataset_dir):
+        shutil.rmtree(dataset_dir)
+
+    # 没有样本的类别也需要文件夹，保持类别数和序号不变
+    for class_name in class_names:
+        os.makedirs(os.path.join(dataset_dir, "train", class_name), exist_ok=True)
+
+    for path, _ in samples:
+        class_name = os.path.basename(os.path.dirname(path))
+        target_dir = os.path.join(dataset_dir, "train", class_name)
+        os.makedirs(target_dir, exist_ok=True)
+        target = unique_path(target_dir, os.path.basename(path))
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copy2(path, target)
+
+    # ultralytics 要求有验证集目录，训练时不验证
+    shutil.copytree(test_dir, os.path.join(dataset_dir, "test"))
+
+
+def finetune(new_dir=NEW_FRAMES_DIR, epochs=FINETUNE_EPOCHS, imgsz=FINETUNE_IMGSZ, merge_new=True):
+    from ultralytics import YOLO
+
+    if not os.path.exists(CLS_WEIGHTS_PATH):
+        print(f"no source weights: {CLS_WEIGHTS_PATH}, run train_img_cls.py first")
+        return False
+
+    train_dir = os.path.join(DATASET_DIR, "train")
+    test_dir = os.path.join(DATASET_DIR, "test")
+    new_samples = list_samples(new_dir)
+    test_samples = list_samples(test_dir)
+    if not new_samples:
+        print(f"no new frames: {new_dir}")
+        return False
+
+    old_classifier = SceneClassifier(CLS_MODEL_PATH)
+    samples = select_training_samples(old_classifier, new_samples, list_samples(train_dir))
+    dataset_dir = os.path.abspath(os.path.join(FINETUNE_DIR, "data"))
+    class_names = sorted(name for name in os.listdir(train_dir) if os.path.isdir(os.path.join(train_dir, name)))
+    build_dataset(samples, class_names, test_dir, dataset_dir)
+
+    # 从原模型的 .pt 权重开始短时间训练，不在训练中验证（测试集只用于最后的回归检查）
+    model = YOLO(CLS_WEIGHTS_PATH)
+    model.train(data=dataset_dir,
+                epochs=epochs,
+                imgsz=imgsz,
+                optimizer="AdamW",
+                lr0=FINETUNE_LR,
+                warmup_epochs=0,
+                val=False,
+                project=FINETUNE_DIR,
+                name="train",
+                exist_ok=True)
+    weights_path = str(model.trainer.last)
+    onnx_path = YOLO(weights_path).export(format="onnx", imgsz=imgsz)
+
+    # 回归检查：在测试集上与原模型比较
+    old_accuracy, old_recalls = evaluate(old_classifier, test_samples)
+    new_accuracy, new_recalls = evaluate(SceneClassifier(onnx_path), test_samples)
+    print(f"test accuracy: {old_accuracy:.4f} -> {new_accuracy:.4f}")
+
+    passed = new_accuracy >= old_accuracy - MAX_ACCURACY_DROP
+    for label, old_recall in sorted(old_recalls.items()):
+        new_recall = new_recalls.get(label, 0.0)
+        if new_recall < old_recall - MAX_CLASS_DROP:
+            print(f"class {label:02d} recall: {old_recall:.4f} -> {new_recall:.4f}")
+            passed = False
+
+    if not passed:
+        print(f"regression check failed, keep {CLS_MODEL_PATH}, new model: {onnx_path}")
+        return False
+
+    # 通过后替换模型，原模型保留为 .bak
+    for source, target in ((onnx_path, CLS_MODEL_PATH), (weights_path, CLS_WEIGHTS_PATH)):
+        shutil.copy2(target, target + ".bak")
+        shutil.copy2(source, target)
+    print(f"model updated: {CLS_MODEL_PATH}")
+
+    # 新图片并入训练集，下次增量训练时作为已有图片参与回放
+    if merge_new:
+        for path, _ in new_samples:
+            class_name = os.path.basename(os.path.dirname(path))
+            target_dir = os.path.join(train_dir, class_name)
+            os.makedirs(target_dir, exist_ok=True)
+            shutil.move(path, unique_path(target_dir, os.path.basename(path)))
+    return True
+
+
+if __name__ == "__main__":
+    finetune()
@@ -0,0 +1,142 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+import brotato
+from capture import Capture
+
+import time
+
+FRAME_SHAPE = (brotato.HEIGHT, brotato.WIDTH, brotato.N_CHANNELS)
+
+# 零拷贝读取的帧在被覆盖前可用 (RING_SLOTS - 1) / CAPTURE_FPS 秒，需大于单步耗时
+RING_SLOTS = 16
+CAPTURE_FPS = 30
+
+HEADER_ALIGN = 64
+
+
+class FrameRing:
+    """Ring of preallocated frames in shared memory.
+
+    Layout: per-slot sequence numbers and timestamps, the latest sequence
+    number, then the frames. The writer marks a slot as -1 while filling it so
+    readers never return a partially written frame.
+    """
+
+    def __init__(self, n_slots=RING_SLOTS, frame_shape=FRAME_SHAPE, name=None):
+        self.n_slots = n_slots
+        self.frame_shape = tuple(frame_shape)
+
+        frame_bytes = int(np.prod(self.frame_shape))
+        header_bytes = n_slots * 16 + 8
+        self.header_bytes = (header_bytes + HEADER_ALIGN - 1) // HEADER_ALIGN * HEADER_ALIGN
+
+        create = name is None
+        size = self.header_bytes + n_slots * frame_bytes
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self.__map()
+
+        if create:
+            self.seqs[:] = -1
+            self.stamps[:] = 0.0
+            self.latest[0] = -1
+
+    def __map(self):
+        buf = self.shm.buf
+        n = self.n_slots
+        self.seqs = np.ndarray((n,), dtype=np.int64, buffer=buf, offset=0)
+        self.stamps = np.ndarray((n,), dtype=np.float64, buffer=buf, offset=n * 8)
+        self.latest = np.ndarray((1,), dtype=np.int64, buffer=buf, offset=n * 16)
+        self.frames = np.ndarray((n, *self.frame_shape), dtype=np.uint8, buffer=buf, offset=self.header_bytes)
+
+    # 传递到其他进程时按名称重新连接共享内存
+    def __getstate__(self):
+        return {"name": self.shm.name, "n_slots": self.n_slots, "frame_shape": self.frame_shape}
+
+    def __setstate__(self, state):
+        self.__init__(state["n_slots"], state["frame_shape"], state["name"])
+
+    def write(self, frame, timestamp=None):
+        seq = int(self.latest[0]) + 1
+        slot = seq % self.n_slots
+
+        self.seqs[slot] = -1
+        np.copyto(self.frames[slot], frame)
+        self.stamps[slot] = timestamp if timestamp is not None else time.time()
+        self.seqs[slot] = seq
+        self.latest[0] = seq
+
+    # 返回 (frame, seq, timestamp)，无可用帧时 frame 为 None
+    # copy=False 时返回共享内存视图，使用完前可通过 is_valid(seq) 确认未被覆盖
+    def read_latest(self, copy=False):
+        seq = int(self.latest[0])
+        if seq < 0:
+            return None, -1, 0.0
+
+        slot = seq % self.n_slots
+        timestamp = float(self.stamps[slot])
+        frame = self.frames[slot]
+        if copy:
+            frame = frame.copy()
+
+        if not self.is_valid(seq):
+            return None, -1, 0.0
+
+        return frame, seq, timestamp
+
+    def is_valid(self, seq) -> bool:
+        return int(self.seqs[seq % self.n_slots]) == seq
+
+    def close(self):
+        self.seqs = self.stamps = self.latest = self.frames = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+class CaptureProcess:
+    """Grabs the game window at a fixed rate into a ``FrameRing``."""
+
+    def __init__(self, fps=CAPTURE_FPS, n_slots=RING_SLOTS):
+        ctx = mp.get_context("spawn")
+
+        self.ring = FrameRing(n_slots)
+        self.stop_event = ctx.Event()
+        self.process = ctx.Process(target=run_capture, args=(self.ring, fps, self.stop_event), daemon=True)
+
+    def start(self):
+        self.process.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.process.is_alive():
+            self.process.join()
+
+        self.ring.close()
+        self.ring.unlink()
+
+    def reader(self) -> FrameRing:
+        return self.ring
+
+
+def run_capture(ring, fps, stop_event):
+    cap = Capture()
+    interval = 1.0 / fps
+
+    next_time = time.time()
+    while not stop_event.is_set():
+        grab_time = time.time()
+        observation = cap.capture()
+        if observation is not None:
+            ring.write(observation, grab_time)
+
+        next_time += interval
+        sleep_time = next_time - time.time()
+        if sleep_time > 0:
+            time.sleep(sleep_time)
+        else:
+            next_time = time.time()
+
+    ring.close()
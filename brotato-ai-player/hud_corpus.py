@@ -0,0 +1,170 @@
+import glob
+import hashlib
+import os
+
+import cv2
+
+import brotato
+from finetune_cls import NEW_FRAMES_DIR
+from model_paths import DATASET_DIR, HUD_CORPUS_DIR
+from ocr_telemetry import ROI_HP, ROI_MATERIAL, ROI_WAVE, ROI_TIMER, ROI_WAVE_RESULT
+
+LABEL_FILE = "labels.tsv"       # 每个区域目录下的标注，每行 "文件名\t出现次数\t文本"
+FRAMES_FILE = "frames.txt"      # 已提取的画面，重复提取时跳过
+DISCARD_TEXT = "#"              # 无法识别或区域内没有文字（如被遮挡）的图片
+LABEL_SCALE = 6                 # 标注时图片的放大倍数
+
+# 各区域的识别框（与 brotato.BOX_* 相同），以及按文本选择识别框的方法（与 BrotatoEnv 相同）
+ROI_BOXES = {
+    ROI_HP: (brotato.BOX_HP_XYXY, lambda text: 1 if int(text.split("/")[-1]) < 100 else 0),
+    ROI_MATERIAL: (brotato.BOX_MATERIAL_XYXY, lambda text: min(len(text), len(brotato.BOX_MATERIAL_XYXY)) - 1),
+    ROI_WAVE: (brotato.BOX_WAVE_XYXY, lambda text: 0),
+    ROI_TIMER: (brotato.BOX_TIMER_XYXY, lambda text: 1 if int(text) < 10 else 0),
+    ROI_WAVE_RESULT: (brotato.BOX_WAVE_RESULT_XYXY, lambda text: 0),
+}
+
+# 从数据集中各场景的画面提取的区域
+SCENE_ROIS = {
+    "04_WAVE": [ROI_HP, ROI_MATERIAL, ROI_WAVE, ROI_TIMER],
+    "05_WAVE_END": [ROI_HP, ROI_MATERIAL, ROI_WAVE, ROI_TIMER, ROI_WAVE_RESULT],
+}
+
+
+# 区域内所有识别框的外接框，保存的图片为该框内的画面，识别时再截取对应的识别框
+def union_box(boxes):
+    return [min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes)]
+
+
+# 返回在保存的图片中与文本对应的识别框
+def text_box(roi, text):
+    boxes, select = ROI_BOXES[roi]
+    ux, uy, _, _ = union_box(boxes)
+    try:
+        x, y, x1, y1 = boxes[select(text)]
+    except (ValueError, IndexError):
+        x, y, x1, y1 = boxes[0]
+    return [x - ux, y - uy, x1 - ux, y1 - uy]
+
+
+def crop_text_box(image, roi, text):
+    x, y, x1, y1 = text_box(roi, text)
+    return image[y:y1, x:x1]
+
+
+# 返回 {文件名: [出现次数, 文本]}，未标注的文本为 None
+def load_labels(roi, corpus_dir=HUD_CORPUS_DIR):
+    path = os.path.join(corpus_dir, roi, LABEL_FILE)
+    labels = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                name, count, text = line.rstrip("\n").split("\t")
+                labels[name] = [int(count), text or None]
+    return labels
+
+
+def save_labels(roi, labels, corpus_dir=HUD_CORPUS_DIR):
+    path = os.path.join(corpus_dir, roi, LABEL_FILE)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        for name, (count, text) in sorted(labels.items()):
+            f.write(f"{name}\t{count}\t{text or ''}\n")
+    os.replace(temp_path, path)
+
+
+# 返回 [(图片路径, 出现次数, 文本)]，不包含未标注和丢弃的图片
+def labelled_samples(roi, corpus_dir=HUD_CORPUS_DIR):
+    return [(os.path.join(corpus_dir, roi, name), count, text)
+            for name, (count, text) in sorted(load_labels(roi, corpus_dir).items())
+            if text is not None and text != DISCARD_TEXT]
+
+
+def list_frames():
+    frames = []
+    for scene_dir, rois in SCENE_ROIS.items():
+        for root in (os.path.join(DATASET_DIR, "*"), NEW_FRAMES_DIR):
+            for path in sorted(glob.glob(os.path.join(root, scene_dir, "*.jpg"))):
+                frames.append((path, rois))
+    return frames
+
+
+# 从已有的画面中截取 HUD 区域，相同的图片只保存一次并累计出现次数，只需标注一次
+def extract(corpus_dir=HUD_CORPUS_DIR):
+    frames_path = os.path.join(corpus_dir, FRAMES_FILE)
+    done = set()
+    if os.path.exists(frames_path):
+        with open(frames_path, "r", encoding="utf-8") as f:
+            done = set(line.rstrip("\n") for line in f)
+
+    labels = {roi: load_labels(roi, corpus_dir) for roi in ROI_BOXES}
+    for roi in ROI_BOXES:
+        os.makedirs(os.path.join(corpus_dir, roi), exist_ok=True)
+
+    new_frames = []
+    for path, rois in list_frames():
+        key = os.path.normpath(path).replace(os.sep, "/")
+        if key in done:
+            continue
+        frame = cv2.resize(cv2.imread(path), (brotato.WIDTH, brotato.HEIGHT))
+        for roi in rois:
+            x, y, x1, y1 = union_box(ROI_BOXES[roi][0])
+            image = frame[y:y1, x:x1]
+            name = hashlib.md5(image.tobytes()).hexdigest()[:16] + ".png"
+            if name in labels[roi]:
+                labels[roi][name][0] += 1
+            else:
+                cv2.imwrite(os.path.join(corpus_dir, roi, name), image)
+                labels[roi][name] = [1, None]
+        new_frames.append(key)
+
+    for roi in ROI_BOXES:
+        save_labels(roi, labels[roi], corpus_dir)
+    with open(frames_path, "a", encoding="utf-8") as f:
+        f.writelines(f"{key}\n" for key in new_frames)
+
+    for roi in ROI_BOXES:
+        pending = sum(text is None for _, text in labels[roi].values())
+        print(f"{roi}: images: {len(labels[roi])}, unlabelled: {pending}")
+    print(f"new frames: {len(new_frames)}")
+
+
+# 依次显示未标注的图片（出现次数多的优先），输入框中为 OCR 的识别结果
+# 直接回车接受识别结果，输入文本修改，输入 '#' 丢弃，输入 'q' 退出（已标注的结果已保存）
+def label(rois=None, corpus_dir=HUD_CORPUS_DIR):
+    try:
+        from ocr import OCR
+        ocr = OCR()
+    except ImportError:
+        ocr = None
+
+    for roi in rois or ROI_BOXES:
+        labels = load_labels(roi, corpus_dir)
+        pending = sorted((name for name, (_, text) in labels.items() if text is None), key=lambda name: -labels[name][0])
+        for i, name in enumerate(pending):
+            image = cv2.imread(os.path.join(corpus_dir, roi, name))
+            cv2.imshow("hud roi", cv2.resize(image, None, fx=LABEL_SCALE, fy=LABEL_SCALE, interpolation=cv2.INTER_NEAREST))
+            cv2.waitKey(1)
+
+            suggestion = ""
+            if ocr:
+                results, _ = ocr.recognize(image)
+                if results and results[0]:
+                    suggestion = results[0][0].replace(" ", "")
+
+            answer = input(f"{roi} {i + 1}/{len(pending)} x{labels[name][0]} [{suggestion}]: ").strip()
+            if answer == "q":
+                cv2.destroyAllWindows()
+                return
+            text = answer or suggestion
+            if not text:
+                continue
+            labels[name][1] = text
+            save_labels(roi, labels, corpus_dir)
+
+    cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    extract()
+    label()
@@ -0,0 +1,263 @@
+import numpy as np
+
+import brotato
+from model_paths import MODEL_DIR
+
+import json
+import os
+
+HUD_LAYOUT_FILE = os.path.join(MODEL_DIR, "hud_layout.json")
+
+REFERENCE_WIDTH = brotato.WIDTH
+REFERENCE_HEIGHT = brotato.HEIGHT
+
+# 参考画面（960x540）中用于定位的 HUD 元素，xyxy
+ANCHOR_HP_BAR_XYXY = [17, 16, 167, 32]          # 血条（红色），宽度随生命值变化，只使用左上角和高度
+ANCHOR_MATERIAL_ICON_XYXY = [20, 71, 32, 88]    # 材料图标（绿色）
+ANCHOR_WAVE_XYXY = [450, 12, 510, 31]           # '第10波'，宽度随波次变化，使用水平中心
+ANCHOR_TIMER_XYXY = [465, 46, 495, 65]          # '57'，宽度随数字变化，使用水平中心
+
+SEARCH_MARGIN = 8           # 在参考坐标中扩大搜索范围的像素数，不能覆盖到相邻的经验条
+MIN_UI_SCALE = 0.5          # 游戏 UI 缩放相对于画面高度比例的范围，用于搜索血条
+MAX_UI_SCALE = 2.0
+MAX_SCALE_DEVIATION = 0.25  # 各锚点缩放比例与血条缩放比例的最大偏差
+MAX_LAYOUT_OFFSET = 3       # 校准的 ROI 与按 UI 缩放比例等比例计算的 ROI 的最大偏差（参考坐标中的像素数），超过时不缓存
+
+
+def red_mask(image):
+    b, g, r = image[..., 0], image[..., 1], image[..., 2]
+    return (r > 150) & (g < 80) & (b < 80)
+
+def green_mask(image):
+    b, g, r = [image[..., i].astype(np.int16) for i in range(3)]
+    return (g > 120) & (g > r + 40) & (g > b + 40)
+
+def white_mask(image):
+    return (image > 200).all(axis=-1)
+
+
+# 血条填充比例（0~1），血条上的 HP 文字只覆盖中间几行，任意一行为红色的列即为已填充
+def bar_fill(frame, bar_xyxy):
+    x, y, x1, y1 = bar_xyxy
+    return float(red_mask(frame[y:y1, x:x1]).any(axis=0).mean())
+
+
+class HudLayout:
+    """HUD ROIs and map area for one frame size, same structure as the ``brotato.BOX_*`` lists."""
+
+    def __init__(self, width, height, hp, material, wave, timer, wave_result, map_area, hp_bar=None):
+        self.width = width
+        self.height = height
+
+        self.hp = hp
+        self.material = material
+        self.wave = wave
+        self.timer = timer
+        self.wave_result = wave_result
+        self.map_area = map_area    # xywh
+        # 满血时的血条区域，xyxy；旧版本缓存的布局没有该字段，按画面尺寸等比例缩放
+        self.hp_bar = hp_bar or scale_box(ANCHOR_HP_BAR_XYXY, width / REFERENCE_WIDTH, height / REFERENCE_HEIGHT)
+
+    @classmethod
+    def default(cls):
+        return cls(REFERENCE_WIDTH, REFERENCE_HEIGHT,
+                   brotato.BOX_HP_XYXY,
+                   brotato.BOX_MATERIAL_XYXY,
+                   brotato.BOX_WAVE_XYXY,
+                   brotato.BOX_TIMER_XYXY,
+                   brotato.BOX_WAVE_RESULT_XYXY,
+                   list(brotato.MAP_AREA_XYWH),
+                   list(ANCHOR_HP_BAR_XYXY))
+
+    # 按画面尺寸等比例缩放，用于无法校准时
+    @classmethod
+    def scaled(cls, width, height):
+        sx = width / REFERENCE_WIDTH
+        sy = height / REFERENCE_HEIGHT
+
+        def scale_boxes(boxes):
+            return [scale_box(box, sx, sy) for box in boxes]
+
+        x, y, w, h = brotato.MAP_AREA_XYWH
+        return cls(width, height,
+                   scale_boxes(brotato.BOX_HP_XYXY),
+                   scale_boxes(brotato.BOX_MATERIAL_XYXY),
+                   scale_boxes(brotato.BOX_WAVE_XYXY),
+                   scale_boxes(brotato.BOX_TIMER_XYXY),
+                   scale_boxes(brotato.BOX_WAVE_RESULT_XYXY),
+                   [round(x * sx), round(y * sy), round(w * sx), round(h * sy)],
+                   scale_box(ANCHOR_HP_BAR_XYXY, sx, sy))
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def scale_box(box, sx, sy):
+    x, y, x1, y1 = box
+    return [round(x * sx), round(y * sy), round(x1 * sx), round(y1 * sy)]
+
+
+# HUD 按 UI 缩放比例 scale 绘制：左上角的元素以画面左上角为原点，波次和倒计时以画面顶部中心为原点
+def expected_box(anchor_xyxy, scale, width, center=False):
+    x, y, x1, y1 = anchor_xyxy
+    origin = 0
+    if center:
+        origin = width / 2
+        x, x1 = x - REFERENCE_WIDTH / 2, x1 - REFERENCE_WIDTH / 2
+    return [origin + x * scale, y * scale, origin + x1 * scale, y1 * scale]
+
+
+def anchor_scale(anchor_xyxy, found_xyxy):
+    return (found_xyxy[3] - found_xyxy[1]) / (anchor_xyxy[3] - anchor_xyxy[1])
+
+
+# 在 search_xyxy（画面坐标）外扩 margin 像素的范围内查找 mask 的外接框
+def find_anchor(frame, search_xyxy, mask_func, margin):
+    x, y, x1, y1 = search_xyxy
+    left = max(int(x - margin), 0)
+    top = max(int(y - margin), 0)
+    right = min(int(x1 + margin), frame.shape[1])
+    bottom = min(int(y1 + margin), frame.shape[0])
+
+    ys, xs = np.nonzero(mask_func(frame[top:bottom, left:right]))
+    if len(xs) == 0:
+        return None
+    return [left + int(xs.min()), top + int(ys.min()), left + int(xs.max()) + 1, top + int(ys.max()) + 1]
+
+
+# 锚点的原点：垂直方向取中心（缩放后上下边缘各被模糊约 1 像素，中心不受影响），水平方向宽度固定的锚点取中心，否则取左边缘
+def anchor_origin(xyxy, center=False):
+    x, y, x1, y1 = xyxy
+    return ((x + x1) / 2 if center else x), (y + y1) / 2
+
+
+# 以锚点为原点映射参考坐标中的 ROI，所有 ROI 使用校准得到的同一个 UI 缩放比例
+def map_boxes(boxes, anchor_xyxy, found_xyxy, scale, center=False):
+    ax, ay = anchor_origin(anchor_xyxy, center)
+    fx, fy = anchor_origin(found_xyxy, center)
+    return [[round(fx + (x - ax) * scale), round(fy + (y - ay) * scale),
+             round(fx + (x1 - ax) * scale), round(fy + (y1 - ay) * scale)] for x, y, x1, y1 in boxes]
+
+
+# 校准的 ROI 与按 UI 缩放比例等比例计算的位置（见 expected_box）比较，返回偏差最大的 (名称, 校准, 预期)，都在范围内时返回 None
+def check_layout(layout, scale):
+    groups = [
+        ("hp", layout.hp, brotato.BOX_HP_XYXY, False),
+        ("material", layout.material, brotato.BOX_MATERIAL_XYXY, False),
+        ("wave", layout.wave, brotato.BOX_WAVE_XYXY, True),
+        ("timer", layout.timer, brotato.BOX_TIMER_XYXY, True),
+        ("wave_result", layout.wave_result, brotato.BOX_WAVE_RESULT_XYXY, True),
+        ("hp_bar", [layout.hp_bar], [ANCHOR_HP_BAR_XYXY], False),
+    ]
+    worst = None
+    worst_offset = MAX_LAYOUT_OFFSET * scale
+    for name, boxes, reference_boxes, center in groups:
+        for box, reference_box in zip(boxes, reference_boxes):
+            expected = expected_box(reference_box, scale, layout.width, center)
+            offset = max(abs(a - b) for a, b in zip(box, expected))
+            if offset > worst_offset:
+                worst_offset = offset
+                worst = (name, box, [round(v) for v in expected])
+    return worst
+
+
+# 在原生分辨率的波次画面中定位 HUD 元素，失败时返回 None
+def calibrate(frame):
+    height, width = frame.shape[:2]
+    sx = width / REFERENCE_WIDTH
+    sy = height / REFERENCE_HEIGHT
+
+    # 血条的位置不随生命值变化，先在左上角较大的范围内（地图区域之上）查找血条，由其垂直中心得到 UI 缩放比例
+    # （缩放后血条上下边缘各有约 1 像素被模糊，按高度或下边缘计算的比例偏小）
+    smallest = expected_box(ANCHOR_HP_BAR_XYXY, sy * MIN_UI_SCALE, width)
+    largest = expected_box(ANCHOR_HP_BAR_XYXY, sy * MAX_UI_SCALE, width)
+    hp_bar_search = smallest[:2] + [largest[2], min(largest[3], brotato.MAP_AREA_XYWH[1] * sy)]
+    hp_bar = find_anchor(frame, hp_bar_search, red_mask, SEARCH_MARGIN * sy)
+    if hp_bar is None:
+        return None
+    scale = anchor_origin(hp_bar)[1] / anchor_origin(ANCHOR_HP_BAR_XYXY)[1]
+    if not (MIN_UI_SCALE <= scale / sy <= MAX_UI_SCALE):
+        print(f"hud calibrate failed, hp bar: {hp_bar}, scale: {scale:.2f}")
+        return None
+
+    # 其他锚点在按该比例预测的位置查找，各自的缩放比例需要与血条一致
+    margin = SEARCH_MARGIN * scale
+    material_icon = find_anchor(frame, expected_box(ANCHOR_MATERIAL_ICON_XYXY, scale, width), green_mask, margin)
+    wave = find_anchor(frame, expected_box(ANCHOR_WAVE_XYXY, scale, width, center=True), white_mask, margin)
+    timer = find_anchor(frame, expected_box(ANCHOR_TIMER_XYXY, scale, width, center=True), white_mask, margin)
+    if material_icon is None or wave is None:
+        return None
+
+    anchors = [(ANCHOR_MATERIAL_ICON_XYXY, material_icon), (ANCHOR_WAVE_XYXY, wave)]
+    if timer is not None:
+        anchors.append((ANCHOR_TIMER_XYXY, timer))
+    for anchor_xyxy, found_xyxy in anchors:
+        found_scale = anchor_scale(anchor_xyxy, found_xyxy)
+        if abs(found_scale / scale - 1) > MAX_SCALE_DEVIATION:
+            print(f"hud calibrate failed, anchor: {anchor_xyxy}, found: {found_xyxy}, scale: {found_scale:.2f}, hp bar scale: {scale:.2f}")
+            return None
+
+    if timer is not None:
+        timer_boxes = map_boxes(brotato.BOX_TIMER_XYXY, ANCHOR_TIMER_XYXY, timer, scale, center=True)
+    else:
+        timer_boxes = map_boxes(brotato.BOX_TIMER_XYXY, ANCHOR_WAVE_XYXY, wave, scale, center=True)
+
+    x, y, w, h = brotato.MAP_AREA_XYWH
+    layout = HudLayout(width, height,
+                       map_boxes(brotato.BOX_HP_XYXY, ANCHOR_HP_BAR_XYXY, hp_bar, scale),
+                       map_boxes(brotato.BOX_MATERIAL_XYXY, ANCHOR_MATERIAL_ICON_XYXY, material_icon, scale, center=True),
+                       map_boxes(brotato.BOX_WAVE_XYXY, ANCHOR_WAVE_XYXY, wave, scale, center=True),
+                       timer_boxes,
+                       map_boxes(brotato.BOX_WAVE_RESULT_XYXY, ANCHOR_WAVE_XYXY, wave, scale, center=True),
+                       [round(x * sx), round(y * sy), round(w * sx), round(h * sy)],
+                       map_boxes([ANCHOR_HP_BAR_XYXY], ANCHOR_HP_BAR_XYXY, hp_bar, scale)[0])
+
+    # 锚点误检（如找到了相邻的经验条）时 ROI 会整体偏移，这样的布局不缓存
+    worst = check_layout(layout, scale)
+    if worst is not None:
+        name, box, expected = worst
+        print(f"hud calibrate failed, {name}: {box}, expected: {expected}, scale: {scale:.2f}")
+        return None
+    return layout
+
+
+def load_layouts(path=HUD_LAYOUT_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_layout(layout, path=HUD_LAYOUT_FILE):
+    layouts = load_layouts(path)
+    layouts[f"{layout.width}x{layout.height}"] = layout.to_dict()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(layouts, f, indent=2)
+    os.replace(temp_path, path)
+
+
+# 按分辨率读取缓存的布局，没有缓存时在当前画面上校准并保存；校准失败时使用等比例缩放的布局，不缓存
+def get_layout(frame, path=HUD_LAYOUT_FILE):
+    height, width = frame.shape[:2]
+    if (width, height) == (REFERENCE_WIDTH, REFERENCE_HEIGHT):
+        return HudLayout.default()
+
+    layouts = load_layouts(path)
+    key = f"{width}x{height}"
+    if key in layouts:
+        return HudLayout.from_dict(layouts[key])
+
+    layout = calibrate(frame)
+    if layout is None:
+        return HudLayout.scaled(width, height)
+
+    save_layout(layout, path)
+    print(f"hud layout calibrated: {key}")
+    return layout
@@ -0,0 +1,74 @@
+import gymnasium as gym
+import torch
+from torch import nn
+
+from stable_baselines3.common.torch_layers import BaseFeaturesExtractor
+
+LIGHT_CNN_CHANNELS = (16, 32, 64, 64)   # 第一层为 8x8 步长 4 的普通卷积（与 NatureCNN 第一层的感受野相同），之后每层为步长 2 的深度可分离卷积
+LIGHT_CNN_FEATURES_DIM = 256
+
+
+class SeparableConv(nn.Module):
+    """3x3 depthwise conv followed by a 1x1 pointwise conv and ReLU."""
+
+    def __init__(self, in_channels, out_channels, stride=2):
+        super().__init__()
+        self.depthwise = nn.Conv2d(in_channels, in_channels, 3, stride=stride, padding=1, groups=in_channels)
+        self.pointwise = nn.Conv2d(in_channels, out_channels, 1)
+        self.activation = nn.ReLU()
+
+    def forward(self, x):
+        return self.activation(self.pointwise(self.depthwise(x)))
+
+
+class SpatialSoftmax(nn.Module):
+    """Expected (x, y) position of each channel's softmax over the feature map, in [-1, 1]."""
+
+    def __init__(self, height, width):
+        super().__init__()
+        pos_y, pos_x = torch.meshgrid(torch.linspace(-1, 1, height), torch.linspace(-1, 1, width), indexing="ij")
+        self.register_buffer("pos_x", pos_x.reshape(-1))
+        self.register_buffer("pos_y", pos_y.reshape(-1))
+        self.temperature = nn.Parameter(torch.ones(1))
+
+    def forward(self, x):
+        attention = torch.softmax(x.flatten(2) / self.temperature, dim=-1)
+        keypoints = torch.stack([attention @ self.pos_x, attention @ self.pos_y], dim=-1)
+        return keypoints.flatten(1)
+
+
+class LightCnn(BaseFeaturesExtractor):
+    """Small CNN features extractor for the map observation, for CPU training.
+
+    An 8x8 stride-4 conv followed by strided depthwise-separable convs. The
+    head either flattens the last feature map or, with
+    ``spatial_softmax=True``, reduces each channel to the coordinates of its
+    activation peak before the linear layer.
+    """
+
+    def __init__(self, observation_space: gym.spaces.Box, features_dim=LIGHT_CNN_FEATURES_DIM,
+                 channels=LIGHT_CNN_CHANNELS, spatial_softmax=False):
+        super().__init__(observation_space, features_dim)
+        n_input_channels = observation_space.shape[0]
+
+        # 第一层在完整分辨率上计算，步长 2 的 3x3 卷积比 NatureCNN 整体还慢（见 extractor_benchmark.py）
+        layers = [nn.Conv2d(n_input_channels, channels[0], 8, stride=4, padding=2), nn.ReLU()]
+        for in_channels, out_channels in zip(channels[:-1], channels[1:]):
+            layers.append(SeparableConv(in_channels, out_channels))
+        self.cnn = nn.Sequential(*layers)
+
+        # 由一次前向计算得到最后一层特征图的尺寸
+        with torch.no_grad():
+            feature_map = self.cnn(torch.as_tensor(observation_space.sample()[None]).float())
+        _, n_channels, height, width = feature_map.shape
+
+        if spatial_softmax:
+            self.head = SpatialSoftmax(height, width)
+            n_flatten = n_channels * 2
+        else:
+            self.head = nn.Flatten()
+            n_flatten = n_channels * height * width
+        self.linear = nn.Sequential(nn.Linear(n_flatten, features_dim), nn.ReLU())
+
+    def forward(self, observations: torch.Tensor) -> torch.Tensor:
+        return self.linear(self.head(self.cnn(observations)))
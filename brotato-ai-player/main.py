@@ -1,18 +1,38 @@
 import keyboard
 import time
 
-from stable_baselines3 import PPO
+from startup import StartupProfiler
+from model_paths import MODEL_FILE, POLICY_ONNX_FILE
 
-from train_ppo import MODEL_FILE
-from brotato_env import BrotatoEnv
+PLAY_ONNX = False       # True 时使用导出的 ONNX 策略（onnx_policy.py），不加载 torch
+DETERMINISTIC = False   # True 时选择概率最大的动作，False 时按概率采样（与 SB3 predict 默认一致）
 
-def play():
-    env = BrotatoEnv()
-    model = PPO.load(MODEL_FILE)
+def play(use_onnx=PLAY_ONNX, deterministic=DETERMINISTIC):
+    profiler = StartupProfiler()
+
+    # 延迟导入，启动分析中单独统计导入耗时
+    with profiler.stage("import"):
+        from brotato_env import BrotatoEnv
+        if use_onnx:
+            from onnx_policy import OnnxPolicy
+        else:
+            from stable_baselines3 import PPO
+
+    with profiler.stage("model load"):
+        env = BrotatoEnv()
+        if use_onnx:
+            model = OnnxPolicy(POLICY_ONNX_FILE)
+        else:
+            model = PPO.load(MODEL_FILE)
+
+    with profiler.stage("warm-up"):
+        env.warmup()
+
+    profiler.report()
 
     obs, info = env.reset()
     while not keyboard.is_pressed('q'):
-        action, _states = model.predict(obs)
+        action, _states = model.predict(obs, deterministic=deterministic)
         obs, reward, terminated, truncated, info = env.step(action)
         env.render()
         if terminated:
@@ -0,0 +1,30 @@
+import os
+
+MODEL_DIR = "models"
+LOG_DIR = "logs"
+
+# 每回合结果的列式存储（episode_store.py）
+EPISODE_DIR = os.path.join(LOG_DIR, "episodes")
+
+# 强化学习模型
+MODEL_NAME = "ppo_brotato"
+MODEL_FILE = os.path.join(MODEL_DIR, MODEL_NAME + '.zip')
+
+# 图像分类模型
+CLS_MODEL_PATH = os.path.join(MODEL_DIR, "brotato-cls.onnx")
+# 图像分类模型的 PyTorch 权重（训练输出的 best.pt），增量训练的起点
+CLS_WEIGHTS_PATH = os.path.join(MODEL_DIR, "brotato-cls.pt")
+
+# onnxruntime 图优化后的模型缓存目录
+ORT_CACHE_DIR = os.path.join(MODEL_DIR, "ort_cache")
+
+# 导出的策略网络（actor），用于不依赖 torch 的运行模式
+POLICY_ONNX_FILE = os.path.join(MODEL_DIR, MODEL_NAME + '.onnx')
+
+# 图像分类数据集（train_img_cls.py 中的 brotato-cls）
+DATASET_DIR = os.path.join("datasets", "brotato-cls")
+
+# 标注的 HUD 区域图片（hud_corpus.py），用于比较 OCR 方案的准确率和耗时
+HUD_CORPUS_DIR = os.path.join("datasets", "hud-rois")
+# 模板匹配 OCR 的字符模板，由 ocr_benchmark.py 从标注图片生成
+OCR_TEMPLATE_FILE = os.path.join(MODEL_DIR, "ocr_templates.npz")
@@ -0,0 +1,96 @@
+import brotato
+import brotato_action
+
+import time
+
+Scene = brotato.Scene
+
+# 进入下一波前不购买、不刷新商店，按键序列需要根据游戏版本的界面布局调整
+SHOP_SKIP_KEYS = ['down', 'down', 'down', 'down', 'right', 'right', 'right', 'right', 'enter']
+
+# 各场景的默认操作（按键序列），未配置的场景不操作
+DEFAULT_POLICY = {
+    Scene.MAIN_MENU: ['enter'],                 # 开始游戏
+    Scene.CHARACTER_SELECTION: ['enter'],       # 选择默认选中的角色
+    Scene.WEAPON_SELECTION: ['enter'],          # 选择默认选中的武器
+    Scene.DIFFICULTY_SELECTION: ['enter'],      # 选择默认选中的难度
+
+    Scene.WAVE_END: ['enter'],                  # retry failed waves
+    Scene.SHOP: SHOP_SKIP_KEYS,
+    Scene.LEVEL_UP: ['enter'],                  # 选择第一个升级
+    Scene.ITEM_FOUND: ['enter'],                # 拿取物品
+    Scene.RUN_END: ['enter'],                   # 开始新的一局
+
+    Scene.PAUSE_MENU: ['enter'],                # 继续游戏
+    Scene.CONFIRM_MENU: ['enter'],
+}
+
+FALLBACK_KEYS = ['esc']     # 同一场景多次操作无效时尝试返回
+MAX_ATTEMPTS = 10
+ACTION_INTERVAL = 1.0       # 两次操作之间等待界面响应的时间
+
+
+class MenuNavigator:
+    """State machine clearing menu screens between waves.
+
+    ``handle(scene)`` is called with the currently classified scene until the
+    wave starts. Each scene maps to a key sequence from the policy; a scene
+    that does not change after ``MAX_ATTEMPTS`` tries gets ``FALLBACK_KEYS``.
+    Time spent in each menu scene is accumulated per scene name.
+    """
+
+    def __init__(self, policy=None, max_attempts=MAX_ATTEMPTS, action_interval=ACTION_INTERVAL):
+        self.policy = dict(DEFAULT_POLICY)
+        if policy:
+            self.policy.update(policy)
+        self.max_attempts = max_attempts
+        self.action_interval = action_interval
+
+        self.current_scene = None
+        self.scene_start = 0.0
+        self.attempts = 0
+        self.last_action_time = 0.0
+
+        self.scene_time = {}        # 本次导航各场景耗时
+        self.total_scene_time = {}  # 累计各场景耗时
+        self.stall_count = 0
+
+    def handle(self, scene):
+        now = time.time()
+        if scene != self.current_scene:
+            self.__record(now)
+            self.current_scene = scene
+            self.scene_start = now
+            self.attempts = 0
+
+        keys = self.policy.get(scene)
+        if not keys or now - self.last_action_time < self.action_interval:
+            return
+
+        if self.attempts >= self.max_attempts:
+            self.stall_count += 1
+            print(f"navigator stall: {scene.name}, attempts: {self.attempts}")
+            keys = FALLBACK_KEYS
+            self.attempts = 0
+
+        self.attempts += 1
+        brotato_action.press_keys(keys)
+        self.last_action_time = time.time()
+
+    # 进入波次后调用，返回本次导航各场景耗时
+    def finish(self) -> dict:
+        self.__record(time.time())
+        self.current_scene = None
+
+        scene_time = self.scene_time
+        self.scene_time = {}
+        return scene_time
+
+    def __record(self, now):
+        if self.current_scene is None:
+            return
+
+        name = self.current_scene.name
+        elapsed = now - self.scene_start
+        self.scene_time[name] = self.scene_time.get(name, 0.0) + elapsed
+        self.total_scene_time[name] = self.total_scene_time.get(name, 0.0) + elapsed
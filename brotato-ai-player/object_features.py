@@ -0,0 +1,141 @@
+import numpy as np
+import cv2
+
+import math
+
+# 在缩小后的地图区域上检测，参考分辨率下地图为 900x430
+DETECT_SCALE = 1 / 2
+
+N_NEAREST = 4       # 每类物体保留最近的数量
+N_SECTORS = 8       # 以玩家为中心按方向划分的扇区数
+MAX_SECTOR_COUNT = 8
+
+# 连通域面积范围，检测尺度下的像素数；敌人描边面积较大，可以过滤地面装饰和地图边缘
+BLOB_AREA_RANGE = [
+    (60, 2000),     # enemy
+    (4, 400),       # projectile
+    (4, 400),       # material
+]
+PLAYER_MIN_AREA = 40
+PLAYER_DISTANCE_WEIGHT = 4.0    # 玩家候选按 面积 * exp(-w * 与上次位置的距离) 选择，镜头跟随玩家，默认在中心
+PLAYER_EXCLUDE_RADIUS = 0.06    # 玩家附近（武器、描边）的检测结果不计入敌人，相对地图宽度
+
+ENEMY = 0
+PROJECTILE = 1
+MATERIAL = 2
+OBJECT_NAMES = ["enemy", "projectile", "material"]
+
+# 玩家位置 (x, y)，每类物体：最近 N 个的 (dx, dy, present) 及各扇区数量
+N_FEATURES = 2 + len(OBJECT_NAMES) * (N_NEAREST * 3 + N_SECTORS)
+
+
+def split_channels(image):
+    return [image[..., i].astype(np.int16) for i in range(3)]
+
+# 敌人有较粗的黑色描边
+def enemy_mask(image):
+    return cv2.inRange(image, (0, 0, 0), (59, 59, 59))
+
+# 子弹等投射物为亮黄色
+def projectile_mask(image):
+    b, g, r = split_channels(image)
+    return (r > 230) & (g > 210) & (b < 180)
+
+# 材料为发光的绿色
+def material_mask(image):
+    b, g, r = split_channels(image)
+    return (g > 120) & (g > r + 40) & (g > b + 40)
+
+# 玩家及其武器为低饱和度的亮色
+def player_mask(image):
+    b, g, r = cv2.split(image)
+    low = cv2.min(cv2.min(b, g), r)
+    high = cv2.max(cv2.max(b, g), r)
+    return (low > 170) & (cv2.subtract(high, low) < 40)
+
+
+class ObjectFeatureExtractor:
+    """Fixed-size object-level features from the map crop.
+
+    Objects are found with colour masks and connected components; positions
+    are relative to the player and normalised by the map size, so the vector
+    lies in [-1, 1].
+    """
+
+    def __init__(self):
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        self.player = (0.5, 0.5)
+        self.features = np.zeros((N_FEATURES,), dtype=np.float32)
+
+    def reset(self):
+        self.player = (0.5, 0.5)
+
+    # map_image 为 BGR 地图区域，返回 float32 特征向量（每次调用返回同一数组）
+    def extract(self, map_image):
+        height, width = map_image.shape[:2]
+        size = (max(int(width * DETECT_SCALE), 1), max(int(height * DETECT_SCALE), 1))
+        image = cv2.resize(map_image, size, interpolation=cv2.INTER_NEAREST)
+
+        self.player = self.__find_player(image)
+        px, py = self.player
+
+        features = self.features
+        features[:] = 0.0
+        features[0] = px * 2 - 1
+        features[1] = py * 2 - 1
+
+        offset = 2
+        for index, mask_func in enumerate((enemy_mask, projectile_mask, material_mask)):
+            centers = self.__find_blobs(image, mask_func, BLOB_AREA_RANGE[index])
+            if len(centers):
+                deltas = centers - np.array(self.player, dtype=np.float32)
+                if index == ENEMY:
+                    deltas = deltas[np.hypot(*deltas.T) > PLAYER_EXCLUDE_RADIUS]
+                self.__fill_category(features[offset:offset + N_NEAREST * 3 + N_SECTORS], deltas)
+            offset += N_NEAREST * 3 + N_SECTORS
+        return features
+
+    # 返回各连通域中心的归一化坐标 (n, 2)
+    def __find_blobs(self, image, mask_func, area_range):
+        mask = mask_func(image).astype(np.uint8)
+        mask = cv2.dilate(mask, self.kernel)
+        n, _, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+        area = stats[1:, cv2.CC_STAT_AREA]
+        keep = (area >= area_range[0]) & (area <= area_range[1])
+        centers = centroids[1:][keep].astype(np.float32)
+        centers[:, 0] /= image.shape[1]
+        centers[:, 1] /= image.shape[0]
+        return centers
+
+    # 玩家为上次位置附近较大的亮色连通域（角色和周围的武器），找不到时保留上一次的位置
+    def __find_player(self, image):
+        mask = cv2.dilate(player_mask(image).astype(np.uint8), self.kernel, iterations=3)
+        n, _, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+        area = stats[1:, cv2.CC_STAT_AREA]
+        centers = centroids[1:] / (image.shape[1], image.shape[0])
+        valid = area >= PLAYER_MIN_AREA
+        if not valid.any():
+            return self.player
+
+        distances = np.hypot(*(centers - self.player).T)
+        scores = np.where(valid, area * np.exp(-PLAYER_DISTANCE_WEIGHT * distances), 0.0)
+        x, y = centers[scores.argmax()]
+        return float(x), float(y)
+
+    def __fill_category(self, out, deltas):
+        if len(deltas) == 0:
+            return
+
+        distances = np.hypot(deltas[:, 0], deltas[:, 1])
+        order = np.argsort(distances)[:N_NEAREST]
+        for i, j in enumerate(order):
+            out[i * 3] = deltas[j, 0]
+            out[i * 3 + 1] = deltas[j, 1]
+            out[i * 3 + 2] = 1.0
+
+        angles = np.arctan2(deltas[:, 1], deltas[:, 0])
+        sectors = ((angles + math.pi) / (2 * math.pi) * N_SECTORS).astype(np.int64) % N_SECTORS
+        counts = np.bincount(sectors, minlength=N_SECTORS)
+        out[N_NEAREST * 3:] = np.minimum(counts, MAX_SECTOR_COUNT) / MAX_SECTOR_COUNT
@@ -0,0 +1,88 @@
+import numpy as np
+import cv2
+import gymnasium as gym
+
+import brotato
+from brotato_action import N_DISCRETE_ACTIONS
+from model_paths import DATASET_DIR
+from obs_profiles import PROFILES, ObservationPreprocessor
+
+import glob
+import os
+import time
+
+PREPROCESS_RUNS = 200
+UPDATE_N_STEPS = 512
+UPDATE_BATCH_SIZE = 64
+UPDATE_N_EPOCHS = 2
+
+
+class RandomImageEnv(gym.Env):
+    """Env returning random observations of a profile, used to time PPO updates without the game."""
+
+    def __init__(self, shape):
+        super().__init__()
+        self.observation_space = gym.spaces.Box(low=0, high=255, shape=shape, dtype=np.uint8)
+        self.action_space = gym.spaces.Discrete(N_DISCRETE_ACTIONS)
+        self.obs = self.observation_space.sample()
+
+    def reset(self, seed=None, options=None):
+        return self.obs, {}
+
+    def step(self, action):
+        return self.obs, 0.0, False, False, {}
+
+
+# 使用数据集中的波次画面，没有数据集时使用随机画面
+def load_frames():
+    paths = sorted(glob.glob(os.path.join(DATASET_DIR, "*", "04_WAVE", "*.jpg")))
+    frames = [cv2.resize(cv2.imread(path), (brotato.WIDTH, brotato.HEIGHT)) for path in paths]
+    if not frames:
+        frames = [np.random.randint(0, 256, (brotato.HEIGHT, brotato.WIDTH, brotato.N_CHANNELS), dtype=np.uint8)]
+    return frames
+
+
+# 返回每帧预处理耗时（ms），包括从画面中截取地图区域
+def measure_preprocess(profile, frames, runs=PREPROCESS_RUNS):
+    preprocessor = ObservationPreprocessor(profile)
+    x, y, w, h = brotato.MAP_AREA_XYWH
+
+    start = time.perf_counter()
+    for i in range(runs):
+        frame = frames[i % len(frames)]
+        preprocessor.process(frame[y:y + h, x:x + w])
+    return (time.perf_counter() - start) / runs * 1000
+
+
+# 返回 PPO 更新的吞吐量（样本数 * epoch / 秒）
+def measure_update(profile, n_steps=UPDATE_N_STEPS, batch_size=UPDATE_BATCH_SIZE, n_epochs=UPDATE_N_EPOCHS):
+    import torch
+    from stable_baselines3 import PPO
+    from rollout_buffer import Uint8RolloutBuffer
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    env = RandomImageEnv(PROFILES[profile].shape())
+    model = PPO("CnnPolicy", env, n_steps=n_steps, batch_size=batch_size, n_epochs=n_epochs,
+                rollout_buffer_class=Uint8RolloutBuffer, device=device, verbose=0)
+
+    # 第一次 learn 采集 rollout 并完成预热，之后在同一个 rollout 上计时
+    model.learn(total_timesteps=n_steps)
+    start = time.perf_counter()
+    model.train()
+    elapsed = time.perf_counter() - start
+    return n_steps * n_epochs / elapsed
+
+
+def benchmark(profiles=None, update=True):
+    frames = load_frames()
+    print(f"frames: {len(frames)}")
+
+    for name in profiles or PROFILES:
+        info = f"{name:>9}: shape: {str(PROFILES[name].shape()):>14}, preprocess: {measure_preprocess(name, frames):.3f} ms"
+        if update:
+            info += f", update: {measure_update(name):.0f} samples/s"
+        print(info)
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,78 @@
+import numpy as np
+import cv2
+
+import brotato
+
+EDGE_THRESHOLDS = (50, 150)     # Canny 阈值
+
+MODE_RGB = "rgb"
+MODE_GRAY = "gray"
+MODE_EDGE = "edge"              # 灰度边缘图
+MODE_DIFF = "diff"              # 灰度图和与上一帧的差分图，两个通道
+
+
+class ObservationProfile:
+    """Map-area observation format: colour mode and scale of the crop."""
+
+    def __init__(self, name, mode, scale):
+        self.name = name
+        self.mode = mode
+        self.scale = scale
+
+        self.width = int(brotato.MAP_AREA_XYWH[2] * scale)
+        self.height = int(brotato.MAP_AREA_XYWH[3] * scale)
+        self.channels = {MODE_RGB: brotato.N_CHANNELS, MODE_DIFF: 2}.get(mode, 1)
+
+    def shape(self):
+        return (self.height, self.width, self.channels)
+
+
+PROFILES = {profile.name: profile for profile in [
+    ObservationProfile("rgb-1/4", MODE_RGB, 1 / 4),
+    ObservationProfile("gray-1/4", MODE_GRAY, 1 / 4),
+    ObservationProfile("gray-1/8", MODE_GRAY, 1 / 8),
+    ObservationProfile("edge-1/4", MODE_EDGE, 1 / 4),
+    ObservationProfile("diff-1/4", MODE_DIFF, 1 / 4),
+]}
+DEFAULT_PROFILE = "rgb-1/4"
+
+
+class ObservationPreprocessor:
+    """Turns the map crop into the observation of one profile.
+
+    The crop is resized first and the colour conversion runs on the small
+    image, into preallocated buffers; only the returned observation is a new
+    array.
+    """
+
+    def __init__(self, profile=DEFAULT_PROFILE):
+        self.profile = PROFILES[profile] if isinstance(profile, str) else profile
+        size = (self.profile.height, self.profile.width)
+
+        self.resized = np.empty((*size, brotato.N_CHANNELS), dtype=np.uint8)
+        self.gray = np.empty(size, dtype=np.uint8)
+        self.diff = np.empty(size, dtype=np.uint8)
+        self.prev_gray = None
+
+    def reset(self):
+        self.prev_gray = None
+
+    # map_image 为 BGR 地图区域，返回 (height, width, channels) 的 uint8 观测
+    def process(self, map_image):
+        profile = self.profile
+        cv2.resize(map_image, (profile.width, profile.height), dst=self.resized)
+        if profile.mode == MODE_RGB:
+            return self.resized.copy()
+
+        cv2.cvtColor(self.resized, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        if profile.mode == MODE_GRAY:
+            return self.gray[..., np.newaxis].copy()
+        if profile.mode == MODE_EDGE:
+            return cv2.Canny(self.gray, *EDGE_THRESHOLDS)[..., np.newaxis]
+
+        # diff: 第一帧的差分为 0
+        if self.prev_gray is None:
+            self.prev_gray = self.gray.copy()
+        cv2.absdiff(self.gray, self.prev_gray, dst=self.diff)
+        self.prev_gray[...] = self.gray
+        return cv2.merge([self.gray, self.diff])
@@ -1,8 +1,45 @@
-from rapidocr_onnxruntime import RapidOCR
+from collections import OrderedDict
+import os
+import time
+
+import numpy as np
+import cv2
+
+from model_paths import OCR_TEMPLATE_FILE
+from startup import cache_optimized_model
+
+OCR_REC_MODEL = "ch_PP-OCRv4_rec_infer.onnx"   # rapidocr-onnxruntime 1.3.24 默认识别模型
+
+CACHE_ENTRIES = 4096        # CachedOCR 保存的最大结果数
+
+TEMPLATE_WIDTH = 8          # 模板匹配时字符缩放到的尺寸
+TEMPLATE_HEIGHT = 12
+MIN_TEXT_THRESHOLD = 120    # HUD 数字为白色，按最小通道的 Otsu 阈值二值化，阈值不低于该值（避免把背景作为文字）
+RED_TEXT_THRESHOLD = 100    # 倒计时最后几秒为红色数字，红色通道比其他通道高出该值的像素为文字
+MIN_CHAR_AREA = 4           # 小于该像素数的连通区域为噪点
+MAX_CHAR_ASPECT = 1.2       # 宽高比超过该值的连通区域为相连的多个字符，按 CHAR_ASPECT 等分
+CHAR_ASPECT = 0.7
+
+def default_rec_model_path():
+    import rapidocr_onnxruntime
+    return os.path.join(os.path.dirname(rapidocr_onnxruntime.__file__), "models", OCR_REC_MODEL)
 
 class OCR:
-    def __init__(self):
-        self.engine = RapidOCR()
+    # intra_threads/inter_threads 为 0 时使用 RapidOCR 的默认值
+    def __init__(self, optimized_cache=True, intra_threads=0, inter_threads=0):
+        from rapidocr_onnxruntime import RapidOCR
+
+        params = {}
+        if intra_threads > 0:
+            params["intra_op_num_threads"] = intra_threads
+        if inter_threads > 0:
+            params["inter_op_num_threads"] = inter_threads
+        if optimized_cache:
+            rec_model_path = default_rec_model_path()
+            if os.path.exists(rec_model_path):
+                params["rec_model_path"] = cache_optimized_model(rec_model_path)
+
+        self.engine = RapidOCR(**params)
 
     # RapidOCR use_det=True results:
     # [
@@ -13,3 +50,118 @@ class OCR:
     # [['20 / 20', 0.9370327]]
     def recognize(self, image, use_det=False):
         return self.engine(image, use_det, use_cls=False, use_rec=True)
+
+    # 仅识别（无检测），多张图像一次送入识别模型，返回与 recognize 相同格式的结果列表
+    # [([['20 / 20', 0.9370327]], elapse), ...]
+    def recognize_batch(self, images):
+        if not images:
+            return []
+
+        rec_results, elapse = self.engine.text_rec(list(images))
+        elapse = elapse / len(images)
+        return [([[text, conf]], elapse) for text, conf in rec_results]
+
+
+class CachedOCR:
+    """Memoizes an OCR engine's results by the exact pixels of the input image.
+
+    HUD regions often stay unchanged for many steps (timer, materials), so
+    repeated crops are answered from an LRU cache instead of the model.
+    """
+
+    def __init__(self, ocr, max_entries=CACHE_ENTRIES):
+        self.ocr = ocr
+        self.max_entries = max_entries
+        self.cache = OrderedDict()
+
+    def recognize(self, image):
+        start = time.perf_counter()
+        key = (image.shape, np.ascontiguousarray(image).tobytes())
+        results = self.cache.get(key)
+        if results is not None:
+            self.cache.move_to_end(key)
+            return results, time.perf_counter() - start
+
+        results, elapse = self.ocr.recognize(image)
+        self.cache[key] = results
+        if len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+        return results, elapse
+
+
+def text_mask(image):
+    low = image.min(axis=-1)
+    threshold, _ = cv2.threshold(low, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    mask = low > max(threshold, MIN_TEXT_THRESHOLD)
+    if not mask.any():
+        mask = image[..., 2].astype(np.int16) - image[..., :2].max(axis=-1) > RED_TEXT_THRESHOLD
+    return mask.astype(np.uint8)
+
+
+# 按连通区域切分字符，返回从左到右的字符图像（缩放到模板尺寸，取值 0~1）
+def segment_chars(image):
+    mask = text_mask(image)
+    n, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+    chars = []
+    for x, y, w, h, area in sorted(stats[1:n].tolist()):
+        if area < MIN_CHAR_AREA:
+            continue
+        k = max(1, round(w / (h * CHAR_ASPECT))) if w > h * MAX_CHAR_ASPECT else 1
+        for i in range(k):
+            x0, x1 = x + w * i // k, x + w * (i + 1) // k
+            char = cv2.resize(mask[y:y + h, x0:x1].astype(np.float32), (TEMPLATE_WIDTH, TEMPLATE_HEIGHT),
+                              interpolation=cv2.INTER_AREA)
+            chars.append(char.flatten())
+    return chars
+
+
+class TemplateOCR:
+    """Nearest-template reader for the white digits of the HUD (HP, timer, materials).
+
+    Templates are the mean character images of labelled HUD crops (see
+    ``hud_corpus.py``); ``recognize`` returns results in the same format as
+    ``OCR.recognize``, with the confidence of the worst matched character.
+    """
+
+    def __init__(self, template_path=OCR_TEMPLATE_FILE):
+        self.chars = []
+        self.templates = np.zeros((0, TEMPLATE_WIDTH * TEMPLATE_HEIGHT), dtype=np.float32)
+        if template_path and os.path.exists(template_path):
+            data = np.load(template_path)
+            self.chars = [str(char) for char in data["chars"]]
+            self.templates = data["templates"]
+
+    # samples 为 [(image, text)]，只使用切分出的字符数与文本长度相同的样本，返回使用的样本数
+    def fit(self, samples):
+        groups = {}
+        used = 0
+        for image, text in samples:
+            text = text.replace(" ", "")
+            chars = segment_chars(image)
+            if len(chars) != len(text):
+                continue
+            used += 1
+            for char, label in zip(chars, text):
+                groups.setdefault(label, []).append(char)
+
+        self.chars = sorted(groups)
+        if groups:
+            self.templates = np.stack([np.mean(groups[label], axis=0) for label in self.chars]).astype(np.float32)
+        return used
+
+    def save(self, template_path=OCR_TEMPLATE_FILE):
+        os.makedirs(os.path.dirname(template_path), exist_ok=True)
+        np.savez(template_path, chars=np.array(self.chars), templates=self.templates)
+
+    def recognize(self, image):
+        start = time.perf_counter()
+        chars = segment_chars(image)
+        if not chars or not self.chars:
+            return [], time.perf_counter() - start
+
+        distances = ((np.stack(chars)[:, np.newaxis] - self.templates[np.newaxis]) ** 2).mean(axis=2)
+        best = distances.argmin(axis=1)
+        text = "".join(self.chars[i] for i in best)
+        conf = 1.0 - float(distances[np.arange(len(best)), best].max())
+        return [[text, conf]], time.perf_counter() - start
@@ -0,0 +1,111 @@
+import random
+import time
+
+import numpy as np
+import cv2
+
+from hud_corpus import ROI_BOXES, crop_text_box, labelled_samples
+from model_paths import OCR_TEMPLATE_FILE
+from ocr import CachedOCR, TemplateOCR
+from ocr_telemetry import ROI_HP, ROI_MATERIAL, ROI_TIMER
+
+MIN_ACCURACY = 0.99         # 推荐方案需要达到的准确率（按出现次数加权）
+TEMPLATE_SPLIT = 0.2        # 用于生成字符模板的图片比例，其余图片用于所有方案的评测
+TEMPLATE_ROIS = (ROI_HP, ROI_MATERIAL, ROI_TIMER)   # 模板匹配只支持数字区域
+SEED = 0
+
+
+# 返回 {区域: [(识别框内的图片, 出现次数, 文本)]}
+def load_corpus():
+    corpus = {}
+    for roi in ROI_BOXES:
+        samples = []
+        for path, count, text in labelled_samples(roi):
+            samples.append((crop_text_box(cv2.imread(path), roi, text), count, text))
+        corpus[roi] = samples
+    return corpus
+
+
+# 按区域随机划分模板图片和评测图片
+def split_corpus(corpus, ratio=TEMPLATE_SPLIT, seed=SEED):
+    rng = random.Random(seed)
+    fit_samples, eval_corpus = [], {}
+    for roi, samples in corpus.items():
+        samples = list(samples)
+        rng.shuffle(samples)
+        n_fit = int(len(samples) * ratio) if roi in TEMPLATE_ROIS else 0
+        fit_samples.extend((image, text) for image, _, text in samples[:n_fit])
+        eval_corpus[roi] = samples[n_fit:]
+    return fit_samples, eval_corpus
+
+
+# 返回 {名称: (识别器, 支持的区域)}，识别器的 recognize 与 OCR.recognize 格式相同
+def make_readers(fit_samples):
+    readers = {}
+    try:
+        from ocr import OCR
+        readers["rapidocr"] = (OCR(optimized_cache=False), None)
+        readers["rapidocr-opt"] = (OCR(), None)
+        readers["cached"] = (CachedOCR(OCR()), None)
+    except ImportError as e:
+        print(f"rapidocr not available: {e}")
+
+    template = TemplateOCR(template_path=None)
+    used = template.fit(fit_samples)
+    print(f"template: samples: {len(fit_samples)}, used: {used}, chars: {''.join(template.chars)}")
+    readers["template"] = (template, TEMPLATE_ROIS)
+    return readers
+
+
+# 每张图片按出现次数重复识别（缓存方案的命中率与实际相同），返回 (准确率, 平均耗时 ms, p95 ms)
+def score(reader, samples):
+    correct = 0
+    total = 0
+    elapsed = []
+    for image, count, text in samples:
+        for _ in range(count):
+            start = time.perf_counter()
+            results, _ = reader.recognize(image)
+            elapsed.append(time.perf_counter() - start)
+            result = results[0][0] if results and results[0] else ""
+            correct += int(result.replace(" ", "") == text)
+            total += 1
+    if not total:
+        return 0.0, 0.0, 0.0
+    return correct / total, np.mean(elapsed) * 1000, np.percentile(elapsed, 95) * 1000
+
+
+def benchmark():
+    corpus = load_corpus()
+    fit_samples, eval_corpus = split_corpus(corpus)
+    readers = make_readers(fit_samples)
+
+    best = {}
+    for roi, samples in eval_corpus.items():
+        if not samples:
+            continue
+        print(f"{roi}: images: {len(samples)}, reads: {sum(count for _, count, _ in samples)}")
+
+        results = []
+        for name, (reader, rois) in readers.items():
+            if rois is not None and roi not in rois:
+                continue
+            accuracy, mean, p95 = score(reader, samples)
+            results.append((accuracy, mean, name))
+            print(f"    {name:>14}: accuracy: {accuracy:.4f}, latency: {mean:7.3f} ms, p95: {p95:7.3f} ms")
+
+        # 达到准确率要求的方案中耗时最少的，都未达到时选择准确率最高的
+        passed = [(mean, name) for accuracy, mean, name in results if accuracy >= MIN_ACCURACY]
+        best[roi] = min(passed)[1] if passed else max(results, key=lambda result: (result[0], -result[1]))[2]
+        print(f"    best: {best[roi]}")
+
+    # 使用全部标注图片生成运行时使用的字符模板
+    template = TemplateOCR(template_path=None)
+    if template.fit([(image, text) for roi in TEMPLATE_ROIS for image, _, text in corpus[roi]]):
+        template.save(OCR_TEMPLATE_FILE)
+        print(f"templates saved: {OCR_TEMPLATE_FILE}")
+    return best
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,74 @@
+from collections import Counter
+
+import numpy as np
+
+CONF_BINS = 10      # 确信度直方图分箱数，范围 [0, 1]
+
+# HUD 文本区域，与 HudLayout 的字段对应
+ROI_HP = "hp"
+ROI_MATERIAL = "material"
+ROI_WAVE = "wave"
+ROI_TIMER = "timer"
+ROI_WAVE_RESULT = "wave_result"
+ROI_SCENE = "scene"     # 由 OCR 结果修正的场景分类，不是 OCR 区域
+
+
+class OcrTelemetry:
+    """Counts OCR reads, re-reads and corrections per HUD region.
+
+    Each counter is kept for the whole run and for the current episode under
+    the key ``"<roi>/<name>"``: ``reads``, ``rereads``, ``rejected`` (below
+    the confidence threshold), ``unmatched`` (text not matching the pattern)
+    and one key per correction kind. Recognizer confidences are binned into
+    a histogram per region.
+    """
+
+    def __init__(self, bins=CONF_BINS):
+        self.bins = bins
+        self.total = Counter()
+        self.episode = Counter()
+        self.conf_histograms = {}
+
+    def reset_episode(self):
+        self.episode.clear()
+
+    def count(self, roi, name):
+        key = f"{roi}/{name}"
+        self.total[key] += 1
+        self.episode[key] += 1
+
+    # reread=True 表示同一帧中对该区域的再次识别
+    def record_read(self, roi, conf, reread=False):
+        self.count(roi, "reads")
+        if reread:
+            self.count(roi, "rereads")
+
+        histogram = self.conf_histograms.get(roi)
+        if histogram is None:
+            histogram = self.conf_histograms[roi] = np.zeros(self.bins, dtype=np.int64)
+        histogram[min(int(conf * self.bins), self.bins - 1)] += 1
+
+    def record_correction(self, roi, kind):
+        self.count(roi, kind)
+
+    # episode=True 时返回当前回合的计数
+    def summary(self, episode=False):
+        return dict(self.episode if episode else self.total)
+
+    def histograms(self):
+        return {roi: histogram.copy() for roi, histogram in self.conf_histograms.items()}
+
+
+# 写入 SB3 logger：计数为 ocr/<roi>/<name> 标量，确信度为 ocr_conf/<roi> 直方图（仅 TensorBoard）
+def record_telemetry(logger, summary, histograms, bins=CONF_BINS):
+    import torch
+
+    for key, value in sorted(summary.items()):
+        logger.record(f"ocr/{key}", value)
+
+    # 直方图只保存分箱计数，按分箱中心值展开后由 TensorBoard 重新统计
+    centers = (np.arange(bins) + 0.5) / bins
+    for roi, histogram in histograms.items():
+        if histogram.sum() > 0:
+            values = torch.as_tensor(np.repeat(centers, histogram), dtype=torch.float32)
+            logger.record(f"ocr_conf/{roi}", values, exclude=("stdout", "log", "json", "csv"))
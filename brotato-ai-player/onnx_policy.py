@@ -0,0 +1,149 @@
+import numpy as np
+
+from model_paths import MODEL_FILE, POLICY_ONNX_FILE
+from startup import create_session
+
+ONNX_OPSET = 17
+
+PARITY_SAMPLES = 32
+PARITY_TOLERANCE = 1e-4
+
+# ONNX 输入类型对应的 numpy 类型：图像观测为 uint8，特征观测为 float32
+ONNX_INPUT_DTYPES = {
+    "tensor(uint8)": np.uint8,
+    "tensor(float)": np.float32,
+}
+
+
+def log_softmax(logits):
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    return shifted - np.log(np.exp(shifted).sum(axis=-1, keepdims=True))
+
+
+def softmax(logits):
+    return np.exp(log_softmax(logits))
+
+
+class OnnxPolicy:
+    """Exported PPO actor run with onnxruntime, mirrors ``PPO.predict()``.
+
+    The graph takes the env observation as is (uint8 channel-last image or
+    float32 features) and returns the action logits.
+    """
+
+    def __init__(self, onnx_file=POLICY_ONNX_FILE, deterministic=False, seed=None):
+        self.session = create_session(onnx_file)
+        obs_input = self.session.get_inputs()[0]
+        self.input_name = obs_input.name
+        self.obs_ndim = len(obs_input.shape) - 1
+        self.obs_dtype = ONNX_INPUT_DTYPES[obs_input.type]
+
+        self.deterministic = deterministic
+        self.rng = np.random.default_rng(seed)
+
+    def logits(self, obs):
+        obs = np.asarray(obs, dtype=self.obs_dtype)
+        vectorized = obs.ndim > self.obs_ndim
+        batch = obs if vectorized else obs[np.newaxis]
+        logits = self.session.run(None, {self.input_name: batch})[0]
+        return logits if vectorized else logits[0]
+
+    # 与 SB3 predict 相同，返回 (action, state)，deterministic=False 时按概率采样
+    def predict(self, obs, deterministic=None):
+        if deterministic is None:
+            deterministic = self.deterministic
+
+        logits = self.logits(obs)
+        if deterministic:
+            return logits.argmax(axis=-1), None
+
+        probs = softmax(logits.astype(np.float64))
+        if probs.ndim == 1:
+            return np.array(self.rng.choice(len(probs), p=probs)), None
+        return np.array([self.rng.choice(len(p), p=p) for p in probs]), None
+
+
+def export_onnx(model_file=MODEL_FILE, onnx_file=POLICY_ONNX_FILE):
+    import torch
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.preprocessing import is_image_space, is_image_space_channels_first, preprocess_obs
+    import gymnasium as gym
+
+    model = PPO.load(model_file, device="cpu")
+    policy = model.policy
+    policy.set_training_mode(False)
+
+    observation_space = policy.observation_space
+    if not isinstance(observation_space, gym.spaces.Box):
+        raise ValueError(f"unsupported observation space: {observation_space}")
+
+    # SB3 训练时通过 VecTransposeImage 转为通道在前，导出的模型直接接受环境输出的通道在后的图像
+    channel_last = is_image_space(observation_space) and is_image_space_channels_first(observation_space)
+    obs_shape = observation_space.shape
+    if channel_last:
+        obs_shape = (obs_shape[1], obs_shape[2], obs_shape[0])
+
+    class OnnxableActor(torch.nn.Module):
+        def __init__(self, policy):
+            super().__init__()
+            self.policy = policy
+
+        def forward(self, obs):
+            if channel_last:
+                obs = obs.permute(0, 3, 1, 2)
+            obs = preprocess_obs(obs, self.policy.observation_space, normalize_images=self.policy.normalize_images)
+            features = self.policy.pi_features_extractor(obs)
+            latent_pi = self.policy.mlp_extractor.forward_actor(features)
+            return self.policy.action_net(latent_pi)
+
+    # 导出的输入类型与观测空间一致（图像为 uint8，特征为 float32）
+    dummy_obs = torch.as_tensor(np.zeros((1, *obs_shape), dtype=observation_space.dtype))
+    torch.onnx.export(OnnxableActor(policy),
+                      dummy_obs,
+                      onnx_file,
+                      input_names=["obs"],
+                      output_names=["logits"],
+                      dynamic_axes={"obs": {0: "batch"}, "logits": {0: "batch"}},
+                      opset_version=ONNX_OPSET)
+    print(f"policy export to: {onnx_file}, obs shape: {obs_shape}, dtype: {observation_space.dtype}")
+
+
+# 在观测空间的取值范围内生成随机观测
+def sample_observations(observation_space, obs_shape, n_samples, rng):
+    low, high = observation_space.low.min(), observation_space.high.max()
+    if np.issubdtype(observation_space.dtype, np.integer):
+        return rng.integers(low, int(high) + 1, size=(n_samples, *obs_shape), dtype=observation_space.dtype)
+    return rng.uniform(low, high, size=(n_samples, *obs_shape)).astype(observation_space.dtype)
+
+
+# 用随机观测比较 SB3 与 ONNX 的动作分布和确定性动作
+def check_parity(model_file=MODEL_FILE, onnx_file=POLICY_ONNX_FILE, n_samples=PARITY_SAMPLES, tolerance=PARITY_TOLERANCE):
+    import torch
+    from stable_baselines3 import PPO
+
+    model = PPO.load(model_file, device="cpu")
+    onnx_policy = OnnxPolicy(onnx_file, deterministic=True)
+
+    obs_shape = onnx_policy.session.get_inputs()[0].shape[1:]
+    rng = np.random.default_rng(0)
+    obs = sample_observations(model.observation_space, obs_shape, n_samples, rng)
+
+    with torch.no_grad():
+        obs_tensor, _ = model.policy.obs_to_tensor(obs)
+        sb3_log_probs = model.policy.get_distribution(obs_tensor).distribution.logits.numpy()
+    sb3_actions, _ = model.predict(obs, deterministic=True)
+
+    onnx_logits = onnx_policy.logits(obs)
+    onnx_log_probs = log_softmax(onnx_logits)
+    onnx_actions, _ = onnx_policy.predict(obs)
+
+    max_diff = float(np.abs(sb3_log_probs - onnx_log_probs).max())
+    agreement = float((sb3_actions == onnx_actions).mean())
+    passed = max_diff <= tolerance and agreement == 1.0
+    print(f"parity: {'ok' if passed else 'FAILED'}, max log prob diff: {max_diff:.2e}, action agreement: {agreement:.2%}")
+    return passed
+
+
+if __name__ == "__main__":
+    export_onnx()
+    check_parity()
@@ -0,0 +1,320 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+import brotato
+from model_paths import CLS_MODEL_PATH
+from startup import create_session
+from ocr import OCR
+import cv2
+
+import threading
+import queue
+import time
+import ast
+
+CLS_IMAGE_SIZE = 640    # 与 train_img_cls.py 训练时的 imgsz 一致，模型元数据中没有 imgsz 时使用
+WARMUP_RUNS = 2
+
+FRAME_BYTES = brotato.HEIGHT * brotato.WIDTH * brotato.N_CHANNELS   # 每个客户端的共享内存大小
+
+MAX_BATCH_SIZE = 8          # 一次合并处理的最大请求数
+BATCH_WAIT_TIME = 0.002     # 收到第一个请求后等待其他请求的时间
+
+REQUEST_POLL_INTERVAL = 1.0   # 等待结果时检查服务进程是否存活的间隔
+REQUEST_TIMEOUT = 60.0        # 等待一次请求结果的最长时间，包括服务进程启动时加载模型的时间
+
+REQUEST_CLASSIFY = 0
+REQUEST_RECOGNIZE = 1
+
+
+class SceneClassifier:
+    """YOLO classification model exported to ONNX, run directly with onnxruntime.
+
+    Preprocessing follows ultralytics ``classify_transforms``: resize the short
+    side to ``imgsz``, center crop, BGR to RGB, scale to [0, 1].
+    """
+
+    def __init__(self, model_path=CLS_MODEL_PATH, intra_threads=0, inter_threads=0):
+        self.session = create_session(model_path, intra_threads, inter_threads)
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.dynamic_batch = isinstance(model_input.shape[0], str)
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        imgsz = ast.literal_eval(metadata["imgsz"]) if "imgsz" in metadata else CLS_IMAGE_SIZE
+        self.imgsz = imgsz[0] if isinstance(imgsz, (list, tuple)) else int(imgsz)
+
+    def preprocess(self, image):
+        height, width = image.shape[:2]
+        scale = self.imgsz / min(height, width)
+        if height < width:
+            size = (int(self.imgsz * width / height), self.imgsz)
+        else:
+            size = (self.imgsz, int(self.imgsz * height / width))
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        image = cv2.resize(image, size, interpolation=interpolation)
+
+        top = int(round((size[1] - self.imgsz) / 2.0))
+        left = int(round((size[0] - self.imgsz) / 2.0))
+        image = image[top:top + self.imgsz, left:left + self.imgsz]
+
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        return image.transpose(2, 0, 1).astype(np.float32) / 255.0
+
+    # 返回 [(top1, top1_confidence), ...]
+    def classify_batch(self, images) -> list[tuple[int, float]]:
+        blobs = [self.preprocess(image) for image in images]
+        if self.dynamic_batch:
+            probs = self.session.run(None, {self.input_name: np.stack(blobs)})[0]
+        else:
+            probs = np.concatenate([self.session.run(None, {self.input_name: blob[np.newaxis]})[0] for blob in blobs])
+
+        top1 = probs.argmax(axis=1)
+        return [(int(index), float(prob[index])) for index, prob in zip(top1, probs)]
+
+
+class LocalPerception:
+    """In-process scene classifier and OCR engine."""
+
+    # budget 为 runtime_config.ThreadBudget 时按预算设置两个模型的线程数
+    def __init__(self, model_path=CLS_MODEL_PATH, budget=None):
+        if budget is None:
+            self.classifier = SceneClassifier(model_path)
+            self.ocr = OCR()
+        else:
+            self.classifier = SceneClassifier(model_path, budget.classifier_threads, budget.inter_threads)
+            self.ocr = OCR(intra_threads=budget.ocr_threads, inter_threads=budget.inter_threads)
+
+    # 返回 (top1, top1_confidence)
+    def classify(self, image) -> tuple[int, float]:
+        return self.classify_batch([image])[0]
+
+    def classify_batch(self, images) -> list[tuple[int, float]]:
+        return self.classifier.classify_batch(images)
+
+    # 返回 RapidOCR 格式的结果 (results, elapse)
+    def recognize(self, image):
+        return self.ocr.recognize(image)
+
+    def recognize_batch(self, images):
+        return self.ocr.recognize_batch(images)
+
+    # 首次推理需要分配内存等，启动时先运行几次，避免计入第一次 reset
+    def warmup(self, runs=WARMUP_RUNS):
+        run_warmup(self, runs)
+
+
+class PerceptionClient:
+    """Perception proxy used by an env process when running in server mode.
+
+    Images are written to the client's own shared memory block and the request
+    is queued to the server; the call blocks until the result is sent back,
+    the server process exits or ``REQUEST_TIMEOUT`` expires.
+    """
+
+    def __init__(self, index, request_queue, shm_name, conn, frame_bytes=FRAME_BYTES, server_pid=None):
+        self.index = index
+        self.request_queue = request_queue
+        self.shm_name = shm_name
+        self.conn = conn
+        self.frame_bytes = frame_bytes
+        self.server_pid = server_pid
+
+        self.shm = None
+        self.lock = threading.Lock()
+
+    # 传递到子进程时不携带共享内存和锁，使用时重新连接
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["shm"] = None
+        state["lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def classify(self, image) -> tuple[int, float]:
+        return self.__request(REQUEST_CLASSIFY, [image])[0]
+
+    def classify_batch(self, images) -> list[tuple[int, float]]:
+        return self.__request(REQUEST_CLASSIFY, images)
+
+    def recognize(self, image):
+        return self.__request(REQUEST_RECOGNIZE, [image])[0]
+
+    def recognize_batch(self, images):
+        return self.__request(REQUEST_RECOGNIZE, images)
+
+    def warmup(self, runs=WARMUP_RUNS):
+        run_warmup(self, runs)
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm = None
+
+    def __request(self, kind, images):
+        with self.lock:
+            if self.shm is None:
+                self.shm = shared_memory.SharedMemory(name=self.shm_name)
+
+            layouts = []
+            offset = 0
+            for image in images:
+                image = np.ascontiguousarray(image, dtype=np.uint8)
+                if offset + image.nbytes > self.frame_bytes:
+                    raise ValueError(f"perception request too large: {offset + image.nbytes} > {self.frame_bytes}")
+
+                np.ndarray(image.shape, dtype=np.uint8, buffer=self.shm.buf, offset=offset)[...] = image
+                layouts.append((offset, image.shape))
+                offset += image.nbytes
+
+            self.request_queue.put((self.index, kind, layouts))
+            return self.__receive()
+
+    def __receive(self):
+        deadline = time.time() + REQUEST_TIMEOUT
+        while not self.conn.poll(REQUEST_POLL_INTERVAL):
+            if not process_alive(self.server_pid):
+                raise RuntimeError(f"perception server exited, pid: {self.server_pid}")
+            if time.time() > deadline:
+                raise TimeoutError(f"perception server did not respond in {REQUEST_TIMEOUT}s, pid: {self.server_pid}")
+        try:
+            return self.conn.recv()
+        except EOFError:
+            # 服务进程退出后管道的另一端关闭
+            raise RuntimeError(f"perception server exited, pid: {self.server_pid}") from None
+
+
+class PerceptionServer:
+    """Process owning one classifier and one OCR engine shared by many envs.
+
+    Requests arriving within ``BATCH_WAIT_TIME`` of each other are merged and
+    run as one batch per model.
+    """
+
+    def __init__(self, n_clients, model_path=CLS_MODEL_PATH, frame_bytes=FRAME_BYTES, budget=None):
+        ctx = mp.get_context("spawn")
+
+        self.frame_bytes = frame_bytes
+        self.request_queue = ctx.Queue()
+        self.blocks = [shared_memory.SharedMemory(create=True, size=frame_bytes) for _ in range(n_clients)]
+        self.pipes = [ctx.Pipe() for _ in range(n_clients)]
+
+        self.process = ctx.Process(target=serve,
+                                   args=(self.request_queue,
+                                         [block.name for block in self.blocks],
+                                         [server_conn for server_conn, _ in self.pipes],
+                                         model_path,
+                                         budget),
+                                   daemon=True)
+
+    def start(self):
+        self.process.start()
+        # 服务进程已持有自己的副本，关闭本进程的副本，服务进程退出时客户端才能收到 EOFError
+        for server_conn, _ in self.pipes:
+            server_conn.close()
+
+    def stop(self):
+        if self.process.is_alive():
+            self.request_queue.put(None)
+            self.process.join()
+
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def client(self, index) -> PerceptionClient:
+        _, client_conn = self.pipes[index]
+        return PerceptionClient(index, self.request_queue, self.blocks[index].name, client_conn, self.frame_bytes,
+                                self.process.pid)
+
+
+# pid 为 None 或无法检查时视为存活，依赖管道关闭判断服务进程退出
+def process_alive(pid):
+    if pid is None:
+        return True
+    try:
+        import psutil   # ultralytics 的依赖
+    except ImportError:
+        return True
+    try:
+        return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return False
+
+
+def run_warmup(perception, runs=WARMUP_RUNS):
+    frame = np.zeros((brotato.HEIGHT, brotato.WIDTH, brotato.N_CHANNELS), dtype=np.uint8)
+    x, y, x1, y1 = brotato.BOX_HP_XYXY[0]
+    roi = frame[y:y1, x:x1]
+    for _ in range(runs):
+        perception.classify(frame)
+        perception.recognize(roi)
+
+
+def serve(request_queue, shm_names, conns, model_path=CLS_MODEL_PATH, budget=None):
+    if budget is not None:
+        budget.apply()
+    perception = LocalPerception(model_path, budget)
+    perception.warmup()
+    blocks = [shared_memory.SharedMemory(name=name) for name in shm_names]
+    print(f"perception server ready, clients: {len(blocks)}")
+
+    running = True
+    while running:
+        request = request_queue.get()
+        if request is None:
+            break
+
+        requests = [request]
+        deadline = time.time() + BATCH_WAIT_TIME
+        while len(requests) < MAX_BATCH_SIZE:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                request = request_queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                running = False
+                break
+            requests.append(request)
+
+        handle_batch(perception, blocks, conns, requests)
+
+    for block in blocks:
+        block.close()
+
+
+def handle_batch(perception, blocks, conns, requests):
+    # 按请求类型合并所有图像，批量推理后再按请求拆分结果
+    for kind, run_batch in ((REQUEST_CLASSIFY, perception.classify_batch),
+                            (REQUEST_RECOGNIZE, perception.recognize_batch)):
+        batch = [(index, layouts) for index, request_kind, layouts in requests if request_kind == kind]
+        if not batch:
+            continue
+
+        images = []
+        for index, layouts in batch:
+            buf = blocks[index].buf
+            images.extend(np.ndarray(shape, dtype=np.uint8, buffer=buf, offset=offset) for offset, shape in layouts)
+
+        try:
+            outputs = run_batch(images)
+        except Exception as e:
+            # 推理出错时返回空结果，避免客户端一直等待
+            print(f"perception error: {e}")
+            empty = (-1, 0.0) if kind == REQUEST_CLASSIFY else ([], 0.0)
+            outputs = [empty] * len(images)
+        del images
+
+        start = 0
+        for index, layouts in batch:
+            conns[index].send(outputs[start:start + len(layouts)])
+            start += len(layouts)
@@ -0,0 +1,143 @@
+import numpy as np
+import torch
+
+from stable_baselines3.common.buffers import BaseBuffer, RolloutBuffer
+from stable_baselines3.common.type_aliases import RolloutBufferSamples
+
+import tracemalloc
+
+
+class Uint8RolloutBuffer(RolloutBuffer):
+    """Rollout buffer keeping image observations as one contiguous uint8 array.
+
+    SB3's ``RolloutBuffer`` stores observations as float32, 4x the size of
+    the frames, and casts them on every ``add()``. Here they are stored
+    env-major ``(n_envs, buffer_size, C, H, W)`` and allocated once:
+    flattening them for minibatches is a view instead of a copy, and
+    ``reset()`` does not allocate a second array while the previous one is
+    still alive. Minibatches are passed to the policy as uint8 tensors;
+    ``preprocess_obs`` scales them to [0, 1] per minibatch.
+    """
+
+    def reset(self) -> None:
+        if getattr(self, "frames", None) is None:
+            self.frames = np.zeros((self.n_envs, self.buffer_size, *self.obs_shape), dtype=np.uint8)
+        self.observations = self.frames.reshape(self.n_envs * self.buffer_size, *self.obs_shape)
+
+        self.actions = np.zeros((self.buffer_size, self.n_envs, self.action_dim), dtype=np.float32)
+        self.rewards = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.returns = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.episode_starts = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.values = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.log_probs = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.advantages = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.generator_ready = False
+        BaseBuffer.reset(self)
+
+    def add(self, obs, action, reward, episode_start, value, log_prob) -> None:
+        if len(log_prob.shape) == 0:
+            log_prob = log_prob.reshape(-1, 1)
+
+        action = action.reshape((self.n_envs, self.action_dim))
+
+        # 直接写入预分配的数组，不经过 np.array 复制
+        self.frames[:, self.pos] = obs
+        self.actions[self.pos] = action
+        self.rewards[self.pos] = reward
+        self.episode_starts[self.pos] = episode_start
+        self.values[self.pos] = value.clone().cpu().numpy().flatten()
+        self.log_probs[self.pos] = log_prob.clone().cpu().numpy()
+        self.pos += 1
+        if self.pos == self.buffer_size:
+            self.full = True
+
+    def get(self, batch_size=None):
+        assert self.full, ""
+        indices = np.random.permutation(self.buffer_size * self.n_envs)
+        if not self.generator_ready:
+            # observations 已经是按环境展开的视图，只处理其他较小的数组
+            for name in ["actions", "values", "log_probs", "advantages", "returns"]:
+                self.__dict__[name] = self.swap_and_flatten(self.__dict__[name])
+            self.generator_ready = True
+
+        if batch_size is None:
+            batch_size = self.buffer_size * self.n_envs
+
+        start_idx = 0
+        while start_idx < self.buffer_size * self.n_envs:
+            yield self._get_samples(indices[start_idx:start_idx + batch_size])
+            start_idx += batch_size
+
+    def _get_samples(self, batch_inds, env=None) -> RolloutBufferSamples:
+        # 索引得到的小批量已经是副本，转为张量时不再复制
+        return RolloutBufferSamples(
+            self.to_torch(self.observations[batch_inds], copy=False),
+            self.to_torch(self.actions[batch_inds]),
+            self.to_torch(self.values[batch_inds].flatten()),
+            self.to_torch(self.log_probs[batch_inds].flatten()),
+            self.to_torch(self.advantages[batch_inds].flatten()),
+            self.to_torch(self.returns[batch_inds].flatten()),
+        )
+
+
+# 用随机数据模拟两轮 rollout（填充、计算优势、遍历小批量、reset），返回 numpy 分配的峰值内存（MB）
+def measure_peak_memory(buffer_class, observation_space, action_space, n_steps, n_envs=1, batch_size=64, rollouts=2):
+    tracemalloc.start()
+    buffer = buffer_class(n_steps, observation_space, action_space, device="cpu", n_envs=n_envs)
+
+    obs = np.random.randint(0, 256, size=(n_envs, *observation_space.shape), dtype=np.uint8)
+    for _ in range(rollouts):
+        buffer.reset()
+        for _ in range(n_steps):
+            buffer.add(obs,
+                       np.array([action_space.sample() for _ in range(n_envs)]),
+                       np.zeros((n_envs,), dtype=np.float32),
+                       np.zeros((n_envs,), dtype=np.float32),
+                       torch.zeros((n_envs,)),
+                       torch.zeros((n_envs,)))
+        buffer.compute_returns_and_advantage(torch.zeros((n_envs,)), np.zeros((n_envs,), dtype=bool))
+        for _ in buffer.get(batch_size):
+            pass
+
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 2**20
+
+
+# 进程的峰值常驻内存（MB），Windows 上为 psutil 的 peak_wset
+def peak_rss():
+    try:
+        import resource
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 2**20
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# 返回 (tracemalloc 峰值 MB, 进程峰值 RSS 的增量 MB)；峰值 RSS 无法重置，每种配置需要在新进程中调用
+def measure_peak_rss(buffer_class, observation_space, action_space, n_steps, n_envs=1, batch_size=64):
+    before = peak_rss()
+    peak = measure_peak_memory(buffer_class, observation_space, action_space, n_steps, n_envs, batch_size)
+    return peak, peak_rss() - before
+
+
+if __name__ == "__main__":
+    import multiprocessing as mp
+    from concurrent.futures import ProcessPoolExecutor
+    import gymnasium as gym
+    from stable_baselines3.common.vec_env.vec_transpose import VecTransposeImage
+    from obs_profiles import PROFILES, DEFAULT_PROFILE
+    from brotato_action import N_DISCRETE_ACTIONS
+    from train_ppo import N_STEPS, BATCH_SIZE
+
+    image_space = gym.spaces.Box(0, 255, PROFILES[DEFAULT_PROFILE].shape(), dtype=np.uint8)
+    observation_space = VecTransposeImage.transpose_space(image_space)
+    action_space = gym.spaces.Discrete(N_DISCRETE_ACTIONS)
+
+    for n_envs in (1, 4):
+        for buffer_class in (RolloutBuffer, Uint8RolloutBuffer):
+            with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as executor:
+                peak, rss = executor.submit(measure_peak_rss, buffer_class, observation_space, action_space,
+                                            N_STEPS, n_envs, BATCH_SIZE).result()
+            print(f"{buffer_class.__name__}: n_steps: {N_STEPS}, n_envs: {n_envs}, "
+                  f"peak memory: {peak:.1f} MB, peak rss increase: {rss:.0f} MB")
@@ -0,0 +1,70 @@
+import os
+import sys
+
+N_CORES = None          # 参与分配的核心数，None 时使用全部核心
+INTER_OP_THREADS = 1    # 模型均按顺序执行算子，inter-op 线程池只需要 1 个线程
+
+
+class ThreadBudget:
+    """CPU cores and intra-op thread counts for the inference engines of one env.
+
+    A thread count of 0 keeps the engine's default (one thread per core).
+    ``cores`` is the affinity applied to the process by ``apply()``; ``None``
+    leaves it unchanged.
+    """
+
+    def __init__(self, cores=None, classifier_threads=0, ocr_threads=0, torch_threads=0, inter_threads=INTER_OP_THREADS):
+        self.cores = list(cores) if cores is not None else None
+        self.classifier_threads = classifier_threads
+        self.ocr_threads = ocr_threads
+        self.torch_threads = torch_threads
+        self.inter_threads = inter_threads
+
+    # 在使用该预算的进程中调用：绑定核心，设置 torch 线程数（torch 已导入时）
+    def apply(self):
+        if self.cores is not None:
+            set_affinity(self.cores)
+
+        if self.torch_threads > 0 and "torch" in sys.modules:
+            import torch
+            torch.set_num_threads(self.torch_threads)
+            try:
+                torch.set_num_interop_threads(self.inter_threads)
+            except RuntimeError:
+                pass    # 已执行过并行计算后不能再修改
+
+    def __repr__(self):
+        return (f"ThreadBudget(cores={self.cores}, classifier={self.classifier_threads}, "
+                f"ocr={self.ocr_threads}, torch={self.torch_threads}, inter={self.inter_threads})")
+
+
+def available_cores():
+    return list(range(N_CORES or os.cpu_count() or 1))
+
+
+def set_affinity(cores):
+    try:
+        try:
+            import psutil   # ultralytics 的依赖，Windows 上通过 psutil 设置
+            psutil.Process().cpu_affinity(list(cores))
+        except ImportError:
+            os.sched_setaffinity(0, cores)
+    except (AttributeError, OSError, ValueError) as e:
+        print(f"set cpu affinity failed: {cores}, {e}")
+
+
+# 将核心平均分给各个环境（连续的核心），同一环境内的分类、OCR、策略推理依次执行，默认各自使用该环境的全部核心
+# share 小于 1 时按比例减少线程数（如推测执行 OCR 时分类和 OCR 并行，各用一半）
+def partition(n_envs=1, cores=None, classifier_share=1.0, ocr_share=1.0, torch_share=1.0, affinity=True):
+    cores = cores if cores is not None else available_cores()
+    per_env = max(1, len(cores) // n_envs)
+
+    budgets = []
+    for i in range(n_envs):
+        env_cores = cores[(i * per_env) % len(cores):][:per_env]
+        n = len(env_cores)
+        budgets.append(ThreadBudget(env_cores if affinity else None,
+                                    max(1, round(n * classifier_share)),
+                                    max(1, round(n * ocr_share)),
+                                    max(1, round(n * torch_share))))
+    return budgets
@@ -0,0 +1,163 @@
+import numpy as np
+import cv2
+
+import brotato
+
+import threading
+import time
+from contextlib import contextmanager
+
+SIGNATURE_STRIDE = 8            # 先按步长抽样，再缩放为签名
+SIGNATURE_SIZE = (32, 18)
+CHANGE_THRESHOLD = 6.0          # 签名灰度平均差超过该值时认为画面发生变化
+
+POLL_INTERVAL = 0.02            # 有等待画面变化者时的采样间隔
+IDLE_POLL_INTERVAL = 0.2        # 采样期间无等待画面变化者（如处理途中的场景）时的采样间隔
+CONFIRM_INTERVAL = 0.5          # 画面未变化时也按该间隔重新分类，避免过渡动画中的误判一直保留
+NO_FRAME_INTERVAL = 1.0         # 还没有画面（窗口不存在）时按该间隔打印提示
+STOP_TIMEOUT = 5.0              # stop 时等待线程结束的最长时间（正在进行的抓取完成后退出）
+
+
+def frame_signature(frame):
+    small = frame[::SIGNATURE_STRIDE, ::SIGNATURE_STRIDE]
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+class SceneWatcher(threading.Thread):
+    """Background thread watching a cheap frame signature for scene changes.
+
+    Waiters are woken as soon as the signature changes; the full classifier
+    only runs to confirm the scene of the new frame. The classified scene is
+    cached until the next change. The thread only grabs while a query or wait
+    is in progress, so it stays idle during env steps.
+    """
+
+    def __init__(self, grab, classify, threshold=CHANGE_THRESHOLD, window_name=brotato.WINDOW_NAME):
+        super().__init__(daemon=True)
+        self.grab = grab            # () -> BGR frame | None
+        self.classify = classify    # frame -> brotato.Scene
+        self.threshold = threshold
+        self.window_name = window_name
+
+        self.condition = threading.Condition()
+        self.running = True
+        self.waiters = 0
+        self.active = 0     # 正在进行的查询、等待数，为 0 时暂停采样
+
+        self.frame = None
+        self.reference = None
+        self.change_count = 0
+
+        self.scene = brotato.Scene.UNKNOWN
+        self.scene_change_count = -1
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.active or not self.running)
+                if not self.running:
+                    return
+
+            frame = self.grab()
+            if frame is not None:
+                signature = frame_signature(frame)
+                with self.condition:
+                    if not self.active:
+                        continue
+                    self.frame = frame
+                    if self.reference is None or np.abs(signature - self.reference).mean() > self.threshold:
+                        self.reference = signature
+                        self.change_count += 1
+                        self.condition.notify_all()
+
+            # 无等待者时按 IDLE_POLL_INTERVAL 采样，开始等待画面变化时立即恢复 POLL_INTERVAL
+            with self.condition:
+                self.condition.wait_for(lambda: self.waiters or not self.running, IDLE_POLL_INTERVAL - POLL_INTERVAL)
+            time.sleep(POLL_INTERVAL)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.join(STOP_TIMEOUT)
+
+    # 查询、等待期间采样；结束后暂停，保存的画面已过期，下次查询等待新的画面
+    @contextmanager
+    def polling(self):
+        with self.condition:
+            self.active += 1
+            self.condition.notify_all()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active -= 1
+                if not self.active:
+                    self.frame = None
+
+    # 返回 (scene, frame)，画面未变化时直接返回缓存的分类结果
+    # 还没有画面时等待，每 NO_FRAME_INTERVAL 秒打印一次提示，超过 timeout 返回 (UNKNOWN, None)
+    def current_scene(self, force=False, timeout=None):
+        with self.polling():
+            return self.__current_scene(force, timeout)
+
+    def __current_scene(self, force, timeout):
+        deadline = None if timeout is None else time.time() + timeout
+        with self.condition:
+            while self.frame is None and self.running:
+                wait_time = NO_FRAME_INTERVAL
+                if deadline is not None:
+                    wait_time = min(wait_time, deadline - time.time())
+                    if wait_time <= 0:
+                        break
+                if not self.condition.wait_for(lambda: self.frame is not None or not self.running, wait_time):
+                    print(f"no window: '{self.window_name}'")
+            count = self.change_count
+            frame = self.frame
+            if frame is None:
+                return brotato.Scene.UNKNOWN, None
+            if not force and count == self.scene_change_count:
+                return self.scene, frame
+
+        scene = self.classify(frame)
+        with self.condition:
+            self.scene = scene
+            self.scene_change_count = count
+        return scene, frame
+
+    def wait_for_change(self, since, timeout=None) -> int:
+        with self.condition:
+            self.waiters += 1
+            self.condition.notify_all()
+            try:
+                self.condition.wait_for(lambda: self.change_count != since or not self.running, timeout)
+            finally:
+                self.waiters -= 1
+            return self.change_count
+
+    # 等待到 predicate(scene) 成立，on_scene 用于处理途中的场景（如按键确认），超时返回最后的场景
+    def wait_for(self, predicate, timeout=None, on_scene=None):
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self.polling():
+            scene, frame = self.current_scene(timeout=timeout)
+            while frame is not None and not predicate(scene):
+                if on_scene:
+                    on_scene(scene)
+
+                wait_time = CONFIRM_INTERVAL
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    wait_time = min(wait_time, remaining)
+
+                count = self.scene_change_count
+                changed = self.wait_for_change(count, wait_time) != count
+                scene, frame = self.current_scene(force=not changed)
+
+        return scene, frame
+
+    def wait_for_scene(self, scene, timeout=None, on_scene=None):
+        return self.wait_for(lambda current: current == scene, timeout, on_scene)
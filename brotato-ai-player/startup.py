@@ -0,0 +1,68 @@
+from contextlib import contextmanager
+import time
+import os
+
+from model_paths import ORT_CACHE_DIR
+
+
+class StartupProfiler:
+    """Records the duration of named startup stages (import, model load, warm-up)."""
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        stage_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - stage_start))
+
+    def report(self):
+        total = time.perf_counter() - self.start_time
+        print(f"startup: {total:.3f}s")
+        for name, elapsed in self.stages:
+            print(f"    {name:<12s} {elapsed:8.3f}s  {(elapsed / total * 100) if total > 0 else 0:5.1f}%")
+
+
+# 缓存文件名包含源模型大小、修改时间和 onnxruntime 版本，任一变化时重新优化
+def optimized_model_path(model_path):
+    import onnxruntime as ort
+
+    stat = os.stat(model_path)
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(ORT_CACHE_DIR, f"{name}-{stat.st_size}-{int(stat.st_mtime)}-ort{ort.__version__}.onnx")
+
+
+def create_session(model_path, intra_threads=0, inter_threads=0):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_threads
+    options.inter_op_num_threads = inter_threads
+
+    cached_path = optimized_model_path(model_path)
+    if os.path.exists(cached_path):
+        # 已优化的模型不需要再做图优化
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        return ort.InferenceSession(cached_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+    os.makedirs(ORT_CACHE_DIR, exist_ok=True)
+    temp_path = cached_path + ".tmp"
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.optimized_model_filepath = temp_path
+    session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+    if os.path.exists(temp_path):
+        os.replace(temp_path, cached_path)
+        print(f"optimized model cached: {cached_path}")
+    return session
+
+
+# 用于由第三方库自行创建 session 的模型，返回优化后模型的路径
+def cache_optimized_model(model_path):
+    cached_path = optimized_model_path(model_path)
+    if not os.path.exists(cached_path):
+        create_session(model_path)
+    return cached_path if os.path.exists(cached_path) else model_path
@@ -0,0 +1,147 @@
+import json
+import random
+import socket
+import time
+
+import brotato
+
+STATE_HOST = "127.0.0.1"
+STATE_PORT = 47800          # 游戏 mod 发送状态的本地 UDP 端口
+MAX_STATE_AGE = 0.5         # 超过该时间未收到状态时认为通道不可用，回退到 OCR
+MAX_DATAGRAM_BYTES = 4096
+
+PRODUCER_RATE = 30          # 模拟 producer 的发送频率（Hz）
+
+
+class GameState:
+    """HUD values of one game frame, as sent by the game-side mod."""
+
+    def __init__(self, hp, total_hp, material, wave, timer, wave_result=brotato.WaveResult.UNKNOWN, timestamp=None):
+        self.hp = hp
+        self.total_hp = total_hp
+        self.material = material
+        self.wave = wave
+        self.timer = timer
+        self.wave_result = wave_result
+        self.timestamp = timestamp if timestamp is not None else time.time()
+
+    # 消息格式：{"hp": 20, "total_hp": 20, "material": 35, "wave": 3, "timer": 42, "wave_result": 99}
+    def to_dict(self):
+        return {
+            "hp": self.hp,
+            "total_hp": self.total_hp,
+            "material": self.material,
+            "wave": self.wave,
+            "timer": self.timer,
+            "wave_result": self.wave_result.value,
+        }
+
+    @classmethod
+    def from_dict(cls, data, timestamp=None):
+        return cls(int(data["hp"]),
+                   int(data["total_hp"]),
+                   int(data["material"]),
+                   int(data["wave"]),
+                   int(data["timer"]),
+                   brotato.WaveResult(int(data.get("wave_result", brotato.WaveResult.UNKNOWN.value))),
+                   timestamp)
+
+    def __repr__(self):
+        return f"GameState({self.to_dict()})"
+
+
+class OcrStateSource:
+    """Default backend: no external state, the env reads the HUD by OCR."""
+
+    def read(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class SocketStateSource:
+    """Latest ``GameState`` received from the game-side mod over local UDP.
+
+    Each datagram is one JSON object (see ``GameState.to_dict``). ``read()``
+    drains the socket without blocking and returns the newest state, or
+    ``None`` when nothing arrived within ``max_age`` seconds so that the env
+    falls back to OCR.
+    """
+
+    def __init__(self, host=STATE_HOST, port=STATE_PORT, max_age=MAX_STATE_AGE):
+        self.max_age = max_age
+        self.latest = None
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+
+    def read(self):
+        while True:
+            try:
+                data = self.sock.recv(MAX_DATAGRAM_BYTES)
+            except (BlockingIOError, ConnectionResetError):
+                break
+
+            # 时间戳使用接收时间，不依赖游戏端的时钟
+            try:
+                self.latest = GameState.from_dict(json.loads(data), time.time())
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"invalid game state: {data[:64]}, {e}")
+
+        if self.latest is None or time.time() - self.latest.timestamp > self.max_age:
+            return None
+        return self.latest
+
+    def close(self):
+        self.sock.close()
+
+
+class StateProducer:
+    """Stand-in for the game-side mod: sends ``GameState`` datagrams."""
+
+    def __init__(self, host=STATE_HOST, port=STATE_PORT):
+        self.address = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, state):
+        self.sock.sendto(json.dumps(state.to_dict()).encode("utf-8"), self.address)
+
+    def close(self):
+        self.sock.close()
+
+
+# 模拟一个波次：倒计时每秒减 1，随机扣血和拾取材料，倒计时结束时发送通过结果
+def simulate_wave(producer, wave=1, wave_timer=20, total_hp=20, rate=PRODUCER_RATE):
+    hp = total_hp
+    material = 0
+    start_time = time.time()
+    timer = wave_timer
+    while timer > 0:
+        timer = wave_timer - int(time.time() - start_time)
+        if random.random() < 0.02:
+            hp = max(1, hp - random.randint(1, 3))
+        if random.random() < 0.1:
+            material += 1
+        producer.send(GameState(hp, total_hp, material, wave, max(timer, 0)))
+        time.sleep(1 / rate)
+
+    producer.send(GameState(hp, total_hp, material, wave, 0, brotato.WaveResult.COMPLETED))
+
+
+if __name__ == "__main__":
+    import threading
+
+    source = SocketStateSource()
+    producer = StateProducer()
+    thread = threading.Thread(target=simulate_wave, args=(producer, 1, 5), daemon=True)
+    thread.start()
+
+    while thread.is_alive():
+        print(source.read())
+        time.sleep(0.5)
+    print(source.read())
+
+    producer.close()
+    source.close()
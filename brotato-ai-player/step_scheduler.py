@@ -0,0 +1,93 @@
+import time
+
+STAGE_COST_SMOOTHING = 0.2  # 阶段耗时指数滑动平均系数
+STAGE_COST_DECAY = 0.8      # 阶段被跳过时估计耗时乘以该系数，一段时间后重新尝试执行并测量
+MAX_STAGE_SKIPS = 5         # 阶段连续跳过的最大次数，超过后强制执行
+MAX_STAGE_AGE = 1.0         # 阶段距上次执行的最长时间（s），超过后强制执行
+
+class StepScheduler:
+    """Fixed-tick scheduler for env steps.
+
+    Each step gets a deadline of one tick interval. Optional stages ask
+    ``should_run()`` before running and are skipped when their estimated cost
+    does not fit in the remaining budget; ``end()`` sleeps until the deadline.
+    A skipped stage's estimate decays so it is re-measured, and a stage is
+    never skipped more than ``MAX_STAGE_SKIPS`` times in a row or for longer
+    than ``MAX_STAGE_AGE`` seconds.
+    """
+
+    def __init__(self, tick_rate: float):
+        self.tick_rate = tick_rate
+        self.tick_interval = 1.0 / tick_rate
+
+        self.deadline = None
+        self.stage_cost = {}
+        self.stage_skips = {}
+        self.stage_last_run = {}
+        self.skipped_stages = []
+
+        self.missed_deadline = False
+        self.missed_deadline_count = 0
+        self.tick_count = 0
+
+    def reset(self):
+        # 暂停/重置后重新对齐 tick，避免把等待时间算作超时
+        self.deadline = None
+        self.stage_skips.clear()
+        self.stage_last_run.clear()
+
+    def begin(self):
+        now = time.time()
+        if self.deadline is None or now > self.deadline + self.tick_interval:
+            self.deadline = now + self.tick_interval
+        else:
+            self.deadline += self.tick_interval
+
+        self.skipped_stages = []
+        self.missed_deadline = False
+        self.tick_count += 1
+
+    def remaining(self) -> float:
+        if self.deadline is None:
+            return self.tick_interval
+        return self.deadline - time.time()
+
+    # required=True 时总是执行（如波次结束时的倒计时，用于判断场景）
+    def should_run(self, stage: str, required: bool = False) -> bool:
+        # 没有历史耗时的阶段总是执行一次，用于估计耗时
+        cost = self.stage_cost.get(stage)
+        now = time.time()
+        stale = (self.stage_skips.get(stage, 0) >= MAX_STAGE_SKIPS or
+                 now - self.stage_last_run.get(stage, now) > MAX_STAGE_AGE)
+        if not required and not stale and cost is not None and cost > self.remaining():
+            self.stage_cost[stage] = cost * STAGE_COST_DECAY
+            self.stage_skips[stage] = self.stage_skips.get(stage, 0) + 1
+            self.stage_last_run.setdefault(stage, now)
+            self.skipped_stages.append(stage)
+            return False
+
+        self.stage_skips[stage] = 0
+        self.stage_last_run[stage] = now
+        return True
+
+    def record(self, stage: str, elapsed: float):
+        cost = self.stage_cost.get(stage)
+        if cost is None:
+            self.stage_cost[stage] = elapsed
+        else:
+            self.stage_cost[stage] = cost + STAGE_COST_SMOOTHING * (elapsed - cost)
+
+    def end(self):
+        remaining = self.remaining()
+        if remaining > 0:
+            time.sleep(remaining)
+        else:
+            self.missed_deadline = True
+            self.missed_deadline_count += 1
+
+    def info(self) -> dict:
+        return {
+            "missed_deadline": self.missed_deadline,
+            "missed_deadline_count": self.missed_deadline_count,
+            "skipped_stages": list(self.skipped_stages),
+        }
@@ -0,0 +1,137 @@
+import itertools
+import multiprocessing as mp
+import queue
+import time
+
+import numpy as np
+
+import brotato
+from brotato_action import N_DISCRETE_ACTIONS
+from obs_benchmark import load_frames
+from obs_profiles import PROFILES, DEFAULT_PROFILE, ObservationPreprocessor
+from runtime_config import ThreadBudget, available_cores, partition
+
+BENCHMARK_STEPS = 30
+WARMUP_STEPS = 3
+N_ENVS = 1
+RESULT_POLL_INTERVAL = 1.0  # 等待结果时检查环境进程是否异常退出的间隔
+
+# 每个 step 识别的 HUD 区域：HP、倒计时、材料
+STEP_ROIS = [brotato.BOX_HP_XYXY[0], brotato.BOX_TIMER_XYXY[0], brotato.BOX_MATERIAL_XYXY[0]]
+
+
+# 每个引擎的候选线程数：1、一半、全部核心
+def thread_options(n_cores):
+    return sorted({1, max(1, n_cores // 2), n_cores})
+
+
+# 与 train_ppo.py 默认相同的 CnnPolicy，没有 torch 时返回 None（只测分类和 OCR）
+def make_policy():
+    try:
+        import torch
+        import gymnasium as gym
+        from stable_baselines3.common.policies import ActorCriticCnnPolicy
+    except ImportError:
+        return None
+
+    height, width, channels = PROFILES[DEFAULT_PROFILE].shape()
+    observation_space = gym.spaces.Box(0, 255, (channels, height, width), dtype=np.uint8)
+    policy = ActorCriticCnnPolicy(observation_space, gym.spaces.Discrete(N_DISCRETE_ACTIONS), lambda _: 0.0)
+    policy.set_training_mode(False)
+
+    def forward(obs):
+        with torch.no_grad():
+            policy(torch.as_tensor(obs.transpose(2, 0, 1)[np.newaxis]))
+    return forward
+
+
+# 模拟一个环境的 step：场景分类、HUD OCR、观测预处理、策略推理，返回每步耗时（s）
+def run_env(budget, steps, barrier, result_queue):
+    try:
+        import torch    # 先导入，apply() 才会设置 torch 线程数
+    except ImportError:
+        pass
+    # 先绑定核心再创建会话，推理线程继承进程的亲和性
+    budget.apply()
+
+    from perception import LocalPerception
+    perception = LocalPerception(budget=budget)
+    policy = make_policy()
+    preprocessor = ObservationPreprocessor(DEFAULT_PROFILE)
+    frames = load_frames()
+    x, y, w, h = brotato.MAP_AREA_XYWH
+
+    def step(frame):
+        perception.classify(frame)
+        for rx, ry, rx1, ry1 in STEP_ROIS:
+            perception.recognize(frame[ry:ry1, rx:rx1])
+        obs = preprocessor.process(frame[y:y + h, x:x + w])
+        if policy:
+            policy(obs)
+
+    for i in range(WARMUP_STEPS):
+        step(frames[i % len(frames)])
+
+    # 所有环境同时开始计时
+    barrier.wait()
+    elapsed = []
+    for i in range(steps):
+        start = time.perf_counter()
+        step(frames[i % len(frames)])
+        elapsed.append(time.perf_counter() - start)
+    result_queue.put(elapsed)
+
+
+# 每个环境一个进程同时运行，返回 (平均 step 耗时 ms, p95 ms, 总吞吐量 steps/s)
+def measure(budgets, steps=BENCHMARK_STEPS):
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(len(budgets))
+    result_queue = ctx.Queue()
+    processes = [ctx.Process(target=run_env, args=(budget, steps, barrier, result_queue)) for budget in budgets]
+    for process in processes:
+        process.start()
+
+    # 某个进程出错退出时（如模型加载失败）不再等待，其余进程会一直等在 barrier 上，直接结束
+    results = []
+    while len(results) < len(processes):
+        try:
+            results.append(result_queue.get(timeout=RESULT_POLL_INTERVAL))
+        except queue.Empty:
+            failed = [process for process in processes if process.exitcode not in (None, 0)]
+            if failed:
+                for process in processes:
+                    process.terminate()
+                raise RuntimeError(f"benchmark env process exited with code {failed[0].exitcode}") from None
+    for process in processes:
+        process.join()
+
+    elapsed = np.concatenate(results)
+    wall = max(sum(result) for result in results)
+    return elapsed.mean() * 1000, np.percentile(elapsed, 95) * 1000, len(elapsed) / wall
+
+
+def benchmark(n_envs=N_ENVS, cores=None, steps=BENCHMARK_STEPS):
+    cores = cores or available_cores()
+    per_env = max(1, len(cores) // n_envs)
+    options = thread_options(per_env)
+    print(f"cores: {len(cores)}, envs: {n_envs}, cores per env: {per_env}")
+
+    # 基准：各引擎使用默认线程池，不绑定核心
+    configs = [("default", [ThreadBudget() for _ in range(n_envs)])]
+    for classifier_threads, ocr_threads, torch_threads in itertools.product(options, repeat=3):
+        budgets = partition(n_envs, cores, classifier_threads / per_env, ocr_threads / per_env, torch_threads / per_env)
+        configs.append((f"cls {classifier_threads}, ocr {ocr_threads}, torch {torch_threads}", budgets))
+
+    results = []
+    for name, budgets in configs:
+        mean, p95, throughput = measure(budgets, steps)
+        results.append((throughput, name))
+        print(f"{name:>24}: step: {mean:7.2f} ms, p95: {p95:7.2f} ms, throughput: {throughput:6.2f} steps/s")
+
+    throughput, name = max(results)
+    print(f"best: {name}, throughput: {throughput:.2f} steps/s")
+    return name
+
+
+if __name__ == "__main__":
+    benchmark()
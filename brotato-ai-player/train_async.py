@@ -0,0 +1,370 @@
+import multiprocessing as mp
+import queue
+import sys
+import os
+from datetime import datetime
+import time
+
+import numpy as np
+import torch
+
+from stable_baselines3 import PPO
+from stable_baselines3.common.logger import configure
+from stable_baselines3.common.preprocessing import is_image_space, is_image_space_channels_first
+from stable_baselines3.common.vec_env.vec_transpose import VecTransposeImage
+from stable_baselines3.common.utils import safe_mean
+
+from model_paths import MODEL_NAME, MODEL_DIR, LOG_DIR, MODEL_FILE
+from train_ppo import BATCH_SIZE, N_STEPS, N_EPOCHS, TOTAL_TIMESTEPS, MODEL_SAVE_FREQ, TICK_RATE, SCENE_WATCHER, MENU_NAVIGATOR
+from train_ppo import UINT8_ROLLOUT_BUFFER, SPECULATIVE_OCR, GAME_STATE_IPC, MACRO_ACTIONS, THREAD_BUDGET, EPISODE_STORE, HP_BAR
+from train_ppo import REGION_CAPTURE
+from train_ppo import make_policy_kwargs
+from brotato_env import OBS_MODE_IMAGE
+from rollout_buffer import Uint8RolloutBuffer
+from checkpoint import CheckpointWriter
+from runtime_config import ThreadBudget, available_cores, partition
+from ocr_telemetry import record_telemetry
+
+MAX_POLICY_LAG = 2          # rollout 采集时的策略版本落后超过该值时丢弃
+MAX_QUEUED_ROLLOUTS = 2     # 学习进程来不及处理时，actor 丢弃新的 rollout 而不是暂停游戏
+ACTOR_STOP_TIMEOUT = 30
+ROLLOUT_POLL_INTERVAL = 1.0 # 等待 rollout 时检查 actor 是否已退出的间隔
+LEARNER_CORE_SHARE = 0.5    # THREAD_BUDGET=True 时学习进程使用的核心比例，其余核心分给 actor 的环境
+
+
+def is_channel_last_image(observation_space):
+    return is_image_space(observation_space) and not is_image_space_channels_first(observation_space)
+
+
+def to_policy_obs(obs, channel_last):
+    obs = obs.transpose(2, 0, 1) if channel_last else obs
+    return torch.as_tensor(obs[np.newaxis])
+
+
+# 从 actor 接收下一条消息；actor 只在学习进程设置停止信号后退出，等待期间退出（崩溃、游戏窗口关闭等）时抛出异常而不是永久阻塞
+def receive_from_actor(rollout_queue, actor):
+    while True:
+        try:
+            return rollout_queue.get(timeout=ROLLOUT_POLL_INTERVAL)
+        except queue.Empty:
+            if not actor.is_alive():
+                raise RuntimeError(f"actor process exited with code {actor.exitcode}") from None
+
+
+def run_actor(rollout_queue, weights_queue, stop_event, policy_class, policy_kwargs, n_steps, log_path, budget=None):
+    """Actor process: keeps stepping the game with the latest policy snapshot.
+
+    The first message sent to the learner carries the env spaces. Each rollout
+    is tagged with the policy version used to collect it, and stores the
+    behaviour log-probs so the learner can correct for policy lag.
+    """
+    from brotato_env import BrotatoEnv
+    from navigator import MenuNavigator
+    from state_source import SocketStateSource
+    from episode_store import EpisodeStore
+
+    sys.stdout = open(log_path, 'a', encoding='utf-8')
+
+    if budget is not None:
+        budget.apply()
+
+    navigator = MenuNavigator() if MENU_NAVIGATOR else None
+    state_source = SocketStateSource() if GAME_STATE_IPC else None
+    env = BrotatoEnv(tick_rate=TICK_RATE, scene_watcher=SCENE_WATCHER, navigator=navigator,
+                     speculative_ocr=SPECULATIVE_OCR, state_source=state_source, macro_actions=MACRO_ACTIONS,
+                     thread_budget=budget, episode_store=EpisodeStore() if EPISODE_STORE else None, hp_bar=HP_BAR,
+                     region_capture=REGION_CAPTURE)
+    try:
+        env.warmup()
+        rollout_queue.put((env.observation_space, env.action_space))
+
+        channel_last = is_channel_last_image(env.observation_space)
+        policy_space = VecTransposeImage.transpose_space(env.observation_space) if channel_last else env.observation_space
+        policy = policy_class(policy_space, env.action_space, lambda _: 0.0, **policy_kwargs)
+        policy.set_training_mode(False)
+
+        version, state_dict = weights_queue.get()
+        policy.load_state_dict({k: torch.from_numpy(v) for k, v in state_dict.items()})
+
+        obs_buffer = np.zeros((n_steps, *env.observation_space.shape), dtype=env.observation_space.dtype)
+        actions = np.zeros((n_steps,), dtype=np.int64)
+        rewards = np.zeros((n_steps,), dtype=np.float32)
+        episode_starts = np.zeros((n_steps,), dtype=np.float32)
+        values = np.zeros((n_steps,), dtype=np.float32)
+        log_probs = np.zeros((n_steps,), dtype=np.float32)
+
+        dropped_full = 0
+        episode_reward = 0.0
+        episode_length = 0
+
+        obs, info = env.reset()
+        episode_start = True
+        while not stop_event.is_set():
+            # 使用最新发布的权重，不等待
+            latest = None
+            while True:
+                try:
+                    latest = weights_queue.get_nowait()
+                except queue.Empty:
+                    break
+            if latest is not None:
+                version, state_dict = latest
+                policy.load_state_dict({k: torch.from_numpy(v) for k, v in state_dict.items()})
+
+            episode_rewards = []
+            episode_lengths = []
+            rollout_start = time.time()
+            for t in range(n_steps):
+                # 学习进程等待 ACTOR_STOP_TIMEOUT 后会强制结束 actor，每一步都检查停止信号
+                if stop_event.is_set():
+                    break
+
+                with torch.no_grad():
+                    action, value, log_prob = policy(to_policy_obs(obs, channel_last))
+
+                obs_buffer[t] = obs
+                actions[t] = action.item()
+                episode_starts[t] = episode_start
+                values[t] = value.item()
+                log_probs[t] = log_prob.item()
+
+                obs, reward, terminated, truncated, info = env.step(actions[t])
+                rewards[t] = reward
+                episode_reward += reward
+                episode_length += 1
+
+                episode_start = terminated or truncated
+                if episode_start:
+                    episode_rewards.append(episode_reward)
+                    episode_lengths.append(episode_length)
+                    episode_reward = 0.0
+                    episode_length = 0
+                    obs, info = env.reset()
+
+            if stop_event.is_set():
+                # 学习进程已不再接收，未完成的 rollout 直接丢弃
+                break
+
+            with torch.no_grad():
+                last_value = policy.predict_values(to_policy_obs(obs, channel_last)).item()
+
+            rollout = {
+                "version": version,
+                "obs": obs_buffer.copy(),
+                "actions": actions.copy(),
+                "rewards": rewards.copy(),
+                "episode_starts": episode_starts.copy(),
+                "values": values.copy(),
+                "log_probs": log_probs.copy(),
+                "last_value": last_value,
+                "last_done": episode_start,
+                "episode_rewards": episode_rewards,
+                "episode_lengths": episode_lengths,
+                "steps_per_sec": n_steps / (time.time() - rollout_start),
+                "dropped_full": dropped_full,
+                "ocr": env.ocr_telemetry.summary(),
+                "ocr_conf": env.ocr_telemetry.histograms(),
+            }
+            try:
+                rollout_queue.put_nowait(rollout)
+            except queue.Full:
+                dropped_full += 1
+                print(f"rollout queue full, dropped: {dropped_full}")
+    finally:
+        env.close()
+
+
+def publish_weights(weights_queue, version, policy):
+    state_dict = {k: v.detach().cpu().numpy() for k, v in policy.state_dict().items()}
+
+    # 只保留最新的权重
+    try:
+        weights_queue.get_nowait()
+    except queue.Empty:
+        pass
+    weights_queue.put((version, state_dict))
+
+
+def load_model(device):
+    print(f'load: {MODEL_FILE}')
+    custom_objects = {
+        'learning_rate': 3e-5,
+        'device': device,
+        'rollout_buffer_class': Uint8RolloutBuffer if UINT8_ROLLOUT_BUFFER else None,
+    }
+    model = PPO.load(MODEL_FILE, env=None, custom_objects=custom_objects)
+    model.ent_coef = 0.1
+    return model
+
+
+def create_model(observation_space, action_space, device):
+    print(f'new ppo')
+    model = PPO("CnnPolicy",
+                env=None,
+
+                learning_rate = 3e-4,
+
+                ent_coef = 0.1,
+                vf_coef = 0.5,
+                gamma = 0.99,
+                gae_lambda = 0.95,
+
+                clip_range = 0.3,
+
+                batch_size = BATCH_SIZE,
+                n_steps = N_STEPS,
+                n_epochs = N_EPOCHS,
+                rollout_buffer_class = Uint8RolloutBuffer if UINT8_ROLLOUT_BUFFER else None,
+                policy_kwargs = make_policy_kwargs(OBS_MODE_IMAGE),
+
+                device = device,
+                verbose = 1,
+                _init_setup_model = False,
+            )
+
+    # 学习进程不运行游戏，空间由 actor 提供
+    if is_channel_last_image(observation_space):
+        observation_space = VecTransposeImage.transpose_space(observation_space)
+    model.observation_space = observation_space
+    model.action_space = action_space
+    model.n_envs = 1
+    model._setup_model()
+    return model
+
+
+def fill_rollout_buffer(model, rollout):
+    buffer = model.rollout_buffer
+    buffer.reset()
+
+    obs = rollout["obs"]
+    if obs.shape[1:] != model.observation_space.shape:
+        obs = obs.transpose(0, 3, 1, 2)
+
+    for t in range(len(obs)):
+        buffer.add(obs[t][np.newaxis],
+                   rollout["actions"][t:t + 1],
+                   rollout["rewards"][t:t + 1],
+                   rollout["episode_starts"][t:t + 1],
+                   torch.as_tensor(rollout["values"][t:t + 1]),
+                   torch.as_tensor(rollout["log_probs"][t:t + 1]))
+
+    buffer.compute_returns_and_advantage(last_values=torch.as_tensor([rollout["last_value"]]),
+                                         dones=np.array([rollout["last_done"]]))
+
+
+def train_async(total_timesteps=TOTAL_TIMESTEPS):
+    """Asynchronous actor-learner PPO: the game keeps running during updates.
+
+    The actor process collects rollouts with the latest published weights
+    while this (learner) process optimises on the previous rollout. Policy lag
+    is bounded by ``MAX_POLICY_LAG``; within that bound the PPO ratio is taken
+    against the actor's behaviour log-probs, so the clipped objective acts as
+    the importance correction.
+    """
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    os.makedirs(LOG_DIR, exist_ok=True)
+    log_path = os.path.join(LOG_DIR, f"{MODEL_NAME}-async-{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    # actor 与学习进程同时运行，核心分为两部分
+    actor_budget = None
+    if THREAD_BUDGET:
+        cores = available_cores()
+        n_learner = max(1, int(len(cores) * LEARNER_CORE_SHARE))
+        learner_budget = ThreadBudget(cores[:n_learner], torch_threads=n_learner)
+        learner_budget.apply()
+        actor_budget = partition(1, cores[n_learner:] or cores)[0]
+        print(f"thread budget: learner: {learner_budget}, actor: {actor_budget}")
+
+    ctx = mp.get_context("spawn")
+    rollout_queue = ctx.Queue(maxsize=MAX_QUEUED_ROLLOUTS)
+    weights_queue = ctx.Queue(maxsize=1)
+    stop_event = ctx.Event()
+
+    # actor 需要与学习进程一致的策略结构；新建模型时由 actor 创建环境后提供空间
+    model = None
+    if os.path.exists(MODEL_FILE):
+        model = load_model(device)
+        policy_class, policy_kwargs, n_steps = model.policy_class, model.policy_kwargs, model.n_steps
+    else:
+        from stable_baselines3.common.policies import ActorCriticCnnPolicy
+        policy_class, policy_kwargs, n_steps = ActorCriticCnnPolicy, make_policy_kwargs(OBS_MODE_IMAGE), N_STEPS
+
+    actor = ctx.Process(target=run_actor,
+                        args=(rollout_queue, weights_queue, stop_event, policy_class, policy_kwargs, n_steps, log_path, actor_budget),
+                        daemon=True)
+    actor.start()
+
+    observation_space, action_space = receive_from_actor(rollout_queue, actor)
+    if model is None:
+        model = create_model(observation_space, action_space, device)
+    model.set_logger(configure(os.path.join(LOG_DIR, f"{MODEL_NAME}-async"), ["stdout", "tensorboard"]))
+
+    print(f'start: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}, device: {device}')
+
+    checkpoint_writer = CheckpointWriter(MODEL_DIR, MODEL_NAME)
+
+    version = 0
+    publish_weights(weights_queue, version, model.policy)
+
+    try:
+        dropped_stale = 0
+        episode_rewards = []
+        episode_lengths = []
+        next_save = model.num_timesteps + MODEL_SAVE_FREQ
+        start_timesteps = model.num_timesteps
+        while model.num_timesteps < start_timesteps + total_timesteps:
+            wait_start = time.time()
+            rollout = receive_from_actor(rollout_queue, actor)
+            wait_elapsed = time.time() - wait_start
+
+            episode_rewards = (episode_rewards + rollout["episode_rewards"])[-100:]
+            episode_lengths = (episode_lengths + rollout["episode_lengths"])[-100:]
+
+            policy_lag = version - rollout["version"]
+            if policy_lag > MAX_POLICY_LAG:
+                dropped_stale += 1
+                print(f"drop stale rollout, lag: {policy_lag}, dropped: {dropped_stale}")
+                continue
+
+            train_start = time.time()
+            fill_rollout_buffer(model, rollout)
+            model._current_progress_remaining = 1.0 - (model.num_timesteps - start_timesteps) / total_timesteps
+            model.train()
+            train_elapsed = time.time() - train_start
+
+            version += 1
+            model.num_timesteps += len(rollout["actions"])
+            publish_weights(weights_queue, version, model.policy)
+
+            model.logger.record("rollout/ep_rew_mean", safe_mean(episode_rewards))
+            model.logger.record("rollout/ep_len_mean", safe_mean(episode_lengths))
+            model.logger.record("async/policy_version", version)
+            model.logger.record("async/policy_lag", policy_lag)
+            model.logger.record("async/dropped_stale", dropped_stale)
+            model.logger.record("async/dropped_full", rollout["dropped_full"])
+            model.logger.record("async/actor_steps_per_sec", rollout["steps_per_sec"])
+            model.logger.record("async/learner_wait", wait_elapsed)
+            model.logger.record("async/learner_train", train_elapsed)
+            record_telemetry(model.logger, rollout["ocr"], rollout["ocr_conf"])
+            model.logger.dump(step=model.num_timesteps)
+
+            if model.num_timesteps >= next_save:
+                checkpoint_writer.submit_checkpoint(model, safe_mean(episode_rewards) if episode_rewards else None)
+                next_save += MODEL_SAVE_FREQ
+
+        print(f'end: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}')
+
+        checkpoint_writer.submit(model, MODEL_FILE)
+    finally:
+        # actor 在当前这一步结束后丢弃未完成的 rollout，关闭环境（写入缓存的回合记录）并退出；Ctrl+C 时同样处理
+        stop_event.set()
+        actor.join(timeout=ACTOR_STOP_TIMEOUT)
+        if actor.is_alive():
+            actor.terminate()
+
+        checkpoint_writer.close()
+
+if __name__ == "__main__":
+    train_async()
@@ -7,16 +7,22 @@ import torch
 
 from stable_baselines3 import PPO
 from stable_baselines3.common.env_checker import check_env
-from stable_baselines3.common.callbacks import CallbackList, BaseCallback, CheckpointCallback
+from stable_baselines3.common.callbacks import CallbackList, BaseCallback
 from stable_baselines3.common.torch_layers import BaseFeaturesExtractor
 
-from brotato_env import BrotatoEnv
-
-MODEL_NAME = "ppo_brotato"
-MODEL_DIR = "models"
-LOG_DIR = "logs"
-
-MODEL_FILE = os.path.join(MODEL_DIR, MODEL_NAME + '.zip')
+from model_paths import MODEL_NAME, MODEL_DIR, LOG_DIR, MODEL_FILE
+from brotato_env import BrotatoEnv, OBS_MODE_IMAGE, OBS_MODE_FEATURES, OBS_MODE_FEATURES_IMAGE
+from rollout_buffer import Uint8RolloutBuffer
+from obs_profiles import DEFAULT_PROFILE
+from checkpoint import CheckpointWriter, AsyncCheckpointCallback
+from ocr_telemetry import record_telemetry
+from perception import PerceptionServer
+from frame_ring import CaptureProcess
+from navigator import MenuNavigator
+from state_source import SocketStateSource
+from runtime_config import partition
+from episode_store import EpisodeStore
+from light_cnn import LightCnn
 
 BATCH_SIZE = 256
 N_STEPS = 2048
@@ -27,6 +33,31 @@ ONE_HOUR_STEPS = N_STEPS * 12
 TOTAL_TIMESTEPS = ONE_HOUR_STEPS * 6
 MODEL_SAVE_FREQ = ONE_HOUR_STEPS
 
+TICK_RATE = None    # 10, 固定决策频率（Hz），None 时不限制
+PERCEPTION_SERVER = False   # True 时图像分类和 OCR 运行在独立的感知服务进程中，多个环境共享
+CAPTURE_PROCESS = False     # True 时由独立的捕获进程按固定频率采集画面，环境直接读取最新帧
+SCENE_WATCHER = False       # True 时后台监测画面变化，reset 和暂停时场景切换后立即继续
+MENU_NAVIGATOR = False      # True 时自动处理波次之间的商店、升级、物品及新的一局等界面，无人值守训练
+NATIVE_HUD = False          # True 时按原生分辨率截取 HUD，首次使用某分辨率时自动校准布局并缓存
+REGION_CAPTURE = False      # True 时画面在抓取时缩放到 960x540（StretchBlt），不复制原生分辨率的整个客户区（NATIVE_HUD 时不使用）
+OBS_MODE = OBS_MODE_IMAGE   # OBS_MODE_FEATURES 时使用物体特征向量作为观测，策略网络更小，CPU 上训练更快
+OBS_PROFILE = DEFAULT_PROFILE  # 图像观测格式：rgb-1/4, gray-1/4, gray-1/8, edge-1/4, diff-1/4，可用 obs_benchmark.py 比较
+UINT8_ROLLOUT_BUFFER = True # True 时图像观测在 rollout buffer 中以 uint8 保存，内存为默认 float32 的 1/4
+SPECULATIVE_OCR = False     # True 时场景分类与 HP、倒计时、材料的 OCR 并行执行，非波次场景时丢弃 OCR 结果（多核时降低 step 延迟）
+GAME_STATE_IPC = False      # True 时从游戏 mod 通过本地 UDP 发送的状态读取 HP、材料、倒计时等数值，通道不可用时回退到 OCR
+THREAD_BUDGET = False       # True 时按核心数统一设置分类、OCR 和 torch 的线程数并绑定核心，避免各自的线程池相互争抢（见 thread_benchmark.py）
+EPISODE_STORE = True        # True 时每回合的结果写入 logs/episodes 列式存储，可用 episode_store.py 统计
+HP_BAR = False              # True 时由血条填充比例计算 HP，只在填充增加等与已知 total_hp 不一致时 OCR
+MACRO_ACTIONS = False       # True 时使用 8 方向加停止、多种按住时长的扩展动作空间（与已有的 4 动作模型不兼容，需重新训练）
+LIGHT_CNN = False           # True 时新建的图像观测模型使用 light_cnn.LightCnn 特征提取（深度可分离卷积，CPU 上更新更快，见 extractor_benchmark.py），加载的模型保持原结构
+SPATIAL_SOFTMAX = False     # LIGHT_CNN 时使用空间 softmax 输出（各通道响应最大位置的坐标）代替展开的特征图
+
+POLICY_TYPES = {
+    OBS_MODE_IMAGE: "CnnPolicy",
+    OBS_MODE_FEATURES: "MlpPolicy",
+    OBS_MODE_FEATURES_IMAGE: "MultiInputPolicy",
+}
+
 
 class CustomCallback(BaseCallback):
     """
@@ -98,6 +129,10 @@ class CustomCallback(BaseCallback):
         """
         This event is triggered before updating the policy.
         """
+        # OCR 统计随本轮训练日志写入 TensorBoard
+        telemetry = self.custom_env.ocr_telemetry
+        record_telemetry(self.logger, telemetry.summary(), telemetry.histograms())
+
         if not self.paused:
             self.custom_env.pause()
             self.paused = True
@@ -109,16 +144,64 @@ class CustomCallback(BaseCallback):
         """
         print("training end")
 
+# 新建模型时的策略网络参数
+def make_policy_kwargs(obs_mode=OBS_MODE):
+    if LIGHT_CNN and obs_mode == OBS_MODE_IMAGE:
+        return dict(features_extractor_class=LightCnn, features_extractor_kwargs=dict(spatial_softmax=SPATIAL_SOFTMAX))
+    return {}
+
 def train():
     os.makedirs(MODEL_DIR, exist_ok=True)
     os.makedirs(LOG_DIR, exist_ok=True)
     log_path = os.path.join(LOG_DIR, f"{MODEL_NAME}-{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
 
-    env = BrotatoEnv()
+    # 推测执行 OCR 时分类和 OCR 并行，各使用一半线程
+    budget = None
+    if THREAD_BUDGET:
+        share = 0.5 if SPECULATIVE_OCR else 1.0
+        budget = partition(1, classifier_share=share, ocr_share=share)[0]
+        budget.apply()
+        print(f"thread budget: {budget}")
+
+    perception_server = None
+    perception = None
+    if PERCEPTION_SERVER:
+        perception_server = PerceptionServer(n_clients=1, budget=budget)
+        perception_server.start()
+        perception = perception_server.client(0)
+
+    capture_process = None
+    frame_ring = None
+    if CAPTURE_PROCESS:
+        capture_process = CaptureProcess()
+        capture_process.start()
+        frame_ring = capture_process.reader()
+
+    navigator = MenuNavigator() if MENU_NAVIGATOR else None
+
+    env = BrotatoEnv(tick_rate=TICK_RATE,
+                     perception=perception,
+                     frame_ring=frame_ring,
+                     scene_watcher=SCENE_WATCHER,
+                     navigator=navigator,
+                     native_hud=NATIVE_HUD,
+                     obs_mode=OBS_MODE,
+                     obs_profile=OBS_PROFILE,
+                     speculative_ocr=SPECULATIVE_OCR,
+                     state_source=SocketStateSource() if GAME_STATE_IPC else None,
+                     macro_actions=MACRO_ACTIONS,
+                     thread_budget=budget,
+                     episode_store=EpisodeStore() if EPISODE_STORE else None,
+                     hp_bar=HP_BAR,
+                     region_capture=REGION_CAPTURE)
     # check_env(env)
+    env.warmup()
 
     device = "cuda" if torch.cuda.is_available() else "cpu"
 
+    # 特征向量和 Dict 观测使用 SB3 默认的 buffer
+    rollout_buffer_class = Uint8RolloutBuffer if UINT8_ROLLOUT_BUFFER and OBS_MODE == OBS_MODE_IMAGE else None
+
     model = None
     if os.path.exists(MODEL_FILE):
         print(f'load: {MODEL_FILE}')
@@ -132,6 +215,7 @@ def train():
             # 'clip_range': clip_range,
 
             'device': device,
+            'rollout_buffer_class': rollout_buffer_class,
         }
         model = PPO.load(MODEL_FILE, env, custom_objects=custom_objects)
         model.ent_coef = 0.1
@@ -140,7 +224,7 @@ def train():
     else:
         print(f'new ppo')
 
-        model = PPO("CnnPolicy",
+        model = PPO(POLICY_TYPES[OBS_MODE],
                     env,
 
                     learning_rate = 3e-4,   # 1e-4,   #
@@ -155,15 +239,17 @@ def train():
                     batch_size = BATCH_SIZE,   # 64,
                     n_steps = N_STEPS,   # 2048
                     n_epochs = N_EPOCHS,  # 10,
+                    rollout_buffer_class = rollout_buffer_class,
+                    policy_kwargs = make_policy_kwargs(),
 
                     device = device,
                     verbose = 1,
                     tensorboard_log = LOG_DIR,
                 )
 
-    checkpoint_callback = CheckpointCallback(save_freq=MODEL_SAVE_FREQ,
-                                             save_path=MODEL_DIR,
-                                             name_prefix=MODEL_NAME)
+    # checkpoint 在后台线程写入，只保留最近的和平均回报最高的
+    checkpoint_writer = CheckpointWriter(MODEL_DIR, MODEL_NAME)
+    checkpoint_callback = AsyncCheckpointCallback(MODEL_SAVE_FREQ, checkpoint_writer)
     custom_callback = CustomCallback()
 
     # Create the callback list
@@ -172,16 +258,27 @@ def train():
     print(f'start: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}')
 
     original_stdout = sys.stdout
-    with open(log_path, 'a', encoding='utf-8') as f:
-        sys.stdout = f
-        model.learn(total_timesteps=TOTAL_TIMESTEPS, callback=callback, progress_bar=False)
-    sys.stdout = original_stdout
-
-    print(f'end: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}')
-
-    model.save(MODEL_FILE)
-
-    env.close()
+    try:
+        with open(log_path, 'a', encoding='utf-8') as f:
+            sys.stdout = f
+            # 继续训练时累计步数，checkpoint 文件名不与之前的训练重复
+            model.learn(total_timesteps=TOTAL_TIMESTEPS, callback=callback, reset_num_timesteps=False, progress_bar=False)
+        sys.stdout = original_stdout
+
+        print(f'end: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}')
+
+        checkpoint_writer.submit(model, MODEL_FILE)
+    finally:
+        # Ctrl+C 或异常退出时也关闭环境（写入缓存的回合记录、释放按键）并停止子进程
+        sys.stdout = original_stdout
+        env.close()
+
+        if perception_server:
+            perception_server.stop()
+        if capture_process:
+            capture_process.stop()
+
+        checkpoint_writer.close()
 
 if __name__ == "__main__":
     train()
@@ -44,6 +44,21 @@ class Window():
     def get_screen_scale(self):
         return self.screen_scale
 
+    # 返回画面（客户区按宽高比裁剪后）的 (width, height)，窗口不可用时返回 None
+    def get_image_size(self):
+        if not self.hwnd:
+            self.hwnd = get_window_handle(self.window_name)
+            if not self.hwnd:
+                return None
+
+        try:
+            rect = self.__calc_image_rect()
+        except Exception as e:
+            print(e)
+            self.reset()
+            return None
+        return rect[2], rect[3]
+
     def __calc_image_rect(self):
         if not self.hwnd:
             return None
@@ -78,8 +93,9 @@ class Window():
 
         return width, height, left_off, top_off
 
-    # 返回 BGRA numpy 数组
-    def grab(self):
+    # 返回 BGRA numpy 数组，rect 为画面坐标中的 (x, y, w, h) 时只复制该区域
+    # size 为 (width, height) 时在复制的同时缩放到该尺寸（StretchBlt），只传输缩放后的像素
+    def grab(self, rect=None, size=None):
         if not self.hwnd:
             self.hwnd = get_window_handle(self.window_name)
             if not self.hwnd:
@@ -107,25 +123,42 @@ class Window():
             width, height, left_off, top_off = self.___handle_scale(image_width, image_height, left_off, top_off)
             # print(f"size and off: {width, height, left_off, top_off}")
 
+            if rect is not None:
+                x, y, w, h = rect
+                x, y = min(max(x, 0), width), min(max(y, 0), height)
+                w, h = min(w, width - x), min(h, height - y)
+                if w <= 0 or h <= 0:
+                    return None
+                left_off += x
+                top_off += y
+                width, height = w, h
+
             # 创建一个设备上下文
             hwnd_dc = win32gui.GetWindowDC(hwnd)
             mfc_dc = win32ui.CreateDCFromHandle(hwnd_dc)
             save_dc = mfc_dc.CreateCompatibleDC()
 
+            out_width, out_height = size if size is not None else (width, height)
+
             # 创建一个位图对象
             bmp = win32ui.CreateBitmap()
-            bmp.CreateCompatibleBitmap(mfc_dc, width, height)
+            bmp.CreateCompatibleBitmap(mfc_dc, out_width, out_height)
             save_dc.SelectObject(bmp)
 
             # 将窗口内容复制到位图中
-            save_dc.BitBlt((0, 0), (width, height), mfc_dc, (left_off, top_off), win32con.SRCCOPY)   # 采集的图像有偏移，不确定是不是窗口边框有影响
+            if size is None:
+                save_dc.BitBlt((0, 0), (width, height), mfc_dc, (left_off, top_off), win32con.SRCCOPY)   # 采集的图像有偏移，不确定是不是窗口边框有影响
+            else:
+                # HALFTONE 模式按区域平均缩小，与 cv2.INTER_AREA 相近
+                win32gui.SetStretchBltMode(save_dc.GetSafeHdc(), win32con.HALFTONE)
+                save_dc.StretchBlt((0, 0), (out_width, out_height), mfc_dc, (left_off, top_off), (width, height), win32con.SRCCOPY)
 
             # 获取位图数据并转换为PIL图像
             bmp_bits = bmp.GetBitmapBits(True)
 
             # 将位图数据转换为 NumPy 数组
             bmp_array = np.frombuffer(bmp_bits, dtype='uint8')
-            bmp_array.shape = (height, width, 4)  # 4 表示 BGRA
+            bmp_array.shape = (out_height, out_width, 4)  # 4 表示 BGRA
 
             # 清理资源
             save_dc.DeleteDC()